@@ -0,0 +1,187 @@
+""" Times the replication and terraform generation against fake accounts of growing size.
+
+    python benchmarks/bench_transcribe.py --scales 1 10 100 --latency 0.05 --json bench.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+import fake_snowflake
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+
+CONFIG = """[snowflake_source_account]
+user = bench
+password = bench
+account = {source}
+warehouse = BENCH_WH
+
+[snowflake_target_account]
+user = bench
+password = bench
+account = {target}
+warehouse = BENCH_WH
+"""
+
+
+
+def bench_copy_account(config_file, target, **options):
+    from transcribe import transcribe_snowflake_account
+
+    sf_transcribe = transcribe_snowflake_account(config_file, conn_type_source = 'password',
+                                                 conn_type_target = 'password', return_sql = False, **options)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sf_transcribe.copy_account()
+        sf_transcribe.close_connections()
+    seconds = time.perf_counter() - start
+
+    report = sf_transcribe.metrics.report()
+    copied_rows = sum(copy['rows'] for copy in report['table_copies'])
+    return {'seconds': seconds,
+            'phases': {name: phase['seconds'] for name, phase in report['phases'].items()},
+            'statements': sum(s['count'] for s in report['statements'].values()),
+            'errors': sum(s['errors'] for s in report['statements'].values()),
+            'target_requests': target.requests,
+            'copied_rows': copied_rows,
+            'copy_errors': sum(copy['error'] is not None for copy in report['table_copies']),
+            'execution': report['execution'],
+            'target_throttled': target.throttled,
+            'target_transient_errors': target.transient_errors,
+            'statements_per_second': target.statements / seconds if seconds else 0.0}
+
+
+def bench_terraform(config_file, directory):
+    from terraform_transcribe import terraform_transcribe
+
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        tf_transcribe = terraform_transcribe(config_file, config_name = 'snowflake_source_account')
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            tf_transcribe.generate_files()
+            tf_transcribe.close_conn()
+        seconds = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+               if name.endswith('.tf') or name.endswith('.tf.json'))
+
+    return {'seconds': seconds, 'bytes': size, 'resource_types': dict(tf_transcribe.extract_seconds)}
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type = int, nargs = '+', default = [1, 10, 100])
+    parser.add_argument('--latency', type = float, default = 0.05, help = 'seconds per request')
+    parser.add_argument('--statement-latency', type = float, default = 0.002,
+                        help = 'seconds per statement of a multi-statement request')
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = 'share of statements that fail')
+    parser.add_argument('--transient-error-rate', type = float, default = 0.0,
+                        help = 'share of requests that fail with a connection reset')
+    parser.add_argument('--concurrency-limit', type = int, default = None,
+                        help = 'requests running on the target at the same time above which requests are throttled')
+    parser.add_argument('--max-in-flight', type = int, default = 64)
+    parser.add_argument('--max-retries', type = int, default = 5)
+    parser.add_argument('--max-workers', type = int, default = 4)
+    parser.add_argument('--batch-size', type = int, default = 50)
+    parser.add_argument('--async-grants', action = 'store_true')
+    parser.add_argument('--rows-per-table', type = int, default = 0,
+                        help = 'rows in every source table, copied when it is more than 0')
+    parser.add_argument('--copy-workers', type = int, default = 4)
+    parser.add_argument('--metadata-backend', choices = ['account_usage', 'show'], default = 'account_usage')
+    parser.add_argument('--skip-terraform', action = 'store_true')
+    parser.add_argument('--json', help = 'write the results to this file')
+    args = parser.parse_args()
+
+    accounts = {}
+    for scale in args.scales:
+        accounts[scale] = (fake_snowflake.fake_account(f"bench_source_{scale}x", scale, args.latency,
+                                                       args.statement_latency,
+                                                       rows_per_table = args.rows_per_table),
+                           fake_snowflake.fake_account(f"bench_target_{scale}x", 0, args.latency,
+                                                       args.statement_latency, args.error_rate,
+                                                       transient_error_rate = args.transient_error_rate,
+                                                       concurrency_limit = args.concurrency_limit))
+
+    # pandas warns about every DBAPI connection that isn't sqlalchemy / sqlite
+    warnings.filterwarnings('ignore', message = 'pandas only supports SQLAlchemy')
+
+    # the fake connector has to be in place before the replication modules import it
+    fake_snowflake.install(*[account for pair in accounts.values() for account in pair])
+    sys.path[:0] = [os.path.join(root, 'snowflake'), os.path.join(root, 'terraform')]
+
+    results = []
+    for scale, (source, target) in accounts.items():
+        with tempfile.TemporaryDirectory() as directory:
+            config_file = os.path.join(directory, 'bench.config')
+            with open(config_file, 'w') as f:
+                f.write(CONFIG.format(source = source.name, target = target.name))
+
+            result = {'scale': scale, 'databases': len(source.databases), 'tables': len(source.tables()),
+                      'roles': len(source.roles), 'users': len(source.users),
+                      'grants': sum(len(rows) for rows in source.grants().values())}
+
+            result['copy_account'] = bench_copy_account(config_file, target, max_workers = args.max_workers,
+                                                        batch_size = args.batch_size,
+                                                        async_grants = args.async_grants,
+                                                        copy_data = args.rows_per_table > 0,
+                                                        copy_workers = args.copy_workers,
+                                                        max_in_flight = args.max_in_flight,
+                                                        max_retries = args.max_retries,
+                                                        metadata_backend = args.metadata_backend)
+
+            if not args.skip_terraform:
+                terraform_directory = os.path.join(directory, 'terraform')
+                os.mkdir(terraform_directory)
+                result['terraform'] = bench_terraform(config_file, terraform_directory)
+
+        results.append(result)
+        print_result(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'latency': args.latency, 'statement_latency': args.statement_latency,
+                       'results': results}, f, indent = 2)
+
+
+
+def print_result(result):
+    copy = result['copy_account']
+    print(f"{result['scale']}x: {result['databases']} databases, {result['tables']} tables, "
+          f"{result['roles']} roles, {result['users']} users, {result['grants']} grants")
+    print(f"  copy_account {copy['seconds']:>10.2f}s  {copy['statements']} statements "
+          f"({copy['errors']} errors) in {copy['target_requests']} requests, "
+          f"{copy['statements_per_second']:.0f} statements/s")
+    execution = copy['execution']
+    if execution.get('retries'):
+        print(f"  retries {execution['retries']} ({copy['target_throttled']} throttled, "
+              f"{copy['target_transient_errors']} transient errors, {execution['given_up']} given up), "
+              f"limit of requests in flight: lowest {execution['min_window']}, at the end {execution['window']}")
+    if copy['copied_rows']:
+        print(f"  table data {copy['copied_rows']} rows ({copy['copy_errors']} tables failed)")
+    for name, seconds in copy['phases'].items():
+        print(f"    {name:<24}{seconds:>10.2f}s")
+    if 'terraform' in result:
+        print(f"  generate_files {result['terraform']['seconds']:>8.2f}s  {result['terraform']['bytes']} bytes")
+        for name, seconds in result['terraform']['resource_types'].items():
+            print(f"    {name:<24}{seconds:>10.2f}s")
+
+
+
+if __name__ == "__main__":
+    main()
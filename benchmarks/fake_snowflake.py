@@ -0,0 +1,648 @@
+import random
+import re
+import sys
+import threading
+import time
+import types
+import uuid
+
+
+
+class ProgrammingError(Exception):
+    """ Same attributes as snowflake.connector.errors.ProgrammingError """
+
+    def __init__(self, msg, errno = 2003, sqlstate = '02000', sfqid = None):
+        super().__init__(msg)
+        self.msg = msg
+        self.errno = errno
+        self.sqlstate = sqlstate
+        self.sfqid = sfqid
+
+
+
+DEFAULT_ROLES = ['ACCOUNTADMIN', 'SECURITYADMIN', 'SYSADMIN', 'USERADMIN', 'ORGADMIN', 'PUBLIC']
+
+
+class fake_account:
+    """
+    A synthetic snowflake account served by fake_connection. Object counts grow with scale,
+    every database has the same shape so get_ddl costs the same at every scale.
+    Where clauses aren't evaluated: the account_usage views only hold the rows the
+    replication queries ask for
+
+    Attributes:
+        name : str
+            the account identifier, matched against the account in the config file
+        scale : int
+            multiplies the number of databases, roles, users and warehouses. 0 is an empty account
+        latency : float
+            seconds added to every request (round trip + compile time)
+        statement_latency : float
+            seconds added per statement of a multi-statement request
+        error_rate : float
+            share of executed ddl / grant statements that fail with a ProgrammingError,
+            the same statements fail on every run
+        schemas_per_database, tables_per_schema, sequences_per_schema : int
+            shape of each database
+        transient_error_rate : float
+            share of requests that fail with a connection reset, a retry usually succeeds
+        concurrency_limit : int
+            requests running at the same time above which requests are rejected as throttled. None is unlimited
+        rows_per_table : int
+            rows returned by select * on every table. Rows loaded with write_pandas are
+            only counted, per table
+        row_latency : float
+            seconds added per row read from or loaded into a table
+        keep_statements : bool
+            if true the ddl / grant statements that succeed are kept in executed, in order (for tests)
+
+    """
+
+    def __init__(self, name, scale = 1, latency = 0.05, statement_latency = 0.002, error_rate = 0.0,
+                 schemas_per_database = 4, tables_per_schema = 10, rows_per_table = 0, row_latency = 0.000001,
+                 transient_error_rate = 0.0, concurrency_limit = None, keep_statements = False,
+                 sequences_per_schema = 0):
+        self.name = name
+        self.scale = scale
+        self.latency = latency
+        self.statement_latency = statement_latency
+        self.error_rate = error_rate
+        self.schemas_per_database = schemas_per_database
+        self.tables_per_schema = tables_per_schema
+        self.sequences_per_schema = sequences_per_schema
+        self.rows_per_table = rows_per_table
+        self.transient_error_rate = transient_error_rate
+        self.concurrency_limit = concurrency_limit
+        self.in_flight = 0
+        self.throttled = 0
+        self.transient_errors = 0
+        self.row_latency = row_latency
+        self.loaded_rows = {}
+        self.keep_statements = keep_statements
+        self.executed = []
+
+        self.databases = [f"DB_{i:04d}" for i in range(4 * scale)]
+        self.roles = [f"ROLE_{i:05d}" for i in range(25 * scale)]
+        self.users = [f"USER_{i:06d}" for i in range(50 * scale)]
+        self.warehouses = [f"WH_{i:03d}" for i in range(4 * scale)]
+
+        self.requests = 0
+        self.statements = 0
+        self._lock = threading.Lock()
+        self._queries = {}
+        self._results = {}
+        self._tables = None
+        self._grants = None
+
+
+    def tables(self):
+        """ (database, schema, table) of every table """
+
+        if self._tables is None:
+            self._tables = [(database, f"SCHEMA_{s:02d}", f"TABLE_{t:03d}") for database in self.databases
+                            for s in range(self.schemas_per_database) for t in range(self.tables_per_schema)]
+        return self._tables
+
+
+    def _role(self, i):
+        return self.roles[i % len(self.roles)]
+
+
+    def grants(self):
+        """ Rows of the account_usage grant views, built once """
+
+        if self._grants is not None:
+            return self._grants
+
+        user_grants = [(self._role(i), user) for i, user in enumerate(self.users)]
+        user_grants += [(self._role(i + 7), user) for i, user in enumerate(self.users)]
+
+        # a tree of roles, every role is granted to its parent
+        role_grants = [(role, self.roles[(i - 1) // 3]) for i, role in enumerate(self.roles) if i > 0]
+
+        object_grants = []
+        for i, database in enumerate(self.databases):
+            object_grants += [('OWNERSHIP', 'DATABASE', database, None, None, self._role(i), True),
+                              ('USAGE', 'DATABASE', database, None, None, self._role(i + 1), False),
+                              ('MONITOR', 'DATABASE', database, None, None, self._role(i + 1), False)]
+            for s in range(self.schemas_per_database):
+                schema = f"SCHEMA_{s:02d}"
+                object_grants += [('CREATE TABLE', 'SCHEMA', schema, schema, database, self._role(i), False),
+                                  ('USAGE', 'SCHEMA', schema, schema, database, self._role(i), False),
+                                  ('USAGE', 'SCHEMA', schema, schema, database, self._role(i + 1), False)]
+        for i, (database, schema, table) in enumerate(self.tables()):
+            object_grants += [(privilege, 'TABLE', table, schema, database, self._role(i), False)
+                              for privilege in ('DELETE', 'INSERT', 'SELECT', 'UPDATE')]
+            object_grants += [('SELECT', 'TABLE', table, schema, database, self._role(i + 3), i % 10 == 0)]
+        for i, warehouse in enumerate(self.warehouses):
+            object_grants += [('OPERATE', 'WAREHOUSE', warehouse, None, None, self._role(i), False),
+                              ('USAGE', 'WAREHOUSE', warehouse, None, None, self._role(i), False)]
+
+        self._grants = {'users': user_grants if self.roles else [],
+                        'roles': role_grants,
+                        'objects': object_grants if self.roles else []}
+        return self._grants
+
+
+    def schemas(self):
+        return [f"SCHEMA_{s:02d}" for s in range(self.schemas_per_database)]
+
+
+    def objects(self):
+        """ (name, kind) of the tables and views of every schema """
+
+        return [(f"TABLE_{t:03d}", 'TABLE') for t in range(self.tables_per_schema)] + [('V_TABLE_000', 'VIEW')]
+
+
+    def sequences(self):
+        """ Names of the sequences of every schema, show objects doesn't list them """
+
+        return [f"SEQ_{q:03d}" for q in range(self.sequences_per_schema)]
+
+
+    def object_ddl(self, database, schema, name, qualified = True):
+        # get_ddl of a single object returns its bare name
+        full_name = f"{database}.{schema}.{name}" if qualified else name
+        if name.startswith('SEQ_'):
+            return f"create or replace sequence {full_name} start with 1 increment by 1 order;\n"
+        if name.startswith('V_'):
+            return f"create or replace view {full_name} as\nselect * from {database}.{schema}.TABLE_000;\n"
+
+        return (f"create or replace TABLE {full_name} (\n"
+                f"\tID NUMBER(38,0) NOT NULL,\n"
+                f"\tNAME VARCHAR(16777216),\n"
+                f"\tNOTE VARCHAR(200) DEFAULT 'a;b',\n"
+                f"\tLOADED_AT TIMESTAMP_NTZ(9)\n);\n")
+
+
+    def schema_ddl(self, database, schema):
+        lines = [f"create or replace schema {database}.{schema};\n"]
+        lines += [self.object_ddl(database, schema, name) for name, _ in self.objects()]
+        lines += [self.object_ddl(database, schema, name) for name in self.sequences()]
+        return "\n".join(lines)
+
+
+    def database_ddl(self, database):
+        lines = [f"create or replace database {database};\n"]
+        lines += [self.schema_ddl(database, schema) for schema in self.schemas()]
+        return "\n".join(lines)
+
+
+    def _fails(self, sql):
+        return self.error_rate > 0 and random.Random(sql).random() < self.error_rate
+
+
+    # results are (columns, rows)
+    def query(self, sql):
+        """ Returns the result of a query, or None for statements without a result """
+
+        normalized = " ".join(sql.split()).rstrip(';').strip()
+        lowered = normalized.lower()
+
+        if lowered == 'select 1':
+            return ['1'], [(1,)]
+
+        if lowered == 'select current_user()':
+            return ['CURRENT_USER()'], [('BENCH_USER',)]
+
+        if lowered == 'select current_warehouse()':
+            return ['CURRENT_WAREHOUSE()'], [('BENCH_WH',)]
+
+        if lowered.startswith('show databases'):
+            rows = [('2020-01-01', database, '', 'SYSADMIN', '') for database in self.databases]
+            rows += [('2020-01-01', 'SNOWFLAKE', 'SNOWFLAKE.ACCOUNT_USAGE', '', ''),
+                     ('2020-01-01', 'SNOWFLAKE_SAMPLE_DATA', 'SFC_SAMPLES.SAMPLE_DATA', 'ACCOUNTADMIN', '')]
+            return ['created_on', 'name', 'origin', 'owner', 'comment'], self._like(normalized, rows, 1)
+
+        match = re.match(r'show schemas (?:like \'[^\']*\' )?in database "([^"]+)"$', normalized, re.IGNORECASE)
+        if match:
+            rows = [('2020-01-01', schema, match.group(1)) for schema in ['INFORMATION_SCHEMA'] + self.schemas()]
+            return ['created_on', 'name', 'database_name'], self._like(normalized, rows, 1)
+
+        match = re.match(r'show objects (?:like \'[^\']*\' )?in schema "([^"]+)"\."([^"]+)"$', normalized, re.IGNORECASE)
+        if match:
+            rows = [('2020-01-01', name, match.group(1), match.group(2), kind) for name, kind in self.objects()]
+            return ['created_on', 'name', 'database_name', 'schema_name', 'kind'], self._like(normalized, rows, 1)
+
+        # the other kinds of schema objects, the fake only has sequences
+        match = re.match(r'show (sequences|file formats|pipes|streams|tasks|user functions|procedures|masking policies) '
+                         r'(?:like \'[^\']*\' )?in schema "([^"]+)"\."([^"]+)"$', normalized, re.IGNORECASE)
+        if match:
+            names = self.sequences() if match.group(1).lower() == 'sequences' else []
+            rows = [('2020-01-01', name, match.group(3), match.group(2), '') for name in names]
+            return ['created_on', 'name', 'schema_name', 'database_name', 'arguments'], self._like(normalized, rows, 1)
+
+        match = re.match(r"select get_ddl\('(schema|table|view|sequence)', '([^']+)'", normalized, re.IGNORECASE)
+        if match:
+            parts = re.findall(r'"([^"]*)"', match.group(2))
+            if match.group(1).lower() == 'schema':
+                return [normalized.upper()], [(self.schema_ddl(*parts),)]
+            return [normalized.upper()], [(self.object_ddl(*parts, qualified = False),)]
+
+        match = re.match(r'(select \* from|select count\(\*\) from|truncate table if exists) (.*)$', normalized,
+                         re.IGNORECASE)
+        if match:
+            return self._table_query(match.group(1).lower(), tuple(re.findall(r'"([^"]*)"', match.group(2))))
+
+        if lowered.startswith('show warehouses'):
+            sizes = ['X-Small', 'Small', 'Medium']
+            return ['name', 'state', 'size'], [(warehouse, 'SUSPENDED', sizes[i % len(sizes)])
+                                               for i, warehouse in enumerate(self.warehouses)]
+
+        if lowered.startswith('show roles'):
+            return ['created_on', 'name', 'comment', 'owner'], [('2020-01-01', role, '' if i % 2 else f"role {i}",
+                                                                 'SECURITYADMIN')
+                                                                for i, role in enumerate(DEFAULT_ROLES + self.roles)]
+
+        if lowered.startswith('show users'):
+            columns = ['name', 'created_on', 'login_name', 'display_name', 'first_name', 'last_name', 'email',
+                       'comment', 'disabled', 'must_change_password', 'default_warehouse', 'default_role']
+            # the first user created the account
+            rows = [(user, f"2020-01-{1 + (i > 0):02d}", user.lower(), user.title(), 'First', 'Last', f"{user.lower()}@example.com",
+                     '', 'false', 'false', self.warehouses[i % len(self.warehouses)] if self.warehouses else '',
+                     self._role(i) if self.roles else '') for i, user in enumerate(self.users)]
+            return columns, rows
+
+        match = re.match(r'show grants of role "?([^"]+)"?$', normalized, re.IGNORECASE)
+        if match:
+            role = match.group(1)
+            grants = self.grants()
+            rows = [('2020-01-01', role, 'USER', user, 'SECURITYADMIN')
+                    for granted, user in grants['users'] if granted == role]
+            rows += [('2020-01-01', role, 'ROLE', grantee, 'SECURITYADMIN')
+                     for granted, grantee in grants['roles'] if granted == role]
+            return ['created_on', 'role', 'granted_to', 'grantee_name', 'granted_by'], rows
+
+        match = re.match(r'show grants to role "?([^"]+)"?$', normalized, re.IGNORECASE)
+        if match:
+            role = match.group(1)
+            rows = [('2020-01-01', privilege, granted_on, ".".join(part for part in [database, schema, name] if part),
+                     'ROLE', grantee, str(grant_option).lower(), 'SECURITYADMIN')
+                    for privilege, granted_on, name, schema, database, grantee, grant_option in self.grants()['objects']
+                    if grantee == role]
+            rows += [('2020-01-01', 'USAGE', 'ROLE', granted, 'ROLE', grantee, 'false', 'SECURITYADMIN')
+                     for granted, grantee in self.grants()['roles'] if grantee == role]
+            return ['created_on', 'privilege', 'granted_on', 'name', 'granted_to', 'grantee_name', 'grant_option',
+                    'granted_by'], rows
+
+        if 'result_scan(' in lowered:
+            return self._result_scan(normalized)
+
+        match = re.match(r"select get_ddl\('database', '([^']+)'", normalized, re.IGNORECASE)
+        if match:
+            database = match.group(1)
+            if database not in self.databases:
+                raise ProgrammingError(f"Database '{database}' does not exist or not authorized.", 2003)
+            return [normalized.upper()], [(self.database_ddl(database),)]
+
+        # every role grant in the columns of show grants of role (terraform)
+        if 'account_usage.grants_to_users' in lowered and 'account_usage.grants_to_roles' in lowered:
+            grants = self.grants()
+            return ['ROLE', 'GRANTED_TO', 'GRANTEE_NAME'], \
+                   [(role, 'USER', user) for role, user in grants['users']] + \
+                   [(role, 'ROLE', grantee) for role, grantee in grants['roles']]
+
+        if 'snowflake.account_usage.' in lowered:
+            return self._project(normalized, *self._account_usage(lowered))
+
+        return None
+
+
+    @staticmethod
+    def _like(sql, rows, column):
+        """ Applies the like clause of a show command to one column of its rows """
+
+        match = re.search(r"\slike '([^']*)'", sql, re.IGNORECASE)
+        if match is None:
+            return rows
+
+        pattern = re.compile("".join('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in match.group(1)),
+                             re.IGNORECASE)
+        return [row for row in rows if pattern.fullmatch(row[column])]
+
+
+    def keep_result(self, query_id, columns, rows):
+        """ Keeps the result of a show command for result_scan """
+
+        with self._lock:
+            self._results[query_id] = (columns, rows)
+
+
+    def _result_scan(self, sql):
+        """ select "column" as ALIAS, ... from table(result_scan('query id')), joined with union all """
+
+        columns, rows = None, []
+        for part in re.split(r'\s+union all\s+', sql, flags = re.IGNORECASE):
+            match = re.match(r"select (.*) from table\(result_scan\('([^']+)'\)\)", part, re.IGNORECASE)
+            with self._lock:
+                result_columns, result_rows = self._results[match.group(2)]
+
+            selected = [re.match(r'"([^"]+)"(?:\s+as\s+(\w+))?$', item.strip(), re.IGNORECASE).groups()
+                        for item in match.group(1).split(',')]
+            index = [result_columns.index(name) for name, _ in selected]
+            columns = [alias or name for name, alias in selected]
+            rows += [tuple(row[i] for i in index) for row in result_rows]
+
+        return columns, rows
+
+
+    def _table_query(self, query, table):
+        source_table = table in set(self.tables())
+
+        if query == 'truncate table if exists':
+            with self._lock:
+                self.loaded_rows.pop(table, None)
+            return None
+
+        if query == 'select count(*) from':
+            return ['COUNT(*)'], [(self.rows_per_table if source_table else self.loaded_rows.get(table, 0),)]
+
+        rows = self.rows_per_table if source_table else 0
+        time.sleep(rows * self.row_latency)
+        return ['ID', 'NAME', 'NOTE', 'LOADED_AT'], [(i, f"name {i}", 'a;b', '2020-01-01 00:00:00')
+                                                   for i in range(rows)]
+
+
+    def load(self, table, rows, chunks):
+        """ Bulk load of write_pandas: one request per staged chunk plus the copy into """
+
+        with self._lock:
+            self.requests += chunks + 1
+            self.statements += chunks + 1
+            self.loaded_rows[table] = self.loaded_rows.get(table, 0) + rows
+
+        time.sleep(self.latency * (chunks + 1) + rows * self.row_latency)
+
+
+    def _account_usage(self, lowered):
+        if 'account_usage.grants_to_users' in lowered:
+            return ['ROLE', 'GRANTEE_NAME'], self.grants()['users']
+
+        if 'account_usage.grants_to_roles' in lowered:
+            columns = ['PRIVILEGE', 'GRANTED_ON', 'NAME', 'TABLE_SCHEMA', 'TABLE_CATALOG', 'GRANTEE_NAME', 'GRANT_OPTION']
+            if "granted_on = 'role'" in lowered:
+                return columns, [('USAGE', 'ROLE', role, None, None, grantee, False)
+                                 for role, grantee in self.grants()['roles']]
+            return columns, self.grants()['objects']
+
+        if 'account_usage.roles' in lowered:
+            return ['NAME', 'COMMENT'], [(role, None) for role in self.roles]
+
+        # the first user created the account and is left out by the replication query
+        if 'account_usage.users' in lowered:
+            return ['NAME', 'LOGIN_NAME', 'DISPLAY_NAME', 'DEFAULT_ROLE', 'EMAIL'], \
+                   [(user, user.lower(), user.title(), self._role(i) if self.roles else None,
+                     f"{user.lower()}@example.com") for i, user in enumerate(self.users) if i > 0]
+
+        raise ProgrammingError("Object does not exist or not authorized.", 2003)
+
+
+    @staticmethod
+    def _project(sql, columns, rows):
+        """ Keeps the columns of the select list """
+
+        # rows are generated grouped by object, order by isn't applied
+        match = re.match(r"select\s+(.*?)\s+from\s", sql, re.IGNORECASE)
+        if match is None or match.group(1).strip() == '*':
+            return columns, rows
+
+        selected = [column.strip().upper() for column in match.group(1).split(',')]
+        index = [columns.index(column) for column in selected]
+        return selected, [tuple(row[i] for i in index) for row in rows]
+
+
+    def _admit(self):
+        """ Rejects a request above the concurrency limit, or with a transient error """
+
+        with self._lock:
+            self.requests += 1
+            if self.concurrency_limit is not None and self.in_flight >= self.concurrency_limit:
+                self.throttled += 1
+                throttled = True
+            elif self.transient_error_rate > 0 and random.random() < self.transient_error_rate:
+                self.transient_errors += 1
+                throttled = None
+            else:
+                self.in_flight += 1
+                return
+
+        time.sleep(self.latency)
+        if throttled:
+            raise ProgrammingError("Too many concurrent requests, the warehouse queue is full", 625, '57014')
+        raise ProgrammingError("Connection reset by peer", 251012, '08006')
+
+
+    def _done(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+    def execute(self, sql, num_statements = None):
+        """ Runs one request, sleeping for its latency. Returns (columns, rows) """
+
+        statements = num_statements or 1
+
+        self._admit()
+        try:
+            with self._lock:
+                self.statements += statements
+
+            time.sleep(self.latency + self.statement_latency * statements)
+        finally:
+            self._done()
+
+        result = self.query(sql) if statements == 1 else None
+        if result is not None:
+            return result
+
+        for statement in sql.split(';\n') if statements > 1 else [sql]:
+            if self._fails(statement.strip()):
+                raise ProgrammingError(f"SQL compilation error: {statement.strip()[:60]}", 2003, '42601')
+            self._keep(statement)
+
+        return ['status'], [('Statement executed successfully.',)]
+
+
+    def submit(self, sql):
+        """ Starts an async query, returns its query id. It counts against the concurrency limit until it finishes """
+
+        self._admit()
+
+        query_id = str(uuid.uuid4())
+        with self._lock:
+            self.statements += 1
+            self._queries[query_id] = (sql, time.perf_counter() + self.latency + self.statement_latency)
+
+        time.sleep(self.latency / 2)
+        return query_id
+
+
+    def status(self, query_id):
+        with self._lock:
+            sql, done_at = self._queries[query_id]
+            self.requests += 1
+
+        time.sleep(self.latency / 2)
+
+        if time.perf_counter() < done_at:
+            return 'RUNNING'
+
+        with self._lock:
+            finished = self._queries.pop(query_id, None) is not None
+        if finished:
+            self._done()
+
+        if self._fails(sql.strip().rstrip(';').strip()):
+            raise ProgrammingError(f"SQL compilation error: {sql.strip()[:60]}", 2003, '42601', query_id)
+
+        if finished:
+            self._keep(sql)
+        return 'SUCCESS'
+
+
+    def _keep(self, statement):
+        if self.keep_statements:
+            with self._lock:
+                self.executed.append(statement.strip().rstrip(';').strip())
+
+
+
+class fake_cursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = None
+        self.sfqid = None
+        self._rows = []
+        self._position = 0
+
+
+    def execute(self, sql, *args, num_statements = None, **kwargs):
+        columns, rows = self.connection.account.execute(sql, num_statements)
+        self.description = [(column, 2, None, None, None, None, True) for column in columns]
+        self.rowcount = len(rows)
+        self.sfqid = str(uuid.uuid4())
+        if sql.lstrip()[:4].lower() == 'show':
+            self.connection.account.keep_result(self.sfqid, columns, rows)
+        self._rows = rows
+        self._position = 0
+        return self
+
+
+    def execute_async(self, sql, *args, **kwargs):
+        self.sfqid = self.connection.account.submit(sql)
+        return {'queryId': self.sfqid}
+
+
+    def fetchall(self):
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return list(rows)
+
+
+    def fetchmany(self, size = 1):
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return list(rows)
+
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+
+    def fetch_pandas_batches(self, batch_size = 10000):
+        """ The rest of the result as dataframes, like the arrow result chunks of the connector """
+
+        import pandas as pd
+
+        columns = [column[0] for column in self.description]
+        while self._position < len(self._rows):
+            yield pd.DataFrame(self.fetchmany(batch_size), columns = columns)
+
+
+    def close(self):
+        self._rows = []
+
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+
+class fake_connection:
+
+    def __init__(self, account):
+        self.account = account
+        self._closed = False
+
+
+    def cursor(self):
+        return fake_cursor(self)
+
+
+    def get_query_status_throw_if_error(self, query_id):
+        return self.account.status(query_id)
+
+
+    def is_still_running(self, status):
+        return status == 'RUNNING'
+
+
+    def is_closed(self):
+        return self._closed
+
+
+    def commit(self):
+        pass
+
+
+    def rollback(self):
+        pass
+
+
+    def close(self):
+        self._closed = True
+
+
+
+def install(*accounts):
+    """ Replaces snowflake.connector with the fake. Has to run before the replication modules are imported,
+        connect() hands out connections to the account named in the credentials
+    """
+
+    registry = {account.name: account for account in accounts}
+
+    def connect(account = None, **kwargs):
+        if account not in registry:
+            raise ProgrammingError(f"unknown fake account: {account}", 250001, '08001')
+        time.sleep(registry[account].latency)
+        return fake_connection(registry[account])
+
+    errors = types.ModuleType('snowflake.connector.errors')
+    errors.ProgrammingError = ProgrammingError
+    errors.DatabaseError = ProgrammingError
+
+    def write_pandas(conn, df, table_name, database = None, schema = None, chunk_size = None,
+                     quote_identifiers = True, **kwargs):
+        chunks = max(1, -(-len(df) // chunk_size)) if chunk_size else 1
+        conn.account.load((database, schema, table_name), len(df), chunks)
+        return True, chunks, len(df), []
+
+    pandas_tools = types.ModuleType('snowflake.connector.pandas_tools')
+    pandas_tools.write_pandas = write_pandas
+
+    connector = types.ModuleType('snowflake.connector')
+    connector.connect = connect
+    connector.errors = errors
+    connector.pandas_tools = pandas_tools
+
+    package = types.ModuleType('snowflake')
+    package.__path__ = []
+    package.connector = connector
+
+    sys.modules.update({'snowflake': package, 'snowflake.connector': connector, 'snowflake.connector.errors': errors,
+                        'snowflake.connector.pandas_tools': pandas_tools})
+
+    return registry
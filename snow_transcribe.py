@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+""" snow-transcribe: replicate a snowflake account, drop what a replication created,
+compile / replay replication plans and write terraform files
+
+    snow_transcribe.py replicate creds.config --include 'SALES.*' --journal run.journal
+    snow_transcribe.py replicate creds.config --phases users roles --metadata-backend show
+    snow_transcribe.py drop creds.config --journal run.journal
+    snow_transcribe.py plan compile creds.config plan.jsonl
+    snow_transcribe.py plan replay creds.config plan.jsonl --target snowflake_target_account
+    snow_transcribe.py plan drop creds.config plan.jsonl
+    snow_transcribe.py terraform snowflake.config --directory terraform_files
+
+Only the standard library is imported at start up: the replication modules (and pandas,
+snowflake.connector, cryptography) are imported by the subcommand that runs them.
+drop, plan replay and plan drop only execute statements and don't import pandas
+"""
+
+import argparse
+import os
+import sys
+
+
+ROOT = os.path.dirname(os.path.realpath(__file__))
+
+# the phases of transcribe.PHASE_DEPENDENCIES, listed here so --help doesn't import transcribe
+PHASES = ['database_objects', 'users', 'roles', 'warehouses', 'user_role_grants', 'role_role_grants',
+          'role_object_grants']
+
+
+
+def _import_path():
+    """ The scripts import each other by module name """
+
+    sys.path[:0] = [path for path in [os.path.join(ROOT, 'snowflake'), os.path.join(ROOT, 'terraform')]
+                    if path not in sys.path]
+
+
+def _transcribe(args, **options):
+    """ transcribe_snowflake_account from the source / target options of a subcommand """
+
+    from transcribe import transcribe_snowflake_account
+
+    selector = None
+    if getattr(args, 'include', None) or getattr(args, 'exclude', None):
+        from object_selector import object_selector
+        selector = object_selector(args.include, args.exclude)
+
+    return transcribe_snowflake_account(args.config_file,
+                                        source_config_name = args.source,
+                                        target_config_name = args.target,
+                                        conn_type_source = args.conn_type_source,
+                                        conn_type_target = args.conn_type_target,
+                                        return_sql = not args.quiet,
+                                        max_workers = args.max_workers,
+                                        batch_size = args.batch_size,
+                                        selector = selector,
+                                        **options)
+
+
+def _metadata_backend(args):
+    """ --metadata-backend show or --metadata-backend role_object_grants=show users=show """
+
+    if len(args.metadata_backend) == 1 and '=' not in args.metadata_backend[0]:
+        return args.metadata_backend[0]
+
+    return dict(option.split('=', 1) for option in args.metadata_backend)
+
+
+def _source_options(args):
+    return dict(db_ignore_list = args.db_ignore or [""],
+                cache_path = args.cache,
+                cache_ttl = args.cache_ttl,
+                chunk_size = args.chunk_size,
+                compact_grants = not args.no_compact_grants,
+                metadata_backend = _metadata_backend(args))
+
+
+
+def replicate(args):
+    sf_transcribe = _transcribe(args, diff_mode = args.diff, diff_drops = args.diff_drops, journal_path = args.journal,
+                                async_grants = args.async_grants, max_in_flight = args.max_in_flight,
+                                max_retries = args.max_retries, report_path = args.report,
+                                metrics_path = args.metrics, copy_data = args.copy_data,
+                                copy_workers = args.copy_workers, **_source_options(args))
+    try:
+        sf_transcribe.copy_account(args.max_parallel_phases, phases = args.phases)
+    finally:
+        sf_transcribe.close_connections()
+
+
+def drop(args):
+    sf_transcribe = _transcribe(args, journal_path = args.journal, max_retries = args.max_retries)
+    try:
+        sf_transcribe.drop_objects(args.objects)
+    finally:
+        sf_transcribe.close_connections()
+
+
+def plan_compile(args):
+    args.target = None
+    sf_transcribe = _transcribe(args, **_source_options(args))
+    try:
+        sf_transcribe.compile_plan(args.plan, args.max_parallel_phases)
+    finally:
+        sf_transcribe.close_connections()
+
+
+def _replayer(args):
+    from plan_replay import plan_replayer
+
+    return plan_replayer(args.config_file, target_config_name = args.target, conn_type_target = args.conn_type_target,
+                         max_workers = args.max_workers, batch_size = args.batch_size, return_sql = not args.quiet,
+                         max_retries = args.max_retries)
+
+
+def plan_replay(args):
+    _replayer(args).replay(args.plan, args.max_parallel_phases)
+
+
+def plan_drop(args):
+    _replayer(args).drop(args.plan)
+
+
+def terraform(args):
+    from terraform_transcribe import terraform_transcribe
+
+    tf_transcribe = terraform_transcribe(args.config_file, config_name = args.config_name, conn_type = args.conn_type,
+                                         pool_size = args.pool_size, grants_source = args.grants_source)
+    try:
+        tf_transcribe.generate_files(args.directory, shard_by = args.shard_by, shard_count = args.shard_count,
+                                     output_format = args.output_format, incremental = args.incremental,
+                                     max_workers = args.max_workers)
+    finally:
+        tf_transcribe.close_conn()
+
+
+
+def _add_target(parser):
+    parser.add_argument('--target', default = 'snowflake_target_account',
+                        help = 'config section of the target account (default: %(default)s)')
+    parser.add_argument('--conn-type-target', choices = ['password', 'private_key'], default = 'private_key')
+    parser.add_argument('--max-retries', type = int, default = 5,
+                        help = 'retries of a statement that fails with a transient error (default: %(default)s)')
+
+
+def _add_common(parser, max_workers = 4, batch_size = 50):
+    parser.add_argument('config_file', help = 'config file with the account credentials')
+    parser.add_argument('--max-workers', type = int, default = max_workers,
+                        help = 'databases / groups / drops worked on at the same time (default: %(default)s)')
+    parser.add_argument('--batch-size', type = int, default = batch_size,
+                        help = 'statements sent per request, 1 disables batching (default: %(default)s)')
+    parser.add_argument('--quiet', action = 'store_true', help = "don't print every executed statement")
+
+
+def _add_source(parser):
+    parser.add_argument('--source', default = 'snowflake_source_account',
+                        help = 'config section of the source account (default: %(default)s)')
+    parser.add_argument('--conn-type-source', choices = ['password', 'private_key'], default = 'private_key')
+
+
+def _add_selection(parser):
+    parser.add_argument('--include', nargs = '+', metavar = 'PATTERN',
+                        help = "databases / schemas / objects to replicate, eg. 'SALES' 'HR.PUBLIC.*' (default: all)")
+    parser.add_argument('--exclude', nargs = '+', metavar = 'PATTERN', help = 'patterns left out of --include')
+    parser.add_argument('--db-ignore', nargs = '+', metavar = 'DATABASE', help = 'databases that are not replicated')
+    parser.add_argument('--cache', metavar = 'PATH', help = 'sqlite cache of the source metadata')
+    parser.add_argument('--cache-ttl', type = int, default = 3600, help = 'seconds a cached result is reused')
+    parser.add_argument('--chunk-size', type = int, default = 100000, help = 'grant rows handled at a time')
+    parser.add_argument('--no-compact-grants', action = 'store_true',
+                        help = 'one GRANT per privilege instead of one per object and role')
+    parser.add_argument('--metadata-backend', nargs = '+', default = ['account_usage'], metavar = 'BACKEND',
+                        help = "'account_usage' or 'show', or PHASE=BACKEND per phase (default: account_usage)")
+    parser.add_argument('--max-parallel-phases', type = int, default = 4)
+
+
+def parser():
+    parser = argparse.ArgumentParser(prog = 'snow-transcribe', description = __doc__,
+                                     formatter_class = argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest = 'command', metavar = 'command', required = True)
+
+    command = commands.add_parser('replicate', help = 'copy account and database objects to the target account')
+    _add_common(command)
+    _add_source(command)
+    _add_target(command)
+    _add_selection(command)
+    command.add_argument('--phases', nargs = '+', choices = PHASES, metavar = 'PHASE',
+                         help = f"only run these phases, the phases they depend on must be done ({', '.join(PHASES)})")
+    command.add_argument('--diff', action = 'store_true', help = 'only create / alter what differs from the source')
+    command.add_argument('--diff-drops', action = 'store_true', help = 'with --diff, drop what the source no longer has')
+    command.add_argument('--journal', metavar = 'PATH', help = 'execution journal, a rerun skips what succeeded')
+    command.add_argument('--async-grants', action = 'store_true', help = 'submit grants as async queries')
+    command.add_argument('--max-in-flight', type = int, default = 64)
+    command.add_argument('--report', metavar = 'PATH', help = 'json run report')
+    command.add_argument('--metrics', metavar = 'PATH', help = 'prometheus metrics file')
+    command.add_argument('--copy-data', action = 'store_true', help = 'copy the rows of every table')
+    command.add_argument('--copy-workers', type = int, default = 4)
+    command.set_defaults(func = replicate)
+
+    command = commands.add_parser('drop', help = 'drop the objects a replication created (read from its journal)')
+    _add_common(command)
+    _add_source(command)
+    _add_target(command)
+    command.add_argument('--journal', metavar = 'PATH', required = True, help = 'journal of the replication')
+    command.add_argument('--objects', choices = ['all', 'databases', 'users', 'roles', 'warehouses'], default = 'all')
+    command.set_defaults(func = drop)
+
+    plan = commands.add_parser('plan', help = 'compile a replication plan, replay it or drop what it created')
+    plan_commands = plan.add_subparsers(dest = 'plan_command', metavar = 'command', required = True)
+
+    command = plan_commands.add_parser('compile', help = 'read the source account and write a plan file')
+    _add_common(command)
+    _add_source(command)
+    _add_selection(command)
+    command.add_argument('plan', help = 'path of the plan file')
+    command.set_defaults(func = plan_compile, conn_type_target = 'private_key')
+
+    for name, func, help_text in [('replay', plan_replay, 'execute a plan on a target account'),
+                                  ('drop', plan_drop, 'execute the drop statements of a plan on a target account')]:
+        command = plan_commands.add_parser(name, help = help_text)
+        _add_common(command, max_workers = 8, batch_size = 200)
+        _add_target(command)
+        command.add_argument('plan', help = 'path of the plan file')
+        command.add_argument('--max-parallel-phases', type = int, default = 4)
+        command.set_defaults(func = func)
+
+    command = commands.add_parser('terraform', help = 'write terraform files for the users, roles and role grants')
+    command.add_argument('config_file', help = 'config file with the account credentials')
+    command.add_argument('--config-name', default = 'snowflake', help = 'config section (default: %(default)s)')
+    command.add_argument('--conn-type', choices = ['password', 'private_key'], default = 'password')
+    command.add_argument('--pool-size', type = int, default = 4)
+    command.add_argument('--grants-source', choices = ['account_usage', 'show'], default = 'account_usage')
+    command.add_argument('--directory', default = '.', help = 'where the files are written (default: %(default)s)')
+    command.add_argument('--shard-by', choices = ['prefix', 'hash'])
+    command.add_argument('--shard-count', type = int, default = 16)
+    command.add_argument('--output-format', choices = ['hcl', 'json'], default = 'hcl')
+    command.add_argument('--incremental', action = 'store_true', help = 'only rewrite the files that changed')
+    command.add_argument('--max-workers', type = int, default = None)
+    command.set_defaults(func = terraform)
+
+    return parser
+
+
+
+def main(argv = None):
+    args = parser().parse_args(argv)
+
+    _import_path()
+    args.func(args)
+
+
+
+if __name__ == "__main__":
+    main()
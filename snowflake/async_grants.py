@@ -0,0 +1,112 @@
+import asyncio
+import snowflake.connector
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+
+def execute_sql_async(sql_list, connection, max_in_flight = 64, poll_interval = 0.25, return_sql = False,
+                      return_errors = True, log = print, on_result = None, controller = None):
+    """ Execute independent sql statements (eg. grants) with the connector's async queries
+        - up to max_in_flight statements are running on the server at the same time
+        - each statement is submitted with execute_async and its query id is polled until it finishes
+        - errors are reported per statement like execute_sql_list, on_result gets (sql, error, seconds)
+        - statement order is not kept, only use it for statements that don't depend on each other
+        - controller: execution_controller, the statements in flight stay within its limit and
+          statements that fail with a transient error are submitted again after a backoff
+    """
+
+    if not sql_list:
+        return
+
+    return asyncio.run(_execute_all(sql_list, connection, max_in_flight, poll_interval, return_sql,
+                                    return_errors, log, on_result, controller))
+
+
+
+async def _execute_all(sql_list, connection, max_in_flight, poll_interval, return_sql, return_errors, log, on_result,
+                       controller):
+    # submitting and polling are blocking connector calls, they run on their own threads
+    with ThreadPoolExecutor(max_workers = min(max_in_flight, 32)) as executor:
+        semaphore = asyncio.Semaphore(max_in_flight)
+
+        await asyncio.gather(*[_execute_one(sql, connection, semaphore, executor, poll_interval, return_sql,
+                                            return_errors, log, on_result, controller) for sql in sql_list])
+
+
+
+async def _run_query(sql, connection, executor, poll_interval):
+    """ Submits one statement and polls it until it finishes, raises the error of a failed query """
+
+    loop = asyncio.get_running_loop()
+
+    cur = connection.cursor()
+    await loop.run_in_executor(executor, cur.execute_async, sql)
+    query_id = cur.sfqid
+
+    # raises a ProgrammingError if the query failed
+    status = await loop.run_in_executor(executor, connection.get_query_status_throw_if_error, query_id)
+    while connection.is_still_running(status):
+        await asyncio.sleep(poll_interval)
+        status = await loop.run_in_executor(executor, connection.get_query_status_throw_if_error, query_id)
+
+
+
+async def _run_controlled(sql, connection, executor, poll_interval, controller):
+    """ _run_query within the controller's limit, retrying transient errors """
+
+    attempt = 0
+    while True:
+        while not controller.try_acquire():
+            await asyncio.sleep(poll_interval / 5)
+
+        start = time.perf_counter()
+        try:
+            await _run_query(sql, connection, executor, poll_interval)
+        except Exception as error:
+            controller.release()
+            if not controller.should_retry(controller.on_error(error), attempt):
+                raise
+            await asyncio.sleep(controller.backoff(attempt))
+            attempt += 1
+            continue
+
+        controller.release()
+        controller.on_success(time.perf_counter() - start)
+        return
+
+
+
+async def _execute_one(sql, connection, semaphore, executor, poll_interval, return_sql, return_errors, log, on_result,
+                       controller):
+
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            if return_sql:
+                log("Executing: ", sql)
+
+            if controller is None:
+                await _run_query(sql, connection, executor, poll_interval)
+            else:
+                await _run_controlled(sql, connection, executor, poll_interval, controller)
+
+            if on_result is not None:
+                on_result(sql, None, time.perf_counter() - start)
+
+        except snowflake.connector.errors.ProgrammingError as e:
+            if on_result is not None:
+                on_result(sql, e, time.perf_counter() - start)
+
+            if return_errors:
+                log(e)
+                log('Error {0} ({1}): {2} ({3})'.format(e.errno, e.sqlstate, e.msg, e.sfqid))
+
+        except Exception as error:
+            if on_result is not None:
+                on_result(sql, error, time.perf_counter() - start)
+
+            if return_errors:
+                log(error)
+                log(f"Could not execute: {sql}")
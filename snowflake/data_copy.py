@@ -0,0 +1,106 @@
+import re
+import time
+
+from ddl_parser import classify_statement, split_name
+from sql_builder import quote_identifier
+
+
+
+# only plain (and transient) tables hold data that can be loaded, external / dynamic / iceberg
+# tables and temporary tables are skipped
+_copyable_table = re.compile(r"^\s*create\s+(?:or\s+replace\s+)?(?:transient\s+)?table\s", re.IGNORECASE)
+
+
+
+def created_tables(sql_list):
+    """ (database, schema, table) of the tables created by a list of ddl statements """
+
+    tables = []
+    for sql in sql_list:
+        if not _copyable_table.match(sql):
+            continue
+
+        statement = classify_statement(sql)
+        if statement is None or statement[2] is None:
+            continue
+
+        parts = split_name(statement[2])
+        if len(parts) == 3:
+            tables.append(tuple(parts))
+
+    return tables
+
+
+
+def copy_table_data(table, source_conn, target_conn, batch_size = 100000, log = print):
+    """ Copies the rows of one table from the source to the (empty or recreated) target table
+        - the source result is streamed as arrow batches (fetch_pandas_batches), only about
+          batch_size rows are held in memory at a time
+        - every batch_size rows are bulk loaded into the target with write_pandas
+          (a parquet file is staged and loaded with COPY INTO)
+        - the target table is truncated first, so a rerun doesn't duplicate rows
+        - the row count of the target is checked against the source afterwards
+        Returns {'table', 'rows', 'seconds', 'source_rows', 'target_rows', 'error'}
+    """
+
+    # imported here, write_pandas needs the connector's pandas extra (pyarrow)
+    import pandas as pd
+    from snowflake.connector.pandas_tools import write_pandas
+
+    database, schema, name = table
+    full_name = ".".join(quote_identifier(part) for part in table)
+    result = {'table': ".".join(table), 'rows': 0, 'seconds': 0.0, 'source_rows': None,
+              'target_rows': None, 'error': None}
+
+    start = time.perf_counter()
+    try:
+        source_cur = source_conn.cursor()
+        target_cur = target_conn.cursor()
+
+        target_cur.execute(f"truncate table if exists {full_name}")
+
+        source_cur.execute(f"select count(*) from {full_name}")
+        result['source_rows'] = source_cur.fetchone()[0]
+
+        def load(frames):
+            df = pd.concat(frames, ignore_index = True) if len(frames) > 1 else frames[0]
+            success, _, rows, _ = write_pandas(target_conn, df, name, database = database, schema = schema,
+                                               chunk_size = batch_size, quote_identifiers = True)
+            if not success:
+                raise RuntimeError(f"write_pandas failed after {result['rows']} rows")
+            result['rows'] += rows
+
+        source_cur.execute(f"select * from {full_name}")
+
+        frames, buffered = [], 0
+        for df in source_cur.fetch_pandas_batches():
+            frames.append(df)
+            buffered += len(df)
+
+            if buffered >= batch_size:
+                load(frames)
+                frames, buffered = [], 0
+
+        if buffered:
+            load(frames)
+
+        target_cur.execute(f"select count(*) from {full_name}")
+        result['target_rows'] = target_cur.fetchone()[0]
+
+        if result['target_rows'] != result['source_rows']:
+            result['error'] = f"row count mismatch: {result['source_rows']} in the source, " \
+                              f"{result['target_rows']} in the target"
+
+    except Exception as error:
+        result['error'] = str(error)
+
+    result['seconds'] = time.perf_counter() - start
+
+    if result['error'] is not None:
+        log(f"Could not copy the data of {result['table']}: {result['error']}")
+    else:
+        rows_per_second = result['rows'] / result['seconds'] if result['seconds'] else 0.0
+        log(f"copied {result['rows']} rows of {result['table']} in {result['seconds']:.1f}s "
+            f"({rows_per_second:.0f} rows/s)")
+
+    return result
@@ -0,0 +1,164 @@
+import re
+
+from sql_builder import quote_identifier
+
+
+
+# object types that aren't replayed by default (views, code and pipelines depend on
+# objects / integrations that may not exist in the target account)
+DEFAULT_EXCLUDE_TYPES = ['PROCEDURE', 'FUNCTION', 'STAGE', 'STREAM', 'TASK', 'FILE FORMAT',
+                         'VIEW', 'PIPE', 'MASKING POLICY']
+
+# statements containing any of these patterns aren't replayed by default
+DEFAULT_EXCLUDE_TEXT = [r"\sreferences\s", r"masking\s+policy"]
+
+
+# string literals, quoted identifiers, $$ blocks and comments are matched as one token,
+# so a ; inside them never ends a statement
+_token = re.compile(r"""'(?:[^'\\]|\\.)*'      # string literal
+                      |"[^"]*"                 # quoted identifier
+                      |\$\$.*?\$\$             # $$ body
+                      |--[^\n]*|//[^\n]*       # line comments
+                      |/\*.*?\*/               # block comment
+                      |;""", re.DOTALL | re.VERBOSE)
+
+_leading_comments = re.compile(r"(?:\s+|--[^\n]*|//[^\n]*|/\*.*?\*/)*", re.DOTALL)
+
+_identifier = r'(?:"(?:[^"]|"")*"|[^\s(."]+)'
+
+_statement = re.compile(r"""(?P<verb>create|alter|drop|grant|revoke|comment|use|undrop)\b
+                            (?:\s+or\s+replace)?
+                            (?P<modifiers>(?:\s+(?:transient|temporary|temp|volatile|local|global|secure|
+                                                  recursive|materialized|external|dynamic|hybrid|iceberg|event))*)
+                            \s+(?P<type>(?:file\s+format|masking\s+policy|row\s+access\s+policy|
+                                           network\s+policy|password\s+policy|session\s+policy|[a-z_]+))
+                            (?:\s+if\s+not\s+exists)?
+                            (?:\s+(?P<name>""" + _identifier + r"(?:\." + _identifier + r""")*))?""",
+                        re.IGNORECASE | re.VERBOSE)
+
+_name_part = re.compile(_identifier)
+
+
+
+def split_statements(ddl):
+    """ Generator over the statements of a ddl script.
+        Splits on ; outside of quotes, $$ blocks and comments
+    """
+
+    start = 0
+    for token in _token.finditer(ddl):
+        if token.group() == ';':
+            statement = ddl[start:token.start()].strip()
+            if statement:
+                yield statement
+            start = token.end()
+
+    statement = ddl[start:].strip()
+    if statement:
+        yield statement
+
+
+
+def split_name(name):
+    """ The parts of a (possibly quoted) qualified name, eg. 'DB."my schema".T' -> ['DB', 'my schema', 'T'] """
+
+    parts = [part.group() for part in _name_part.finditer(name)]
+
+    return [part[1:-1].replace('""', '"') if part.startswith('"') else part for part in parts]
+
+
+
+def classify_statement(sql):
+    """ Returns (verb, object type, object name) for a statement, eg. ('CREATE', 'TABLE', 'DB.SCHEMA.T').
+        Modifiers like TRANSIENT or SECURE are dropped from the type. None if it can't be classified
+    """
+
+    match = _statement.match(sql, _leading_comments.match(sql).end())
+    if match is None:
+        return None
+
+    object_type = " ".join(match.group('type').upper().split())
+
+    return match.group('verb').upper(), object_type, match.group('name')
+
+
+
+def qualify_statement(sql, *namespace):
+    """ Prefixes the object name of a statement with the database / schema it is in, for the
+        ddl of single objects (get_ddl('table', ...) returns the bare table name)
+    """
+
+    match = _statement.match(sql, _leading_comments.match(sql).end())
+    if match is None or match.group('name') is None:
+        return sql
+
+    missing = len(namespace) + 1 - len(split_name(match.group('name')))
+    if missing <= 0:
+        return sql
+
+    prefix = "".join(quote_identifier(part) + "." for part in namespace[:missing])
+    return sql[:match.start('name')] + prefix + sql[match.start('name'):]
+
+
+
+class ddl_policy:
+    """
+    Decides which statements of get_ddl output are replayed. Only CREATE statements are kept
+
+    Attributes:
+        include_types : list
+            object types to replay (eg. ['SCHEMA', 'TABLE']), None allows every type that isn't excluded
+        exclude_types : list
+            object types that are never replayed
+        exclude_text : list
+            regex patterns, statements that match any of them are skipped
+
+    """
+
+    def __init__(self,
+                 include_types = None,
+                 exclude_types = DEFAULT_EXCLUDE_TYPES,
+                 exclude_text = DEFAULT_EXCLUDE_TEXT):
+
+        self.include_types = set(t.upper() for t in include_types) if include_types is not None else None
+        self.exclude_types = set(t.upper() for t in exclude_types)
+        self._exclude_text = re.compile("|".join(exclude_text), re.IGNORECASE) if exclude_text else None
+
+        # DATABASE is always needed for the objects inside it
+        if self.include_types is not None:
+            self.include_types.add('DATABASE')
+
+
+    def allows(self, sql):
+        """ True if the statement should be replayed """
+
+        statement = classify_statement(sql)
+        if statement is None:
+            return False
+
+        verb, object_type, _ = statement
+
+        if verb != 'CREATE' or not self.allows_type(object_type):
+            return False
+
+        return self._exclude_text is None or self._exclude_text.search(sql) is None
+
+
+    def allows_type(self, object_type):
+        """ True if objects of this type (eg. 'SEQUENCE') can be replayed """
+
+        object_type = object_type.upper()
+        if object_type in self.exclude_types:
+            return False
+
+        return self.include_types is None or object_type in self.include_types
+
+
+    def filter(self, ddl):
+        """ Splits a ddl script and returns the statements that should be replayed """
+
+        return [sql for sql in split_statements(ddl) if self.allows(sql)]
+
+
+
+default_ddl_policy = ddl_policy()
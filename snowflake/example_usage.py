@@ -32,4 +32,14 @@ sf_transcribe.role_object_grants()
 
 
 # to drop only the database objects:
-sf_transcribe.drop_objects(objects = 'databases')
\ No newline at end of file
+sf_transcribe.drop_objects(objects = 'databases')
+
+
+# compile the replication once into a plan file (nothing is executed on the target)...
+sf_transcribe.compile_plan('replication_plan.jsonl')
+
+# ...and replay it on a target account as often as needed
+from plan_replay import plan_replayer
+
+replayer = plan_replayer('example_creds.config', target_config_name='snowflake_target_account')
+replayer.replay('replication_plan.jsonl')
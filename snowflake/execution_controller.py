@@ -0,0 +1,252 @@
+import random
+import re
+import threading
+import time
+
+
+
+# messages are matched from their start with the texts of the account / connector, never searched:
+# they go on with object names and query positions (eg. a table named ORDERS_TIMEOUT)
+
+# errors that mean the account is overloaded: fewer statements should be in flight
+THROTTLE_PATTERNS = [r"too many (?:concurrent requests|requests|queries)\b", r"the warehouse queue is full\b",
+                     r"(?:http )?429\b", r"rate limit exceeded\b", r"max concurrency limit reached\b"]
+
+# errors that go away when the statement is retried later (network, unavailable service)
+TRANSIENT_PATTERNS = [r"connection (?:reset|aborted|refused) by peer\b", r"connection (?:was |is )?closed\b",
+                      r"(?:read|connect|request) timed out\b", r"service (?:is )?temporarily unavailable\b",
+                      r"http 50[234]\b"]
+
+# errors that are never retried: a statement that reached its timeout would run as long again
+PERMANENT_PATTERNS = [r"statement reached its statement or warehouse timeout\b", r"sql execution canceled\b"]
+
+# errnos of the account / connector: too many statements waiting for a lock, statement timeout / cancel,
+# failed to connect / connection closed / failed request
+THROTTLE_ERRNOS = [625]
+PERMANENT_ERRNOS = [604, 630]
+TRANSIENT_ERRNOS = [250001, 250002, 250003]
+
+# sqlstate classes of compilation / access errors, data errors and missing objects, checked before anything else
+PERMANENT_SQLSTATE_CLASSES = ['42', '22', '02']
+
+# sqlstate classes of connection errors and transaction rollbacks (deadlocks, serialization failures)
+TRANSIENT_SQLSTATE_CLASSES = ['08', '40']
+
+# connector exceptions raised for network / driver failures
+TRANSIENT_ERROR_TYPES = ['OperationalError', 'InterfaceError', 'ConnectionError', 'TimeoutError']
+
+
+
+def classify_error(error, throttle_patterns = THROTTLE_PATTERNS, transient_patterns = TRANSIENT_PATTERNS):
+    """ 'throttle', 'transient' or 'permanent' for an error raised by the connector.
+        Compilation errors, missing objects, privileges, bad data and statement timeouts are permanent,
+        retrying doesn't help. Then errnos and sqlstates are checked, the start of the message last
+    """
+
+    message = str(getattr(error, 'msg', None) or error).strip()
+    sqlstate = str(getattr(error, 'sqlstate', None) or '')
+    errno = getattr(error, 'errno', None)
+
+    def matches(patterns):
+        return re.match("|".join(patterns), message, re.IGNORECASE) is not None
+
+    if sqlstate[:2] in PERMANENT_SQLSTATE_CLASSES or errno in PERMANENT_ERRNOS or matches(PERMANENT_PATTERNS):
+        return 'permanent'
+
+    if errno in THROTTLE_ERRNOS or matches(throttle_patterns):
+        return 'throttle'
+
+    if errno in TRANSIENT_ERRNOS or sqlstate[:2] in TRANSIENT_SQLSTATE_CLASSES or \
+       type(error).__name__ in TRANSIENT_ERROR_TYPES or matches(transient_patterns):
+        return 'transient'
+
+    return 'permanent'
+
+
+
+class execution_controller:
+    """
+    Runs requests on the target account with retries and an adaptive limit on the requests in flight,
+    shared by every thread (and async query) of a run
+    - transient errors are retried with jittered exponential backoff, permanent errors are raised at once
+    - the limit grows by one per window of successful requests (additive increase) and is halved
+      on a throttling error or when the request latency rises above latency_tolerance times the
+      best latency seen (multiplicative decrease), at most once per latency period
+
+    Attributes:
+        max_in_flight : int
+            upper limit of requests in flight, also where the limit starts
+        min_in_flight : int
+            lower limit of requests in flight
+        max_retries : int
+            retries of a request that keeps failing with transient errors, 0 disables retries
+        base_delay : float
+            backoff of the first retry in seconds, doubled for every further retry
+        max_delay : float
+            maximum backoff in seconds
+        latency_tolerance : float
+            how many times the best latency the average latency can reach before the limit is lowered.
+            None only lowers the limit on throttling errors
+
+    """
+
+    def __init__(self, max_in_flight = 64, min_in_flight = 1, max_retries = 5, base_delay = 0.5, max_delay = 30.0,
+                 latency_tolerance = 3.0):
+
+        self.max_in_flight = max(1, max_in_flight)
+        self.min_in_flight = max(1, min(min_in_flight, self.max_in_flight))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.latency_tolerance = latency_tolerance
+
+        self.window = float(self.max_in_flight)
+        self.in_flight = 0
+        self.stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'transient_errors': 0, 'permanent_errors': 0,
+                      'given_up': 0, 'decreases': 0, 'min_window': self.max_in_flight}
+
+        self._latency = None
+        self._request_latency = None
+        self._best_latency = None
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+
+    def limit(self):
+        """ The number of requests allowed in flight right now """
+
+        return max(self.min_in_flight, int(self.window))
+
+
+    def acquire(self):
+        """ Waits for a free slot """
+
+        with self._condition:
+            while self.in_flight >= self.limit():
+                self._condition.wait()
+            self.in_flight += 1
+
+
+    def try_acquire(self):
+        """ Takes a free slot if there is one, for callers that can't block (async queries) """
+
+        with self._condition:
+            if self.in_flight >= self.limit():
+                return False
+            self.in_flight += 1
+            return True
+
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+
+    def backoff(self, attempt):
+        """ Seconds to wait before retry number attempt (0 based), full jitter """
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+    def on_success(self, seconds, statements = 1):
+        """ Additive increase, or a decrease when the latency per statement is well above the best latency seen """
+
+        with self._condition:
+            self.stats['requests'] += 1
+
+            self._request_latency = seconds if self._request_latency is None else \
+                                    0.9 * self._request_latency + 0.1 * seconds
+
+            seconds = seconds / max(1, statements)
+            self._latency = seconds if self._latency is None else 0.9 * self._latency + 0.1 * seconds
+            self._best_latency = self._latency if self._best_latency is None else min(self._best_latency, self._latency)
+
+            if self.latency_tolerance is not None and self._latency > self.latency_tolerance * self._best_latency:
+                # the latency after the decrease is the new baseline, so slow statements alone
+                # don't keep the limit at its minimum
+                if self._decrease():
+                    self._best_latency = self._latency
+            else:
+                self.window = min(self.max_in_flight, self.window + 1 / self.window)
+
+            self._condition.notify_all()
+
+
+    def on_error(self, error):
+        """ Records a failed request, returns the error class (see classify_error) """
+
+        kind = classify_error(error)
+
+        with self._condition:
+            self.stats['requests'] += 1
+            if kind == 'throttle':
+                self.stats['throttled'] += 1
+                self._decrease()
+            elif kind == 'transient':
+                self.stats['transient_errors'] += 1
+            else:
+                self.stats['permanent_errors'] += 1
+
+        return kind
+
+
+    def _decrease(self):
+        # one decrease per request latency, the requests in flight when the limit was hit fail together
+        now = time.perf_counter()
+        if now - self._last_decrease < (self._request_latency or 0.0):
+            return False
+
+        self._last_decrease = now
+        self.window = max(float(self.min_in_flight), self.window / 2)
+        self.stats['decreases'] += 1
+        self.stats['min_window'] = min(self.stats['min_window'], self.limit())
+        return True
+
+
+    def should_retry(self, kind, attempt):
+        """ Whether a request that failed with an error of this kind is retried (attempt is 0 based) """
+
+        if kind == 'permanent':
+            return False
+
+        if attempt >= self.max_retries:
+            with self._condition:
+                self.stats['given_up'] += 1
+            return False
+
+        with self._condition:
+            self.stats['retries'] += 1
+        return True
+
+
+    def call(self, func, *args, statements = 1, **kwargs):
+        """ Calls func (eg. cursor.execute) in a slot, retrying transient errors.
+            statements is the number of statements of the request, the latency is measured per statement.
+            The last error is raised when the request fails for good
+        """
+
+        attempt = 0
+        while True:
+            self.acquire()
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as error:
+                self.release()
+                if not self.should_retry(self.on_error(error), attempt):
+                    raise
+                time.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+
+            self.release()
+            self.on_success(time.perf_counter() - start, statements)
+            return result
+
+
+    def report(self):
+        """ The counters, and the limit of requests in flight at the end """
+
+        with self._condition:
+            return dict(self.stats, window = self.limit(), latency = self._latency, best_latency = self._best_latency)
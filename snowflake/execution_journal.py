@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+
+
+
+class execution_journal:
+    """
+    An append-only journal (json lines) of the statements executed on the target account.
+    A rerun skips the statements that already succeeded, and the drop lists of each object
+    type are kept so drop_objects works after a restart. The journal covers one replication:
+    it is reset when every object is dropped, and when the objects of one type are dropped
+    the statements of the phases they were created by are forgotten
+
+    Attributes:
+        path : str
+            the path of the journal file (appended to if it exists)
+        sync_every : int
+            the file is flushed and fsynced after this many records
+
+    """
+
+    def __init__(self, path, sync_every = 500):
+        self.path = path
+        self.sync_every = sync_every
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        # statement hash -> phase
+        self.completed = {}
+        self.drops = {}
+
+        if os.path.exists(path):
+            self._load()
+
+        self._file = open(path, 'a')
+
+        # start on a new line if the last record was cut off
+        if self._file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+
+    @staticmethod
+    def statement_hash(sql):
+        normalized_sql = " ".join(sql.split()).rstrip(";").strip()
+        return hashlib.sha1(normalized_sql.encode()).hexdigest()
+
+
+    def _load(self):
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last record may be cut off if the process died while writing it
+                    continue
+
+                if 'drops' in record:
+                    self.drops[record['kind']] = record['drops']
+                elif 'cleared' in record:
+                    self.drops.pop(record['cleared'], None)
+                    self._forget(record.get('phases', []))
+                elif record.get('status') == 'ok':
+                    self.completed[record['hash']] = record.get('phase')
+
+
+    def _forget(self, phases):
+        phases = set(phases)
+        self.completed = {statement_hash: phase for statement_hash, phase in self.completed.items()
+                          if phase not in phases}
+
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._unsynced += 1
+
+        if self._unsynced >= self.sync_every:
+            self.sync()
+
+
+    def sync(self):
+        """ Flushes and fsyncs the records written so far """
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+
+    def is_done(self, sql):
+        return self.statement_hash(sql) in self.completed
+
+
+    def pending(self, sql_list):
+        """ Returns the statements that haven't been applied yet """
+
+        return [sql for sql in sql_list if self.statement_hash(sql) not in self.completed]
+
+
+    def record(self, sql, phase, error = None):
+        """ Records the outcome of a statement """
+
+        statement_hash = self.statement_hash(sql)
+
+        with self._lock:
+            if error is None:
+                self.completed[statement_hash] = phase
+                self._write({'hash': statement_hash, 'phase': phase, 'status': 'ok'})
+            else:
+                self._write({'hash': statement_hash, 'phase': phase, 'status': 'error',
+                             'sql': sql, 'error': str(error)})
+
+
+    def record_drops(self, kind, sql_list):
+        """ Records the drop statements for the objects of one type (eg. 'databases'),
+            replacing the ones recorded before
+        """
+
+        with self._lock:
+            self.drops[kind] = list(sql_list)
+            self._write({'kind': kind, 'drops': list(sql_list)})
+            self.sync()
+
+
+    def drop_list(self, kind = None):
+        """ Returns the recorded drop statements of one object type, or of all of them """
+
+        if kind is not None:
+            return list(self.drops.get(kind, []))
+
+        return [sql for sql_list in self.drops.values() for sql in sql_list]
+
+
+    def clear_drops(self, kind, phases = ()):
+        """ Records that the objects of one type were dropped. The statements of phases
+            (eg. the phase that created them and the grants on them) will be executed again
+        """
+
+        with self._lock:
+            self.drops.pop(kind, None)
+            self._forget(phases)
+            self._write({'cleared': kind, 'phases': list(phases)})
+            self.sync()
+
+
+    def reset(self):
+        """ Starts a new journal, everything will be executed again """
+
+        with self._lock:
+            self._file.close()
+            self._file = open(self.path, 'w')
+            self.completed = {}
+            self.drops = {}
+            self._unsynced = 0
+
+
+    def close(self):
+        with self._lock:
+            self.sync()
+            self._file.close()
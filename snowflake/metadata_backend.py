@@ -0,0 +1,456 @@
+import snowflake.connector
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ddl_parser import split_name
+from sql_builder import quote_identifier
+from target_diff import DEFAULT_ROLES, DEFAULT_DATABASES, DEFAULT_USERS
+
+
+
+def fetch_data_df(sql, connection, cache = None, log = print, metrics = None, fetch = None):
+    """ Fetch data from the source account in a dataframe.
+        Results are read from / written to the metadata cache when one is given.
+        fetch returns the dataframe of sql when it isn't a single query (eg. show + result_scan),
+        by default sql is read on connection. Errors are logged and None is returned
+    """
+
+    import pandas as pd
+
+    start = time.perf_counter()
+    df = None
+
+    if cache is not None:
+        df = cache.get(sql)
+        if df is not None:
+            if metrics is not None:
+                metrics.record_fetch(sql, time.perf_counter() - start, len(df), cached = True)
+            return df
+
+    try:
+        df = fetch() if fetch is not None else pd.read_sql(sql, connection)
+
+        if cache is not None:
+            cache.put(sql, df)
+
+        if metrics is not None:
+            metrics.record_fetch(sql, time.perf_counter() - start, len(df))
+
+    except snowflake.connector.errors.ProgrammingError as e:
+        log(e)
+        log('Error {0} ({1}): {2} ({3})'.format(e.errno, e.sqlstate, e.msg, e.sfqid))
+        if metrics is not None:
+            metrics.record_fetch(sql, time.perf_counter() - start, 0, error = e)
+
+    except Exception as error:
+        log(error)
+        log(f"fetching data failed for: \n  {sql}")
+        if metrics is not None:
+            metrics.record_fetch(sql, time.perf_counter() - start, 0, error = error)
+
+    return df
+
+
+
+def fetch_data_chunks(sql, connection, chunk_size = 100000, cache = None, log = print, metrics = None, fetch = None):
+    """ Fetch data from the source account as a generator of dataframes of up to chunk_size rows.
+        Only one chunk is held in memory at a time, so the query should do its own
+        filtering and column projection instead of select *.
+        fetch returns a generator of dataframes for sql when it isn't a single query.
+        The fetch time recorded in metrics doesn't include the time spent processing chunks.
+        Errors are logged and raised, also after some chunks were yielded: a truncated
+        result fails the phase reading it instead of being taken for the whole result
+    """
+
+    fetch_seconds = 0.0
+    rows = 0
+    error = None
+    cached = False
+
+    try:
+        if cache is not None:
+            chunks = cache.iter_chunks(sql, chunk_size)
+            cached = chunks is not None
+
+        if not cached:
+            chunks = _fetch_chunks(sql, connection, chunk_size, cache, log, fetch)
+
+        while True:
+            start = time.perf_counter()
+            df = next(chunks, None)
+            fetch_seconds += time.perf_counter() - start
+
+            if df is None:
+                break
+
+            rows += len(df)
+            yield df
+
+    except Exception as e:
+        error = e
+        raise
+
+    finally:
+        if metrics is not None:
+            metrics.record_fetch(sql, fetch_seconds, rows, error = error, cached = cached)
+
+
+
+def _fetch_chunks(sql, connection, chunk_size, cache, log, fetch = None):
+    """ Streams a query from the source account, writing it to the cache when there is one.
+        Errors are logged and raised
+    """
+
+    def stream():
+        import pandas as pd
+
+        cur = connection.cursor()
+        try:
+            cur.execute(sql)
+            columns = [col[0] for col in cur.description]
+
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield pd.DataFrame(rows, columns = columns)
+        finally:
+            cur.close()
+
+    chunks = fetch() if fetch is not None else stream()
+
+    try:
+        if cache is not None:
+            yield from cache.put_chunks(sql, chunks)
+        else:
+            yield from chunks
+
+    except snowflake.connector.errors.ProgrammingError as e:
+        log(e)
+        log('Error {0} ({1}): {2} ({3})'.format(e.errno, e.sqlstate, e.msg, e.sfqid))
+        raise
+
+    except Exception as error:
+        log(error)
+        log(f"fetching data failed for: \n  {sql}")
+        raise
+
+
+
+# object types whose grants are replicated, in the order of the account_usage query
+OBJECT_GRANT_TYPES = ['WAREHOUSE', 'DATABASE', 'SCHEMA', 'TABLE', 'VIEW']
+
+# columns of the object grants, ordered so the privileges of an object and grantee arrive together
+OBJECT_GRANT_COLUMNS = ['PRIVILEGE', 'GRANTED_ON', 'NAME', 'TABLE_SCHEMA', 'TABLE_CATALOG', 'GRANTEE_NAME',
+                        'GRANT_OPTION']
+OBJECT_GRANT_ORDER = ['GRANTED_ON', 'TABLE_CATALOG', 'TABLE_SCHEMA', 'NAME', 'GRANTEE_NAME', 'GRANT_OPTION']
+
+
+
+class account_usage_backend:
+    """
+    Reads roles, users and grants from the snowflake.account_usage views, one bulk query per phase.
+    The views lag behind the account (by up to 2 hours for grants) and need a role that can read
+    the snowflake database
+
+    Every backend returns the same columns:
+        roles: NAME
+        users: NAME, LOGIN_NAME, DISPLAY_NAME, DEFAULT_ROLE, EMAIL
+        user_role_grants: ROLE, GRANTEE_NAME (chunks)
+        role_role_grants: NAME, GRANTEE_NAME (chunks)
+        role_object_grants: OBJECT_GRANT_COLUMNS ordered by OBJECT_GRANT_ORDER (chunks)
+
+    Attributes:
+        pool : session_pool
+            pool of the account, not used by this backend
+        chunk_size : int
+            number of grant rows per dataframe
+        cache : metadata_cache
+            cache of the results, None reads the account every time
+        metrics : run_metrics
+            where the queries are recorded, None doesn't record them
+        max_workers : int
+            not used by this backend
+
+    """
+
+    name = 'account_usage'
+
+    def __init__(self, pool = None, chunk_size = 100000, cache = None, metrics = None, max_workers = 4):
+        self.pool = pool
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.metrics = metrics
+        self.max_workers = max_workers
+
+
+    def roles(self, conn):
+        # don't re-create default roles
+        sql = """select name from snowflake.account_usage.roles
+                    where deleted_on is null and
+                    name not like 'PUBLIC' and
+                    name not like 'ACCOUNTADMIN' and
+                    name not like 'SECURITYADMIN' and
+                    name not like 'ORGADMIN' and
+                    name not like 'USERADMIN' and
+                    name not like 'SYSADMIN';"""
+
+        return fetch_data_df(sql, conn, cache = self.cache, metrics = self.metrics)
+
+
+    def users(self, conn):
+        ## Ingore default snowflake role and the user who was used to create the account
+        sql = """select name, login_name, display_name, default_role, email
+                from snowflake.account_usage.users
+                where deleted_on is null and
+                name not like 'SNOWFLAKE' and
+                created_on not in (SELECT min(created_on) FROM snowflake.account_usage.users);"""
+
+        return fetch_data_df(sql, conn, cache = self.cache, metrics = self.metrics)
+
+
+    def user_role_grants(self, conn):
+        sql = """select role, grantee_name
+                 from snowflake.account_usage.grants_to_users
+                 where deleted_on is null;"""
+
+        return fetch_data_chunks(sql, conn, self.chunk_size, cache = self.cache, metrics = self.metrics)
+
+
+    def role_role_grants(self, conn):
+        sql = """select name, grantee_name
+                 from snowflake.account_usage.grants_to_roles
+                 where granted_on = 'ROLE' and deleted_on is null;"""
+
+        return fetch_data_chunks(sql, conn, self.chunk_size, cache = self.cache, metrics = self.metrics)
+
+
+    def role_object_grants(self, conn):
+        # only supported objects, no snowflake objects.
+        sql = """select privilege, granted_on, name, table_schema, table_catalog, grantee_name, grant_option
+                 from snowflake.account_usage.grants_to_roles
+                 where granted_on in ('WAREHOUSE', 'DATABASE', 'SCHEMA', 'TABLE', 'VIEW') and
+                 name not in ('SNOWFLAKE_SAMPLE_DATA', 'SNOWFLAKE') and
+                 deleted_on is null
+                 order by granted_on, table_catalog, table_schema, name, grantee_name, grant_option;"""
+
+        return fetch_data_chunks(sql, conn, self.chunk_size, cache = self.cache, metrics = self.metrics)
+
+
+
+class show_backend:
+    """
+    Reads roles, users and grants with SHOW commands, which see the account as it is right now
+    and only need the privileges of the objects shown (no access to the snowflake database)
+    - the rows of a show command stay in the account: only the columns a phase needs are read,
+      with a projection over result_scan of its query id
+    - grants are read per role: every "show grants of role" / "show grants to role" runs once,
+      on up to max_workers pooled connections at a time, then the results of scan_batch roles are
+      read together with one union of result_scans. The user and role grant phases share the
+      show grants of role queries
+
+    Same columns as account_usage_backend
+
+    Attributes:
+        pool : session_pool
+            pool of the account the show commands of a fan-out run on. None runs them on the
+            connection of the phase, one at a time
+        chunk_size : int
+            not used, grant results are read scan_batch roles at a time
+        cache : metadata_cache
+            cache of the results, None reads the account every time
+        metrics : run_metrics
+            where the queries are recorded, None doesn't record them
+        max_workers : int
+            number of show commands of a fan-out running at the same time
+        scan_batch : int
+            number of show results read with one result_scan query
+
+    """
+
+    name = 'show'
+
+    def __init__(self, pool = None, chunk_size = 100000, cache = None, metrics = None, max_workers = 4,
+                 scan_batch = 100):
+        self.pool = pool
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.metrics = metrics
+        self.max_workers = max_workers
+        self.scan_batch = scan_batch
+
+        self._query_ids = {}
+        self._fan_out_locks = {}
+        self._all_roles = None
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def _scan_sql(projection, query_ids):
+        return "\nunion all\n".join(f"select {projection} from table(result_scan('{query_id}'))"
+                                   for query_id in query_ids)
+
+
+    @staticmethod
+    def _read(cur, sql):
+        import pandas as pd
+
+        cur.execute(sql)
+        return pd.DataFrame(cur.fetchall(), columns = [col[0] for col in cur.description])
+
+
+    def _show(self, conn, show_sql, projection):
+        """ The projected columns of a show command (projection uses the lowercase show columns) """
+
+        sql = f"{show_sql};\nselect {projection} from table(result_scan(last_query_id()))"
+
+        def fetch():
+            cur = conn.cursor()
+            try:
+                cur.execute(show_sql)
+                return self._read(cur, self._scan_sql(projection, [cur.sfqid]))
+            finally:
+                cur.close()
+
+        return fetch_data_df(sql, conn, cache = self.cache, metrics = self.metrics, fetch = fetch)
+
+
+    def _all_role_names(self, conn):
+        with self._lock:
+            if self._all_roles is None:
+                df_roles = self._show(conn, "show roles", '"name" as NAME')
+                self._all_roles = df_roles['NAME'].values.tolist()
+
+        return self._all_roles
+
+
+    def _fan_out(self, conn, show_template, names):
+        """ Query ids of show_template (eg. 'show grants to role {}') for every name.
+            The show commands run once, later calls reuse their results
+        """
+
+        def run(conn, sql):
+            cur = conn.cursor()
+            try:
+                cur.execute(sql)
+                return cur.sfqid
+            finally:
+                cur.close()
+
+        def worker(sql):
+            with self.pool.connection() as pooled_conn:
+                return run(pooled_conn, sql)
+
+        # phases waiting for the same show commands wait for the first one to run them
+        with self._lock:
+            lock = self._fan_out_locks.setdefault(show_template, threading.Lock())
+
+        with lock:
+            if show_template not in self._query_ids:
+                show_sqls = [show_template.format(quote_identifier(name)) for name in names]
+
+                if self.pool is None or self.max_workers <= 1:
+                    query_ids = [run(conn, sql) for sql in show_sqls]
+                else:
+                    with ThreadPoolExecutor(max_workers = self.max_workers) as executor:
+                        query_ids = list(executor.map(worker, show_sqls))
+
+                self._query_ids[show_template] = query_ids
+
+        return self._query_ids[show_template]
+
+
+    def _grants(self, conn, show_template, projection, transform):
+        """ Chunks of the projected grants of every role, transform filters / reshapes each chunk """
+
+        sql = f"{show_template.format('<role>')} for every role;\nselect {projection} from table(result_scan(...))"
+
+        def fetch():
+            query_ids = self._fan_out(conn, show_template, self._all_role_names(conn))
+            cur = conn.cursor()
+            try:
+                for i in range(0, len(query_ids), self.scan_batch):
+                    df = transform(self._read(cur, self._scan_sql(projection, query_ids[i:i + self.scan_batch])))
+                    if not df.empty:
+                        yield df
+            finally:
+                cur.close()
+
+        return fetch_data_chunks(sql, conn, self.chunk_size, cache = self.cache, metrics = self.metrics,
+                                 fetch = fetch)
+
+
+    def roles(self, conn):
+        df_roles = self._show(conn, "show roles", '"name" as NAME')
+
+        # don't re-create default roles
+        return df_roles[~df_roles['NAME'].isin(DEFAULT_ROLES)].reset_index(drop = True)
+
+
+    def users(self, conn):
+        projection = '"name" as NAME, "login_name" as LOGIN_NAME, "display_name" as DISPLAY_NAME, ' \
+                     '"default_role" as DEFAULT_ROLE, "email" as EMAIL, "created_on" as CREATED_ON'
+        df_users = self._show(conn, "show users", projection)
+
+        # the default snowflake user and the user who was used to create the account are left out,
+        # properties that aren't set are shown as empty strings
+        df_users = df_users[~df_users['NAME'].isin(DEFAULT_USERS) &
+                            (df_users['CREATED_ON'] != df_users['CREATED_ON'].min())]
+
+        return df_users.drop(columns = 'CREATED_ON').replace({'': None}).reset_index(drop = True)
+
+
+    def user_role_grants(self, conn):
+        projection = '"role" as ROLE, "granted_to" as GRANTED_TO, "grantee_name" as GRANTEE_NAME'
+
+        def users(df):
+            return df.loc[df['GRANTED_TO'] == 'USER', ['ROLE', 'GRANTEE_NAME']]
+
+        return self._grants(conn, 'show grants of role {}', projection, users)
+
+
+    def role_role_grants(self, conn):
+        projection = '"role" as NAME, "granted_to" as GRANTED_TO, "grantee_name" as GRANTEE_NAME'
+
+        def roles(df):
+            return df.loc[df['GRANTED_TO'] == 'ROLE', ['NAME', 'GRANTEE_NAME']]
+
+        return self._grants(conn, 'show grants of role {}', projection, roles)
+
+
+    def role_object_grants(self, conn):
+        projection = '"privilege" as PRIVILEGE, "granted_on" as GRANTED_ON, "name" as FULL_NAME, ' \
+                     '"grantee_name" as GRANTEE_NAME, "grant_option" as GRANT_OPTION'
+
+        def objects(df):
+            df = df[df['GRANTED_ON'].isin(OBJECT_GRANT_TYPES)]
+
+            # show has the qualified name, account_usage the name and the database / schema it is in
+            parts = [split_name(name) for name in df['FULL_NAME'].values.tolist()]
+            df = df.assign(NAME = [name[-1] for name in parts],
+                           TABLE_SCHEMA = [name[-2] if len(name) == 3 else None for name in parts],
+                           TABLE_CATALOG = [name[0] if len(name) > 1 else None for name in parts])
+
+            # only supported objects, no snowflake objects
+            df = df[~df['NAME'].isin(DEFAULT_DATABASES)]
+
+            return df[OBJECT_GRANT_COLUMNS].sort_values(OBJECT_GRANT_ORDER).reset_index(drop = True)
+
+        return self._grants(conn, 'show grants to role {}', projection, objects)
+
+
+
+METADATA_BACKENDS = {backend.name: backend for backend in [account_usage_backend, show_backend]}
+
+
+
+def metadata_backend(name, pool = None, chunk_size = 100000, cache = None, metrics = None, max_workers = 4):
+    """ A metadata backend by name ('account_usage' or 'show') """
+
+    if name not in METADATA_BACKENDS:
+        raise ValueError(f"unknown metadata backend {name!r}, use one of {sorted(METADATA_BACKENDS)}")
+
+    return METADATA_BACKENDS[name](pool = pool, chunk_size = chunk_size, cache = cache, metrics = metrics,
+                                   max_workers = max_workers)
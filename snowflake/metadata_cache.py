@@ -0,0 +1,155 @@
+import contextlib
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+
+class metadata_cache:
+    """
+    A local sqlite cache for query results read from a source account
+
+    Attributes:
+        path : str
+            the path of the sqlite file the results are stored in (created if missing)
+        account : str
+            the source account the results belong to, part of the cache key
+        ttl : int
+            number of seconds a cached result stays valid. None keeps results until invalidated
+
+    """
+
+    def __init__(self, path, account, ttl = 3600):
+        self.path = path
+        self.account = account
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute("""create table if not exists cache_index (
+                                key text primary key,
+                                account text,
+                                query text,
+                                table_name text,
+                                created_at real)""")
+            conn.commit()
+
+
+    def _connect(self):
+        # a new connection per call so the cache can be shared by worker threads
+        return contextlib.closing(sqlite3.connect(self.path, timeout = 60))
+
+
+    def _key(self, sql):
+        # only whitespace is normalized: quoted identifiers and literals are case sensitive
+        normalized_sql = " ".join(sql.split())
+        return hashlib.sha256(f"{self.account}\n{normalized_sql}".encode()).hexdigest()
+
+
+    def get(self, sql):
+        """ Returns the cached dataframe for a query, or None if it is missing or expired """
+
+        key = self._key(sql)
+
+        with self._connect() as conn:
+            row = conn.execute("select table_name, created_at from cache_index where key = ?", (key,)).fetchone()
+
+            if row is None:
+                return None
+
+            table_name, created_at = row
+            if self.ttl is not None and time.time() - created_at > self.ttl:
+                return None
+
+            try:
+                import pandas as pd
+                return pd.read_sql(f'select * from "{table_name}"', conn)
+            except Exception:
+                # the index and the result table are out of sync, treat it as a miss
+                return None
+
+
+    def put(self, sql, df):
+        """ Stores the result of a query, replacing any previous result """
+
+        key = self._key(sql)
+        table_name = f"result_{key[:32]}"
+
+        with self._lock, self._connect() as conn:
+            df.to_sql(table_name, conn, if_exists = 'replace', index = False)
+            conn.execute("insert or replace into cache_index values (?, ?, ?, ?, ?)",
+                         (key, self.account, sql, table_name, time.time()))
+            conn.commit()
+
+
+    def iter_chunks(self, sql, chunk_size):
+        """ Returns a generator over the cached result of a query in dataframes of
+            chunk_size rows, or None if it is missing or expired
+        """
+
+        key = self._key(sql)
+
+        with self._connect() as conn:
+            row = conn.execute("select table_name, created_at from cache_index where key = ?", (key,)).fetchone()
+
+        if row is None:
+            return None
+
+        table_name, created_at = row
+        if self.ttl is not None and time.time() - created_at > self.ttl:
+            return None
+
+        def chunks():
+            import pandas as pd
+
+            with self._connect() as conn:
+                for df in pd.read_sql(f'select * from "{table_name}"', conn, chunksize = chunk_size):
+                    yield df
+
+        return chunks()
+
+
+    def put_chunks(self, sql, chunks):
+        """ Passes chunks of a query result through while appending them to the cache.
+            The result is only registered once every chunk has been written
+        """
+
+        key = self._key(sql)
+        table_name = f"result_{key[:32]}"
+        if_exists = 'replace'
+
+        for df in chunks:
+            with self._lock, self._connect() as conn:
+                df.to_sql(table_name, conn, if_exists = if_exists, index = False)
+                conn.commit()
+            if_exists = 'append'
+
+            yield df
+
+        # nothing was written, there is no table to register
+        if if_exists == 'replace':
+            return
+
+        with self._lock, self._connect() as conn:
+            conn.execute("insert or replace into cache_index values (?, ?, ?, ?, ?)",
+                         (key, self.account, sql, table_name, time.time()))
+            conn.commit()
+
+
+    def invalidate(self, sql = None):
+        """ Removes the cached result of one query, or every result for the account if sql is None """
+
+        with self._lock, self._connect() as conn:
+            if sql is None:
+                rows = conn.execute("select key, table_name from cache_index where account = ?",
+                                    (self.account,)).fetchall()
+            else:
+                rows = conn.execute("select key, table_name from cache_index where key = ?",
+                                    (self._key(sql),)).fetchall()
+
+            for key, table_name in rows:
+                conn.execute(f'drop table if exists "{table_name}"')
+                conn.execute("delete from cache_index where key = ?", (key,))
+
+            conn.commit()
@@ -0,0 +1,106 @@
+from fnmatch import fnmatchcase
+
+from ddl_parser import split_name
+
+
+
+def like_pattern(glob):
+    """ A glob (* and ?) as a LIKE pattern for SHOW ... LIKE, eg. 'SALES_*' -> 'SALES_%'.
+        _ and % aren't escaped, the pattern can match more names than the glob: names are
+        always checked against the glob as well. None when it can't be expressed with LIKE
+    """
+
+    if '[' in glob or '\\' in glob:
+        return None
+
+    return glob.replace('*', '%').replace('?', '_').replace("'", "''")
+
+
+
+class object_selector:
+    """
+    Selects the databases, schemas and objects (tables, views, sequences, ...) that are replicated.
+    Patterns are globs matched case-insensitively against each part of a name:
+    'SALES' is a whole database, 'SALES.RAW_*' schemas of it, 'SALES.*.FACT_?' objects.
+    An object is selected when a pattern of include covers it and no pattern of exclude does.
+
+    The selection is pushed down to the source: only the parts of a database that are selected
+    are read (get_ddl of a whole database, of single schemas or of single objects), and
+    SHOW ... LIKE is used when the names of a level come from a single pattern
+
+    Attributes:
+        include : list
+            patterns of the selected databases / schemas / objects. None selects everything
+        exclude : list
+            patterns of the databases / schemas / objects left out
+
+    """
+
+    def __init__(self, include = None, exclude = None):
+        self.include = [tuple(split_name(pattern)) for pattern in (include or ['*'])]
+        self.exclude = [tuple(split_name(pattern)) for pattern in (exclude or [])]
+
+        for pattern in self.include + self.exclude:
+            if not 1 <= len(pattern) <= 3:
+                raise ValueError(f"patterns have 1 to 3 parts (database.schema.object): {'.'.join(pattern)}")
+
+
+    @staticmethod
+    def _matches(pattern, path):
+        """ The parts that pattern and path have in common match """
+
+        return all(fnmatchcase(str(name).upper(), glob.upper()) for glob, name in zip(pattern, path))
+
+
+    def includes(self, *path):
+        """ Whether a database, schema or object (or something inside of it) is selected """
+
+        return any(self._matches(pattern, path) for pattern in self.include) and \
+               not any(self._matches(pattern, path) for pattern in self.exclude if len(pattern) <= len(path))
+
+
+    def includes_all(self, *path):
+        """ Whether everything in a database or schema is selected, so it can be read as a whole """
+
+        return self.includes(*path) and \
+               any(self._matches(pattern, path) for pattern in self.include if len(pattern) <= len(path)) and \
+               not any(self._matches(pattern, path) for pattern in self.exclude if len(pattern) > len(path))
+
+
+    def like(self, *path):
+        """ LIKE pattern for the names one level below path (databases for no path), None when the
+            selected names can't be narrowed down to a single pattern
+        """
+
+        if any(self._matches(pattern, path) for pattern in self.include if len(pattern) <= len(path)):
+            return None
+
+        globs = {pattern[len(path)] for pattern in self.include if self._matches(pattern, path)}
+        if len(globs) != 1:
+            return None
+
+        like = like_pattern(globs.pop())
+        return None if like == '%' else like
+
+
+    def is_everything(self):
+        return self.include == [('*',)] and not self.exclude
+
+
+    def selected_grants(self, df):
+        """ The rows of grants_to_roles whose database, schema, table or view is selected """
+
+        if self.is_everything() or df.empty:
+            return df
+
+        def selected(row):
+            if row.GRANTED_ON == 'DATABASE':
+                return self.includes(row.NAME)
+            if row.GRANTED_ON == 'SCHEMA':
+                return self.includes(row.TABLE_CATALOG, row.NAME)
+            if row.GRANTED_ON in ('TABLE', 'VIEW'):
+                return self.includes(row.TABLE_CATALOG, row.TABLE_SCHEMA, row.NAME)
+            return True
+
+        mask = [selected(row) for row in df[['GRANTED_ON', 'NAME', 'TABLE_SCHEMA', 'TABLE_CATALOG']].itertuples()]
+        return df[mask]
@@ -0,0 +1,122 @@
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+
+class phase_scheduler:
+    """
+    Runs phases as a dependency graph: a phase starts as soon as all of its
+    prerequisites have finished, phases that don't depend on each other run concurrently
+
+    Attributes:
+        max_workers : int
+            number of phases that can run at the same time
+
+    """
+
+    def __init__(self, max_workers = 4):
+        self.max_workers = max_workers
+        self.phases = {}
+        self.depends_on = {}
+        self.timings = {}
+        self.errors = {}
+
+
+    def add(self, name, func, depends_on = ()):
+        """ Adds a phase. depends_on lists the names of phases that must finish first """
+
+        for dependency in depends_on:
+            assert dependency in self.phases, f"Error: {name} depends on unknown phase {dependency}"
+
+        self.phases[name] = func
+        self.depends_on[name] = list(depends_on)
+
+
+    def run(self):
+        """ Runs every phase and returns {phase: (start, end)} in seconds from the start of the run.
+            Phases whose prerequisites failed are skipped
+        """
+
+        self.timings = {}
+        self.errors = {}
+        skipped = set()
+        remaining = dict(self.depends_on)
+        running = {}
+        run_start = time.perf_counter()
+
+        def submit_ready(executor):
+            for name, dependencies in list(remaining.items()):
+                if any(dependency in self.errors or dependency in skipped for dependency in dependencies):
+                    print(f"skipping {name}: a prerequisite failed")
+                    skipped.add(name)
+                    del remaining[name]
+
+                elif all(dependency in self.timings for dependency in dependencies):
+                    del remaining[name]
+                    running[executor.submit(self._run_phase, name, run_start)] = name
+
+        with ThreadPoolExecutor(max_workers = max(1, self.max_workers)) as executor:
+            submit_ready(executor)
+
+            while running:
+                done, _ = wait(running, return_when = FIRST_COMPLETED)
+
+                for future in done:
+                    name = running.pop(future)
+                    start, end, error = future.result()
+
+                    if error is None:
+                        self.timings[name] = (start, end)
+                    else:
+                        self.errors[name] = error
+                        print(error)
+                        print(f"phase failed: {name}")
+
+                submit_ready(executor)
+
+        return self.timings
+
+
+    def _run_phase(self, name, run_start):
+        start = time.perf_counter() - run_start
+        error = None
+
+        try:
+            self.phases[name]()
+        except Exception as e:
+            error = e
+
+        return start, time.perf_counter() - run_start, error
+
+
+    def critical_path(self):
+        """ The chain of phases that determined the total run time: starting from the phase
+            that finished last, follow the prerequisite that finished last
+        """
+
+        if not self.timings:
+            return []
+
+        path = [max(self.timings, key = lambda name: self.timings[name][1])]
+
+        while True:
+            dependencies = [dependency for dependency in self.depends_on[path[0]] if dependency in self.timings]
+            if not dependencies:
+                break
+            path.insert(0, max(dependencies, key = lambda name: self.timings[name][1]))
+
+        return path
+
+
+    def report(self):
+        """ Prints the wall time of each phase and the critical path """
+
+        print(f"{'phase':<25}{'start (s)':>12}{'wall time (s)':>16}")
+        for name, (start, end) in sorted(self.timings.items(), key = lambda item: item[1][0]):
+            print(f"{name:<25}{start:>12.1f}{end - start:>16.1f}")
+
+        path = self.critical_path()
+        if path:
+            total = self.timings[path[-1]][1]
+            print(f"critical path ({total:.1f}s): " + " -> ".join(path))
@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from transcribe import execute_sql_list, drop_levels
+from session_pool import session_pool
+from execution_controller import execution_controller
+from phase_scheduler import phase_scheduler
+from replication_plan import read_plan
+
+
+
+class plan_replayer:
+    """
+    Replays a plan written by transcribe_snowflake_account.compile_plan on a target account.
+    Phases run as a dependency graph, the groups of a phase (eg. one per database) run
+    concurrently and statements are sent in large multi-statement batches
+
+    Attributes:
+        config_file : str
+            the path of the config file that contains the target account credentials
+        target_config_name : str
+            the name of the header in the config file for the target account credentials
+        conn_type_target : str
+            target account authentication type. can be 'password' or 'private_key'
+        max_workers : int
+            number of groups replayed at the same time, each on its own pooled connection
+        batch_size : int
+            number of statements sent per request
+        return_sql : bool
+            if true all of the sql statements that are executed will be printed
+        max_retries : int
+            number of times a request that fails with a transient error is retried, see execution_controller.
+            The controller also lowers the number of groups replayed at the same time when the account throttles
+
+    """
+
+    def __init__(self,
+                 config_file,
+                 target_config_name = 'snowflake_target_account',
+                 conn_type_target = 'private_key',
+                 max_workers = 8,
+                 batch_size = 200,
+                 return_sql = False,
+                 max_retries = 5):
+
+        self.config_file = config_file
+        self.target_config_name = target_config_name
+        self.conn_type_target = conn_type_target
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.return_sql = return_sql
+        self.controller = execution_controller(max_in_flight = max_workers, max_retries = max_retries)
+
+        self.pool = session_pool(config_file, target_config_name, conn_type_target, size = max_workers)
+
+
+    def _replay_group(self, sql_list):
+        """ Replays the statements of one group in order on a pooled connection """
+
+        log_lines = []
+
+        def log(*args):
+            log_lines.append(" ".join(str(arg) for arg in args))
+
+        with self.pool.connection() as conn:
+            execute_sql_list(sql_list, conn.cursor(), return_sql = self.return_sql, return_errors = True,
+                             log = log, batch_size = self.batch_size, controller = self.controller)
+
+        return log_lines
+
+
+    def _replay_phase(self, groups):
+        """ Replays the groups of one phase concurrently """
+
+        with ThreadPoolExecutor(max_workers = max(1, self.max_workers)) as executor:
+            futures = [executor.submit(self._replay_group, sql_list) for sql_list in groups.values()]
+
+            for future in as_completed(futures):
+                for line in future.result():
+                    print(line)
+
+
+    def replay(self, path, max_parallel_phases = 4):
+        """ Executes every phase of a plan on the target account """
+
+        header, phases = read_plan(path)
+        print(f"replaying plan compiled from {header['source_account']} at {header['created_at']}")
+
+        scheduler = phase_scheduler(max_workers = max_parallel_phases)
+        for phase, depends_on in header['depends_on'].items():
+            groups = phases.get(phase, {})
+            scheduler.add(phase, lambda groups = groups: self._replay_phase(groups),
+                          depends_on = [dependency for dependency in depends_on if dependency in header['depends_on']])
+
+        try:
+            scheduler.run()
+        finally:
+            self.pool.close()
+
+        scheduler.report()
+
+
+    def drop(self, path):
+        """ Executes the drop statements of a plan on the target account, level by level
+            in reverse dependency order (see transcribe.DROP_LEVELS), each level spread over max_workers
+        """
+
+        _, phases = read_plan(path)
+        sql_list = [sql for group in phases.get('drop', {}).values() for sql in group]
+
+        workers = max(1, self.max_workers)
+        try:
+            for level in drop_levels(sql_list):
+                self._replay_phase({i: level[i::workers] for i in range(min(workers, len(level)))})
+        finally:
+            self.pool.close()
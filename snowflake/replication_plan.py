@@ -0,0 +1,78 @@
+import json
+import threading
+import time
+
+
+
+PLAN_VERSION = 1
+
+
+
+class replication_plan:
+    """
+    An ordered replication plan: every statement copy_account would execute on the target,
+    plus the drop statements. Written to disk as json lines while it is being compiled
+
+    Attributes:
+        path : str
+            the path of the plan file
+        source_account : str
+            the account the plan was compiled from
+        depends_on : dict
+            {phase: [phases that must finish first]}, used by the replay to run phases concurrently
+
+    """
+
+    def __init__(self, path, source_account = None, depends_on = None):
+        self.path = path
+        self.source_account = source_account
+        self.depends_on = depends_on or {}
+        self.statement_count = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+
+    def __enter__(self):
+        self._file = open(self.path, 'w')
+        self._write({'plan_version': PLAN_VERSION,
+                     'source_account': self.source_account,
+                     'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'depends_on': self.depends_on})
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+        self._file = None
+
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+
+
+    def add(self, phase, sql_list, group = ""):
+        """ Appends statements to a phase. Statements of one group are replayed in order
+            on one connection, different groups of a phase can be replayed concurrently
+        """
+
+        with self._lock:
+            for sql in sql_list:
+                self._write({'phase': phase, 'group': group, 'sql': sql.strip()})
+                self.statement_count += 1
+
+
+
+def read_plan(path):
+    """ Reads a plan file. Returns (header, {phase: {group: [sql]}}), phases and groups in plan order """
+
+    phases = {}
+
+    with open(path) as f:
+        header = json.loads(f.readline())
+        assert header.get('plan_version') == PLAN_VERSION, f"Error: unsupported plan file: {path}"
+
+        for line in f:
+            record = json.loads(line)
+            phases.setdefault(record['phase'], {}).setdefault(record['group'], []).append(record['sql'])
+
+    return header, phases
@@ -0,0 +1,257 @@
+import heapq
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+
+from ddl_parser import classify_statement
+
+
+
+def statement_class(sql):
+    """ Short class of a statement for reporting, eg. 'CREATE TABLE', 'ALTER USER' or 'GRANT' """
+
+    statement = classify_statement(sql)
+    if statement is None:
+        return 'OTHER'
+
+    verb, object_type, _ = statement
+
+    # the word after GRANT / REVOKE is a privilege, not an object type
+    if verb in ('GRANT', 'REVOKE'):
+        return verb
+
+    return f"{verb} {object_type}"
+
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+
+class run_metrics:
+    """
+    Collects timings for a run: every source fetch, every phase and every statement
+    executed on the target. Statements are aggregated per statement class, only the
+    slowest ones are kept individually
+
+    Attributes:
+        top_n : int
+            number of slowest statements kept for the report
+
+    """
+
+    def __init__(self, top_n = 20):
+        self.top_n = top_n
+        self.started_at = time.time()
+        self.phases = {}
+        self.fetches = []
+        self.statements = {}
+        self.table_copies = []
+        self.execution = {}
+        self._slowest = []
+        self._counter = 0
+        self._lock = threading.Lock()
+
+
+    @contextmanager
+    def phase(self, name):
+        """ Times a phase, errors raised in the phase are counted and re-raised """
+
+        start = time.perf_counter()
+        error = None
+
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            with self._lock:
+                phase = self._phase(name)
+                phase['seconds'] += time.perf_counter() - start
+                phase['runs'] += 1
+                phase['failed'] += error is not None
+
+
+    def _phase(self, name):
+        return self.phases.setdefault(name, {'seconds': 0.0, 'runs': 0, 'failed': 0, 'statements': 0, 'errors': 0})
+
+
+    def record_backend(self, phase, backend):
+        """ Records the metadata backend a phase read the source account with (see metadata_backend) """
+
+        with self._lock:
+            self._phase(phase)['backend'] = backend
+
+
+    def record_fetch(self, sql, seconds, rows, error = None, cached = False):
+        """ Records one query on the source account """
+
+        with self._lock:
+            self.fetches.append({'sql': " ".join(sql.split())[:200], 'seconds': seconds, 'rows': rows,
+                                 'error': None if error is None else str(error), 'cached': cached})
+
+
+    def record_statement(self, sql, seconds, error = None, phase = None):
+        """ Records one statement executed on the target account """
+
+        sql_class = statement_class(sql)
+
+        with self._lock:
+            statements = self.statements.setdefault(sql_class, {'count': 0, 'errors': 0, 'seconds': 0.0,
+                                                                 'max_seconds': 0.0})
+            statements['count'] += 1
+            statements['errors'] += error is not None
+            statements['seconds'] += seconds
+            statements['max_seconds'] = max(statements['max_seconds'], seconds)
+
+            if phase is not None:
+                phase_metrics = self._phase(phase)
+                phase_metrics['statements'] += 1
+                phase_metrics['errors'] += error is not None
+
+            # min heap of the slowest statements, the counter breaks ties
+            self._counter += 1
+            entry = (seconds, self._counter, sql_class, phase, " ".join(sql.split())[:500],
+                     None if error is None else str(error))
+            if len(self._slowest) < self.top_n:
+                heapq.heappush(self._slowest, entry)
+            elif seconds > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+
+    def record_table_copy(self, result):
+        """ Records the data copy of one table (see data_copy.copy_table_data) """
+
+        with self._lock:
+            self.table_copies.append(dict(result, rows_per_second = result['rows'] / result['seconds']
+                                          if result['seconds'] else 0.0))
+
+
+    def record_execution(self, report):
+        """ Records the retries and the limit of requests in flight of the execution controller """
+
+        with self._lock:
+            self.execution = dict(report)
+
+
+    def slowest_statements(self):
+        with self._lock:
+            slowest = sorted(self._slowest, reverse = True)
+
+        return [{'seconds': seconds, 'statement_class': sql_class, 'phase': phase, 'sql': sql, 'error': error}
+                for seconds, _, sql_class, phase, sql, error in slowest]
+
+
+    def report(self):
+        """ The run report as a dict """
+
+        with self._lock:
+            report = {'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+                      'seconds': time.time() - self.started_at,
+                      'phases': {name: dict(phase) for name, phase in self.phases.items()},
+                      'statements': {name: dict(statements) for name, statements in self.statements.items()},
+                      'fetches': list(self.fetches),
+                      'table_copies': list(self.table_copies),
+                      'execution': dict(self.execution)}
+
+        report['slowest_statements'] = self.slowest_statements()
+
+        return report
+
+
+    def to_json(self, path):
+        """ Writes the run report as json """
+
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent = 2, default = str)
+
+
+    def to_prometheus(self, path):
+        """ Writes the metrics in the prometheus text format (eg. for the node exporter textfile collector) """
+
+        report = self.report()
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f"# HELP snow_transcribe_{name} {help_text}")
+            lines.append(f"# TYPE snow_transcribe_{name} gauge")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{_label(val)}"' for key, val in labels.items())
+                label_text = f"{{{label_text}}}" if label_text else ""
+                lines.append(f"snow_transcribe_{name}{label_text} {value}")
+
+        metric('run_seconds', "Wall time of the run", [({}, report['seconds'])])
+        metric('phase_seconds', "Wall time of each phase",
+               [({'phase': name}, phase['seconds']) for name, phase in report['phases'].items()])
+        metric('phase_statements', "Statements executed by each phase",
+               [({'phase': name}, phase['statements']) for name, phase in report['phases'].items()])
+        metric('phase_errors', "Failed statements of each phase",
+               [({'phase': name}, phase['errors']) for name, phase in report['phases'].items()])
+        metric('phase_metadata_backend', "Metadata backend each phase read roles, users or grants with",
+               [({'phase': name, 'backend': phase['backend']}, 1) for name, phase in report['phases'].items()
+                if 'backend' in phase])
+        metric('statements', "Statements executed per statement class",
+               [({'statement_class': name}, s['count']) for name, s in report['statements'].items()])
+        metric('statement_errors', "Failed statements per statement class",
+               [({'statement_class': name}, s['errors']) for name, s in report['statements'].items()])
+        metric('statement_seconds', "Time spent executing statements per statement class",
+               [({'statement_class': name}, s['seconds']) for name, s in report['statements'].items()])
+        metric('fetch_seconds', "Time spent reading the source account",
+               [({}, sum(fetch['seconds'] for fetch in report['fetches']))])
+        metric('fetch_rows', "Rows read from the source account",
+               [({}, sum(fetch['rows'] or 0 for fetch in report['fetches']))])
+        metric('table_copy_rows', "Rows copied per table",
+               [({'table': copy['table']}, copy['rows']) for copy in report['table_copies']])
+        metric('table_copy_rows_per_second', "Copy throughput per table",
+               [({'table': copy['table']}, copy['rows_per_second']) for copy in report['table_copies']])
+        metric('table_copy_errors', "Tables whose data could not be copied or whose row counts differ",
+               [({}, sum(copy['error'] is not None for copy in report['table_copies']))])
+        metric('retries', "Statements retried after a transient error",
+               [({}, report['execution'].get('retries', 0))])
+        metric('throttled', "Requests rejected by throttling",
+               [({}, report['execution'].get('throttled', 0))])
+        metric('in_flight_limit', "Limit of requests in flight at the end of the run",
+               [({}, report['execution'].get('window', 0))])
+        metric('slowest_statement_seconds', "The slowest statements of the run",
+               [({'rank': rank, 'statement_class': s['statement_class'], 'phase': s['phase'] or ""}, s['seconds'])
+                for rank, s in enumerate(report['slowest_statements'], start = 1)])
+
+        with open(path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+
+
+    def print_summary(self):
+        """ Prints the time per statement class and the slowest statements """
+
+        report = self.report()
+
+        print(f"{'statement class':<30}{'count':>10}{'errors':>8}{'seconds':>10}")
+        for name, s in sorted(report['statements'].items(), key = lambda item: -item[1]['seconds']):
+            print(f"{name:<30}{s['count']:>10}{s['errors']:>8}{s['seconds']:>10.1f}")
+
+        fetch_seconds = sum(fetch['seconds'] for fetch in report['fetches'])
+        print(f"source fetches: {len(report['fetches'])} queries, {fetch_seconds:.1f}s")
+
+        backends = [f"{name}={phase['backend']}" for name, phase in report['phases'].items() if 'backend' in phase]
+        if backends:
+            print(f"metadata backends: {', '.join(backends)}")
+
+        if report['table_copies']:
+            rows = sum(copy['rows'] for copy in report['table_copies'])
+            seconds = sum(copy['seconds'] for copy in report['table_copies'])
+            failed = sum(copy['error'] is not None for copy in report['table_copies'])
+            print(f"table data: {len(report['table_copies'])} tables, {rows} rows, {seconds:.1f}s, {failed} failed")
+
+        execution = report['execution']
+        if execution:
+            print(f"retries: {execution['retries']} ({execution['throttled']} throttled, "
+                  f"{execution['transient_errors']} transient errors, {execution['given_up']} given up), "
+                  f"limit of requests in flight: lowest {execution['min_window']}, at the end {execution['window']}")
+
+        print("slowest statements:")
+        for s in report['slowest_statements'][:5]:
+            print(f"  {s['seconds']:.2f}s  {s['sql'][:100]}")
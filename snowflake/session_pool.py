@@ -0,0 +1,181 @@
+import snowflake.connector
+import configparser
+import functools
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+
+@functools.lru_cache(maxsize = None)
+def _read_config(config_file):
+    credentials = configparser.ConfigParser()
+    credentials.read(config_file)
+    return credentials
+
+
+def read_credentials(config_file, config_name):
+    """ Returns the credentials of one account in a config file as a dict. The file is only read once """
+
+    return dict(_read_config(config_file)[config_name])
+
+
+@functools.lru_cache(maxsize = None)
+def load_private_key(key_path):
+    """ Reads a PEM private key and returns it DER encoded for the connector. Each key is only decoded once """
+
+    # only private key authentication needs cryptography
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import serialization
+
+    with open(key_path, "rb") as key_file:
+        p_key = serialization.load_pem_private_key(
+            key_file.read(),
+            password=None,
+            backend=default_backend()
+        )
+
+    return p_key.private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption())
+
+
+def connect(config_file, config_name, conn_type = 'password', keep_alive = True):
+    """ Opens a connection to the account of one config section.
+        conn_type can be 'password' or 'private_key'
+    """
+
+    credentials = read_credentials(config_file, config_name)
+
+    connect_args = dict(user = credentials['user'],
+                        account = credentials['account'],
+                        client_session_keep_alive = keep_alive)
+
+    # the terraform config doesn't name a warehouse
+    if credentials.get('warehouse'):
+        connect_args['warehouse'] = credentials['warehouse']
+
+    if conn_type == 'password':
+        connect_args['password'] = credentials['password']
+
+    elif conn_type == 'private_key':
+        connect_args['private_key'] = load_private_key(credentials['private_key'])
+
+    else:
+        raise ValueError(f"unknown connection type: {conn_type}")
+
+    return snowflake.connector.connect(**connect_args)
+
+
+
+class session_pool:
+    """
+    A pool of connections to one account, shared by the worker threads of a run.
+    Connections are opened lazily, reused, and checked before they are handed out again
+
+    Attributes:
+        config_file : str
+            the path of the config file that contains the snowflake credentials
+        config_name : str
+            the name of the header in the config file for the account
+        conn_type : str
+            authentication type. can be 'password' or 'private_key'
+        size : int
+            maximum number of open connections, acquire waits when all of them are in use
+        health_check_interval : int
+            connections idle for longer than this many seconds are tested with "select 1"
+            before they are reused
+
+    """
+
+    def __init__(self, config_file, config_name, conn_type = 'password', size = 16, health_check_interval = 300):
+        self.config_file = config_file
+        self.config_name = config_name
+        self.conn_type = conn_type
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.account = read_credentials(config_file, config_name)['account']
+
+        self._idle = []
+        self._open = 0
+        self._condition = threading.Condition()
+
+
+    def acquire(self):
+        """ Returns a connection for the caller's exclusive use until it is released """
+
+        with self._condition:
+            while not self._idle and self._open >= self.size:
+                self._condition.wait()
+
+            if self._idle:
+                conn, released_at = self._idle.pop()
+            else:
+                # reserve the slot, the connection is opened outside of the lock
+                self._open += 1
+                conn, released_at = None, None
+
+        if conn is not None and time.time() - released_at > self.health_check_interval and not self._healthy(conn):
+            self._close(conn)
+            conn = None
+
+        if conn is None:
+            try:
+                conn = connect(self.config_file, self.config_name, self.conn_type)
+            except Exception:
+                with self._condition:
+                    self._open -= 1
+                    self._condition.notify()
+                raise
+
+        return conn
+
+
+    def release(self, conn):
+        """ Returns a connection to the pool """
+
+        with self._condition:
+            if conn.is_closed():
+                self._open -= 1
+            else:
+                self._idle.append((conn, time.time()))
+            self._condition.notify()
+
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+
+    def _healthy(self, conn):
+        try:
+            if conn.is_closed():
+                return False
+            conn.cursor().execute("select 1")
+            return True
+        except Exception:
+            return False
+
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+    def close(self):
+        """ Closes the idle connections """
+
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+
+        for conn, _ in idle:
+            self._close(conn)
@@ -0,0 +1,33 @@
+import math
+
+
+
+# Quoting and value checks shared by the statement builders
+
+
+def is_missing(value):
+    """ None, nan and pd.NA are missing values (pandas isn't imported for the check) """
+
+    return value is None or (isinstance(value, float) and math.isnan(value)) or type(value).__name__ == 'NAType'
+
+
+def quote_identifier(value):
+    """ A double quoted identifier, embedded " are doubled """
+
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def quote_literal(value):
+    """ A single quoted string literal, ' and \\ are escaped """
+
+    return "'" + str(value).replace('\\', '\\\\').replace("'", "''") + "'"
+
+
+def is_true(values):
+    """ Booleans of a column holding booleans, 'true' / 'false' strings or 1 / 0
+        (numpy booleans, and the integers the sqlite metadata cache stores booleans as)
+    """
+
+    values = values.tolist() if hasattr(values, 'tolist') else values
+
+    return [str(value).strip().lower() in ('true', '1', '1.0') for value in values]
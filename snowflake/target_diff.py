@@ -0,0 +1,184 @@
+import threading
+
+from ddl_parser import classify_statement, split_name
+from sql_builder import is_missing
+
+
+
+# objects every account has, a diff never drops them
+DEFAULT_ROLES = ['PUBLIC', 'ACCOUNTADMIN', 'SECURITYADMIN', 'ORGADMIN', 'USERADMIN', 'SYSADMIN']
+DEFAULT_DATABASES = ['SNOWFLAKE', 'SNOWFLAKE_SAMPLE_DATA']
+DEFAULT_USERS = ['SNOWFLAKE']
+
+# database objects a diff knows how to drop, in the order they should be dropped
+_drop_order = ['TABLE', 'SCHEMA', 'DATABASE']
+
+# replacing one of these drops everything in it
+_containers = ['DATABASE', 'SCHEMA']
+
+
+
+def normalize_sql(sql):
+    """ Normalizes a statement for comparison (whitespace, trailing ; and case) """
+
+    return " ".join(sql.split()).rstrip(";").strip().lower()
+
+
+
+def normalize_values(values):
+    """ Normalizes a tuple of object properties for comparison, None and "" are the same """
+
+    return tuple("" if is_missing(value) else str(value).strip().lower() for value in values)
+
+
+
+def _name_parts(sql):
+    """ (object type, upper cased name parts) of a statement, or (None, ()) """
+
+    statement = classify_statement(sql)
+    if statement is None or not statement[2]:
+        return None, ()
+
+    return statement[1], tuple(part.upper() for part in split_name(statement[2]))
+
+
+
+def diff_statements(source_sql, target_sql):
+    """ Returns the source statements that are not already in the target, by normalized definition.
+        A changed database or schema that is created or replaced wipes its contents, so it is
+        returned with every source statement of the objects in it
+    """
+
+    target_sql = set(normalize_sql(sql) for sql in target_sql)
+
+    changed = [normalize_sql(sql) not in target_sql for sql in source_sql]
+
+    replaced = set()
+    for sql, is_changed in zip(source_sql, changed):
+        object_type, parts = _name_parts(sql)
+        if is_changed and object_type in _containers and normalize_sql(sql).startswith('create or replace'):
+            replaced.add(parts)
+
+    if not replaced:
+        return [sql for sql, is_changed in zip(source_sql, changed) if is_changed]
+
+    def in_replaced(sql):
+        parts = _name_parts(sql)[1]
+        return any(parts[:length] in replaced for length in range(1, len(parts)))
+
+    return [sql for sql, is_changed in zip(source_sql, changed) if is_changed or in_replaced(sql)]
+
+
+
+def drop_missing_objects(source_sql, target_sql):
+    """ Returns drop statements for the database objects that are created by the
+        target ddl but not by the source ddl. Tables are dropped before schemas
+    """
+
+    def created_objects(sql_list):
+        objects = {}
+        for sql in sql_list:
+            statement = classify_statement(sql)
+            if statement and statement[1] in _drop_order and statement[2]:
+                objects[(statement[1], statement[2].upper())] = statement[2]
+        return objects
+
+    source_objects = created_objects(source_sql)
+    target_objects = created_objects(target_sql)
+
+    missing = [key for key in target_objects if key not in source_objects and key[0] != 'DATABASE']
+    missing.sort(key = lambda key: _drop_order.index(key[0]))
+
+    return [f"""DROP {object_type} IF EXISTS {target_objects[(object_type, name)]};""" for object_type, name in missing]
+
+
+
+class target_snapshot:
+    """
+    Lazily loaded view of the objects that already exist in the target account.
+    Each object type is read with one bulk SHOW query and kept for the rest of the run
+
+    Attributes:
+        connection : snowflake connection
+            connection to the target account
+
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._results = {}
+        self._lock = threading.Lock()
+
+
+    def query(self, sql):
+        """ Runs a query on the target account once and returns the cached dataframe """
+
+        import pandas as pd
+
+        with self._lock:
+            if sql not in self._results:
+                self._results[sql] = pd.read_sql(sql, self.connection)
+            return self._results[sql]
+
+
+    def roles(self):
+        return set(self.query('show roles')['name'].values.tolist())
+
+
+    def users(self):
+        """ Returns {name: (login_name, display_name, default_role, email)} """
+
+        df_users = self.query('show users')
+
+        return {name: normalize_values(values) for name, *values in
+                zip(df_users['name'], df_users['login_name'], df_users['display_name'],
+                    df_users['default_role'], df_users['email'])}
+
+
+    def protected_users(self):
+        """ Users that are never dropped: the snowflake user, the user running the
+            replication and the user the account was created with
+        """
+
+        df_users = self.query('show users')
+        current_user = self.query('select current_user()').iloc[0, 0]
+        first_user = df_users.sort_values('created_on')['name'].values[0] if len(df_users) else None
+
+        return set(DEFAULT_USERS + [current_user, first_user])
+
+
+    def warehouses(self):
+        """ Returns {name: size} """
+
+        df_wh = self.query('show warehouses')
+
+        return {name: normalize_values([size]) for name, size in zip(df_wh['name'], df_wh['size'])}
+
+
+    def protected_warehouses(self):
+        """ The warehouse used by the replication session is never dropped """
+
+        return set([self.query('select current_warehouse()').iloc[0, 0]])
+
+
+    def databases(self):
+        """ Returns the databases owned by the target account (shares are skipped) """
+
+        df_db = self.query('show databases')
+
+        return set(df_db[df_db['origin'] == ""]['name'].values.tolist())
+
+
+    def database_ddl(self, database, connection = None):
+        """ Returns the get_ddl output of a target database, or None if it doesn't exist.
+            Not cached, each database is only compared once
+        """
+
+        if database not in self.databases():
+            return None
+
+        import pandas as pd
+
+        sql = f"""select get_ddl('database', '{database}', true)"""
+
+        return pd.read_sql(sql, connection or self.connection).iloc[0, 0]
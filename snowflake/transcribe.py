@@ -1,67 +1,65 @@
-import pandas as pd
 import snowflake.connector 
-import configparser
+import functools
 import re
+import threading
+import time
 
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.asymmetric import rsa
-from cryptography.hazmat.primitives.asymmetric import dsa
-from cryptography.hazmat.primitives import serialization
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# pandas is imported where dataframes are built, dropping objects and replaying plans don't need it
+from session_pool import session_pool, connect, read_credentials
+from metadata_cache import metadata_cache
+from metadata_backend import fetch_data_df, metadata_backend, METADATA_BACKENDS
+from ddl_parser import default_ddl_policy, split_statements, qualify_statement
+from object_selector import object_selector
+from phase_scheduler import phase_scheduler
+from replication_plan import replication_plan
+from execution_journal import execution_journal
+from async_grants import execute_sql_async
+from execution_controller import execution_controller
+from data_copy import created_tables, copy_table_data
+from run_metrics import run_metrics
+from sql_builder import is_missing, is_true, quote_identifier, quote_literal
+from target_diff import (target_snapshot, diff_statements, drop_missing_objects, normalize_values, normalize_sql,
+                         DEFAULT_ROLES, DEFAULT_DATABASES)
 
 
 
 def parse_credentials(config_file, config_name, conn_type):
-    """ helper function to connect to source and target snowflake accounts"""
-    
-    credentials = configparser.ConfigParser()
-    credentials.read(config_file)
-    
-    user = credentials[config_name]['user']
-    account = credentials[config_name]['account']
-    warehouse = credentials[config_name]['warehouse']
+    """ helper function to connect to source and target snowflake accounts.
+        credentials and private keys are only read once, see session_pool
+    """
     
-    if conn_type == 'password':
-        password = credentials[config_name]['password']
+    conn = connect(config_file, config_name, conn_type)
+    cur = conn.cursor()
+    account = read_credentials(config_file, config_name)['account']
 
-        conn = snowflake.connector.connect(
-                user = user,
-                password = password,
-                account = account,
-                warehouse = warehouse
-            )
+    return conn, cur, account
 
-        cur = conn.cursor()
-    
-    if conn_type == 'private_key':
-        pkb_key_path = credentials[config_name]['private_key']
-        
-        with open(pkb_key_path, "rb") as key_file:
-            p_key = serialization.load_pem_private_key(
-                key_file.read(),
-                password=None,
-                backend=default_backend()
-            )
 
-        pkb = p_key.private_bytes(
-            encoding=serialization.Encoding.DER,
-            format=serialization.PrivateFormat.PKCS8,
-            encryption_algorithm=serialization.NoEncryption())
-        
-        
-        conn = snowflake.connector.connect(
-            user = user,
-            account = account,
-            private_key=pkb,
-            warehouse = warehouse
-        )
-        
-        cur = conn.cursor()
-
-    return conn, cur, account
+def _call(controller, statements, func, *args, **kwargs):
+    """ Calls func through the execution controller when there is one (retries, limit of requests in flight) """
+    
+    if controller is None:
+        return func(*args, **kwargs)
+    
+    return controller.call(func, *args, statements = statements, **kwargs)
 
 
-def execute_sql_list(sql_list, cursor, return_sql = False, return_errors = True):
-    """ Execute sql statements and skip any that can't be executed """
+def execute_sql_list(sql_list, cursor, return_sql = False, return_errors = True, log = print, batch_size = 1,
+                     on_result = None, controller = None):
+    """ Execute sql statements and skip any that can't be executed
+        - log: function used for output, workers pass their own to keep logs grouped
+        - batch_size: statements sent per request, see execute_sql_batched
+        - on_result: called with (sql, error, seconds) after each statement, error is None on success
+        - controller: execution_controller shared by the workers, transient errors are retried and the
+          requests in flight are limited. Statements are only skipped when they fail for good
+    """
+    
+    if batch_size > 1:
+        return execute_sql_batched(sql_list, cursor, batch_size = batch_size, return_sql = return_sql,
+                                   return_errors = return_errors, log = log, on_result = on_result,
+                                   controller = controller)
     
     # todo:
     # handle exceptions better
@@ -69,47 +67,289 @@ def execute_sql_list(sql_list, cursor, return_sql = False, return_errors = True)
     # put return sql option here as well
     
     for sql in sql_list:
+        start = time.perf_counter()
         try:
             if return_sql:
-                print("Executing: ", sql)
-                cursor.execute(sql)
+                log("Executing: ", sql)
+                _call(controller, 1, cursor.execute, sql)
             else:
-                cursor.execute(sql)
+                _call(controller, 1, cursor.execute, sql)
+                
+            if on_result is not None:
+                on_result(sql, None, time.perf_counter() - start)
 
         except snowflake.connector.errors.ProgrammingError as e:
+            if on_result is not None:
+                on_result(sql, e, time.perf_counter() - start)
+                
             if return_errors:
-                print(e)
-                print('Error {0} ({1}): {2} ({3})'.format(e.errno, e.sqlstate, e.msg, e.sfqid))
+                log(e)
+                log('Error {0} ({1}): {2} ({3})'.format(e.errno, e.sqlstate, e.msg, e.sfqid))
             else:
                 pass
 
             continue
 
         except Exception as error:
+            if on_result is not None:
+                on_result(sql, error, time.perf_counter() - start)
+                
             if return_errors:
-                print(error)
-                print("Could not create grants for users")
+                log(error)
+                log("Could not create grants for users")
             else:
                 pass
             continue
+
+        
+def execute_sql_batched(sql_list, cursor, batch_size = 50, return_sql = False, return_errors = True, log = print,
+                        on_result = None, controller = None):
+    """ Execute sql statements as multi-statement requests of up to batch_size statements
+        - statements run in order, one round trip per batch instead of per statement
+        - a failed batch is split in half until the failing statement runs on its own,
+          so its error is reported the same way as execute_sql_list
+        - statements before the failure in a batch are executed again when it is split,
+          which is safe for the CREATE OR REPLACE / GRANT / DROP IF EXISTS statements used here.
+          With a controller, a batch that fails with a transient error is retried whole before it is split
+    """
+    
+    statements = [sql.strip().rstrip(";").strip() for sql in sql_list]
+    statements = [sql for sql in statements if sql]
+    
+    for i in range(0, len(statements), batch_size):
+        chunk = statements[i:i + batch_size]
+        
+        if return_sql:
+            for sql in chunk:
+                log("Executing: ", sql)
+                
+        _execute_chunk(chunk, cursor, return_errors, log, on_result, controller)
+        
+        
+def _execute_chunk(chunk, cursor, return_errors, log, on_result, controller = None):
+    """ Execute one multi-statement request, bisecting it on failure """
     
+    if len(chunk) == 1:
+        execute_sql_list(chunk, cursor, return_sql = False, return_errors = return_errors, log = log,
+                         on_result = on_result, controller = controller)
+        return
     
-def fetch_data_df(sql, connection):
-    # fetch data from source account in a dataframe
+    start = time.perf_counter()
     try:
-        df = pd.read_sql(sql, connection)
+        _call(controller, len(chunk), cursor.execute, ";\n".join(chunk), num_statements = len(chunk))
+        
+    except Exception:
+        middle = len(chunk) // 2
+        _execute_chunk(chunk[:middle], cursor, return_errors, log, on_result, controller)
+        _execute_chunk(chunk[middle:], cursor, return_errors, log, on_result, controller)
+        return
+    
+    # the statements of a batch share its time
+    if on_result is not None:
+        seconds = (time.perf_counter() - start) / len(chunk)
+        for sql in chunk:
+            on_result(sql, None, seconds)
+    
+    
+def filter_ddl(ddl, policy = default_ddl_policy):
+    """ Splits get_ddl output into statements and keeps the ones allowed by the ddl policy """
+    
+    return policy.filter(ddl)
 
-    except snowflake.connector.errors.ProgrammingError as e:
-        print(e)
-        print('Error {0} ({1}): {2} ({3})'.format(e.errno, e.sqlstate, e.msg, e.sfqid))
 
-    except Exception as error:
-        print(error)
-        print(f"fetching data failed for: \n  {sql}")
+def user_role_grant_sql(df_user_grants):
+    """ GRANT ROLE ... TO USER statements for the rows of grants_to_users
+        (deleted grants are filtered out in the query)
+    """
+    
+    roles = df_user_grants['ROLE'].values.tolist()
+    users = df_user_grants['GRANTEE_NAME'].values.tolist()
+    
+    return [f"""GRANT ROLE {quote_identifier(role)} TO USER {quote_identifier(user)};""" \
+                for role, user in zip(roles, users)]
+
+
+def role_role_grant_sql(df_role_grants):
+    """ GRANT ROLE ... TO ROLE statements for the role rows of grants_to_roles
+        (other objects and deleted grants are filtered out in the query)
+    """
+    
+    role_sources = df_role_grants['NAME'].values.tolist()
+    role_targets =df_role_grants['GRANTEE_NAME'].values.tolist()
+    
+    return [f"""GRANT ROLE {quote_identifier(role_source)} TO ROLE {quote_identifier(role_target)};""" \
+                for role_source, role_target in zip(role_sources, role_targets)]
+
+
+def role_object_grant_sql(df_obj_grants):
+    """ GRANT <privilege> ON <object> TO ROLE statements for the object rows of grants_to_roles
+        (unsupported objects, snowflake objects and deleted grants are filtered out in the query)
+    """
+    
+    privileges = df_obj_grants['PRIVILEGE'].values.tolist()
+    object_types = df_obj_grants['GRANTED_ON'].values.tolist()
+    object_names = df_obj_grants['NAME'].values.tolist()
+    object_name_schemas = df_obj_grants['TABLE_SCHEMA'].values.tolist()
+    object_name_dbs = df_obj_grants['TABLE_CATALOG'].values.tolist()
+    grantee_roles = df_obj_grants['GRANTEE_NAME'].values.tolist()
+    
+    # older cached results don't have the grant option
+    if 'GRANT_OPTION' in df_obj_grants:
+        grant_options = is_true(df_obj_grants['GRANT_OPTION'])
+    else:
+        grant_options = [False] * len(df_obj_grants)
+
+    grants_sql_list = []
+    for i in range(0, len(df_obj_grants)):  
+        privilege = privileges[i]
+        object_type = object_types[i]
+        object_name = object_names[i]
+        grantee_role = quote_identifier(grantee_roles[i])
+        object_name_schema = object_name_schemas[i]
+        object_name_db = object_name_dbs[i]
+        grant_option = " WITH GRANT OPTION" if grant_options[i] else ""
+
+        # Some objects need a full name/path, every part is quoted
+        if object_type == 'TABLE' or object_type == 'VIEW':
+            full_object_name = ".".join(quote_identifier(part) for part in [object_name_db, object_name_schema, object_name])
+        elif object_type == 'SCHEMA':
+            full_object_name = f"{quote_identifier(object_name_db)}.{quote_identifier(object_name)}"
+        else:
+            full_object_name = quote_identifier(object_name)
+
+        # some restrictions on granting ownership
+        if privilege == 'OWNERSHIP':   
+            sql = [f"""GRANT {privilege} ON {object_type} {full_object_name} TO ROLE  {grantee_role} REVOKE CURRENT GRANTS; """]
+        else:
+            sql = [f"""GRANT {privilege} ON {object_type} {full_object_name} TO ROLE  {grantee_role}{grant_option}; """]
+
+        grants_sql_list += sql
         
-    return df
+    return grants_sql_list
+
+
+# columns that identify an object grant apart from the privilege
+GRANT_GROUP_COLUMNS = ['GRANTED_ON', 'TABLE_CATALOG', 'TABLE_SCHEMA', 'NAME', 'GRANTEE_NAME', 'GRANT_OPTION']
+
+
+def compact_object_grants(df_obj_grants):
+    """ Merges the privileges granted on the same object to the same role (with the same grant option)
+        into one row, eg. SELECT + INSERT -> 'INSERT, SELECT', so role_object_grant_sql emits one
+        GRANT per object and role. OWNERSHIP rows are kept as they are
+    """
+    
+    import pandas as pd
+    
+    if df_obj_grants.empty:
+        return df_obj_grants
+    
+    group_columns = [column for column in GRANT_GROUP_COLUMNS if column in df_obj_grants]
+    
+    ownership = df_obj_grants['PRIVILEGE'] == 'OWNERSHIP'
+    df_compacted = df_obj_grants[~ownership].groupby(group_columns, dropna = False, sort = False) \
+                                            .agg(PRIVILEGE = ('PRIVILEGE', lambda p: ", ".join(sorted(set(p))))) \
+                                            .reset_index()
+    
+    return pd.concat([df_obj_grants[ownership], df_compacted], ignore_index = True)
+
+
+def _split_last_group(df_obj_grants):
+    """ Splits the rows of the last object / grantee off a chunk, they may continue in the next chunk """
+    
+    if df_obj_grants.empty:
+        return df_obj_grants, None
+    
+    group_columns = [column for column in GRANT_GROUP_COLUMNS if column in df_obj_grants]
+    # missing names (eg. the schema of a database grant) have to compare equal
+    keys = df_obj_grants[group_columns].astype(object).fillna('').astype(str)
+    last = (keys == keys.iloc[-1]).all(axis = 1)
+    
+    return df_obj_grants[~last], df_obj_grants[last]
 
 
+def timed_phase(func):
+    """ Records the wall time of a phase method in the run metrics """
+    
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.metrics.phase(func.__name__):
+            return func(self, *args, **kwargs)
+        
+    return wrapper
+
+
+# object types show objects doesn't list: the show command listing them in a schema and their get_ddl type.
+# get_ddl doesn't read stages, they are only replicated with their schema or database
+SHOWN_OBJECT_TYPES = {'SEQUENCE': ('sequences', 'sequence'),
+                      'FILE FORMAT': ('file formats', 'file_format'),
+                      'PIPE': ('pipes', 'pipe'),
+                      'STREAM': ('streams', 'stream'),
+                      'TASK': ('tasks', 'task'),
+                      'FUNCTION': ('user functions', 'function'),
+                      'PROCEDURE': ('procedures', 'procedure'),
+                      'MASKING POLICY': ('masking policies', 'policy')}
+
+
+def _signature(arguments):
+    """ The argument types of a function / procedure in the arguments column of show functions,
+        eg. 'ADD(NUMBER, NUMBER) RETURN NUMBER' -> '(NUMBER, NUMBER)'. get_ddl needs them to find the overload
+    """
+    
+    arguments = str(arguments)
+    return arguments[arguments.find('('):arguments.rfind(') RETURN') + 1].replace('[', '').replace(']', '')
+
+# phases of copy_account and the phases each of them waits for
+PHASE_DEPENDENCIES = {
+    'database_objects': [],
+    'users': [],
+    'roles': [],
+    'warehouses': [],
+    'user_role_grants': ['users', 'roles'],
+    'role_role_grants': ['roles'],
+    'role_object_grants': ['roles', 'database_objects', 'warehouses'],
+}
+
+# the phase that creates each type of object drop_objects can drop
+DROP_PHASES = {'databases': 'database_objects', 'users': 'users', 'roles': 'roles', 'warehouses': 'warehouses'}
+
+# phases whose statements don't depend on each other and can run asynchronously
+GRANT_PHASES = ['user_role_grants', 'role_role_grants', 'role_object_grants']
+
+# teardown levels in reverse dependency order: users and roles first (their grants go with them),
+# then the warehouses and databases they refer to. Other object types are dropped last
+DROP_LEVELS = [['USER', 'ROLE'], ['WAREHOUSE', 'DATABASE']]
+
+DROP_PATTERN = re.compile(r'^\s*DROP\s+(\w+)', re.IGNORECASE)
+
+
+def dependent_phases(phase):
+    """ A phase and every phase that depends on it, directly or not. Dropping the objects
+        of a phase also drops what these phases created on them (eg. the grants of a role)
+    """
+
+    phases = [phase]
+    for dependency in phases:
+        phases += [name for name, depends_on in PHASE_DEPENDENCIES.items()
+                   if dependency in depends_on and name not in phases]
+
+    return phases
+
+
+def drop_levels(sql_list):
+    """ Splits drop statements into the levels of DROP_LEVELS, statements of a level
+        don't depend on each other. Returns a list of statement lists, empty levels are left out
+    """
+    
+    level_of = {kind: level for level, kinds in enumerate(DROP_LEVELS) for kind in kinds}
+    levels = [[] for _ in range(len(DROP_LEVELS) + 1)]
+    
+    for sql in sql_list:
+        match = DROP_PATTERN.match(sql)
+        kind = None if match is None else match.group(1).upper()
+        levels[level_of.get(kind, len(DROP_LEVELS))].append(sql)
+    
+    return [level for level in levels if level]
+
         
 class transcribe_snowflake_account:
     """
@@ -122,7 +362,8 @@ class transcribe_snowflake_account:
         source_config_name : str
             the name of the header in the config file for the snowflake source account credentials
         target_config_name : str
-            the name of the header in the config file for the snowflake source account credentials
+            the name of the header in the config file for the snowflake source account credentials.
+            None doesn't connect to a target account, only compile_plan can be used
         conn_type_source: str
             source account authentication type. can be 'password' or 'private_key'
         conn_type_target: str
@@ -131,6 +372,68 @@ class transcribe_snowflake_account:
             list of database names that should not be replicated
         return_sql: bool
             if true all of the sql statements that are executed will be printed
+        max_workers: int
+            number of databases that are fetched and replayed at the same time.
+            each worker opens its own source and target connection
+        batch_size: int
+            number of statements sent to the target account per request.
+            1 executes statements one at a time
+        cache_path: str
+            path of a local sqlite file used to cache source account metadata between phases and runs.
+            None disables the cache
+        cache_ttl: int
+            number of seconds cached source metadata is reused before it is fetched again
+        diff_mode: bool
+            if true the target account is compared to the source and only the objects
+            that are missing or different are created / altered
+        diff_drops: bool
+            in diff mode, also drop target objects that don't exist in the source account
+        chunk_size: int
+            number of grant rows fetched, turned into sql and executed at a time
+        object_policy: ddl_policy
+            which object types of the database ddl are replayed, see ddl_parser.ddl_policy.
+            None uses the default policy (databases, schemas, tables and other simple objects)
+        selector: object_selector
+            which databases, schemas and objects are replicated (glob patterns), see
+            object_selector. Only the selected parts of the source are read.
+            None selects every database that isn't on db_ignore_list
+        journal_path: str
+            path of an execution journal. statements that already succeeded are skipped when a
+            replication is rerun, and drop_objects can use the drop lists recorded in it
+        async_grants: bool
+            if true grants are submitted as async queries and polled by query id
+        max_in_flight: int
+            maximum number of requests running on the target account at the same time
+            (statements of every worker and async grant queries). The execution controller
+            lowers it when the account throttles or slows down and raises it again as requests succeed
+        max_retries: int
+            number of times a statement that fails with a transient error (throttling, network,
+            lock timeouts) is retried, with jittered exponential backoff. 0 disables retries
+        latency_tolerance: float
+            the limit of requests in flight is lowered when the average latency per statement
+            reaches this many times the best latency seen. None only reacts to throttling errors
+        pool_size: int
+            maximum number of open connections per account, shared by all worker threads.
+            None sizes the pool for max_workers database workers plus one per phase
+        report_path: str
+            path of a json run report (phase, statement and fetch timings) written by copy_account
+        metrics_path: str
+            path of a prometheus text format metrics file written by copy_account
+        compact_grants: bool
+            if true the privileges granted on the same object to the same role are merged into
+            one GRANT statement (OWNERSHIP grants stay separate)
+        copy_data: bool
+            if true the rows of every table are copied to the target once its database is replayed.
+            needs the connector's pandas extra (pyarrow). not done when compiling a plan
+        copy_workers: int
+            number of tables copied at the same time, each on its own pair of pooled connections
+        copy_batch_size: int
+            number of rows held in memory and bulk loaded into the target at a time
+        metadata_backend: str or dict
+            how roles, users and grants are read, see metadata_backend. 'account_usage' reads the
+            snowflake.account_usage views (one bulk query per phase, can lag behind the account),
+            'show' reads them with show commands (current, no access to the snowflake database needed).
+            A dict picks the backend per phase, eg. {'role_object_grants': 'show'}, other phases use 'account_usage'
 
     """
     
@@ -141,24 +444,100 @@ class transcribe_snowflake_account:
                  conn_type_source = 'password', 
                  conn_type_target = 'private_key',
                  db_ignore_list = [""],
-                 return_sql = True):
+                 return_sql = True,
+                 max_workers = 4,
+                 batch_size = 50,
+                 cache_path = None,
+                 cache_ttl = 3600,
+                 diff_mode = False,
+                 diff_drops = False,
+                 chunk_size = 100000,
+                 object_policy = None,
+                 selector = None,
+                 journal_path = None,
+                 async_grants = False,
+                 max_in_flight = 64,
+                 max_retries = 5,
+                 latency_tolerance = 3.0,
+                 pool_size = None,
+                 report_path = None,
+                 metrics_path = None,
+                 compact_grants = True,
+                 copy_data = False,
+                 copy_workers = 4,
+                 copy_batch_size = 100000,
+                 metadata_backend = 'account_usage'):
         
         self.sql_drop_list = []
         self.db_ignore_list = db_ignore_list
         self.return_sql = return_sql
-        
-        
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.cache = None
+        self.diff_mode = diff_mode
+        self.diff_drops = diff_drops
+        self._snapshot = None
+        self._target_grants = {}
+        self._diff_lock = threading.Lock()
+        self.chunk_size = chunk_size
+        self.object_policy = object_policy or default_ddl_policy
+        self.selector = selector or object_selector()
+        self.journal = execution_journal(journal_path) if journal_path else None
+        self.async_grants = async_grants
+        self.metrics = run_metrics()
+        self.report_path = report_path
+        self.metrics_path = metrics_path
+        self.max_in_flight = max_in_flight
+        self.controller = execution_controller(max_in_flight = max_in_flight, max_retries = max_retries,
+                                               latency_tolerance = latency_tolerance)
+        self.compact_grants = compact_grants
+        self.copy_data = copy_data
+        self.copy_workers = copy_workers
+        self.copy_batch_size = copy_batch_size
+        self._copy_executor = None
+        self._copy_futures = []
+        
+        backends = metadata_backend.values() if isinstance(metadata_backend, dict) else [metadata_backend]
+        for name in backends:
+            if name not in METADATA_BACKENDS:
+                raise ValueError(f"unknown metadata backend {name!r}, use one of {sorted(METADATA_BACKENDS)}")
+        self.metadata_backend = metadata_backend
+        self._backends = {}
+        
+        # kept so worker threads can open their own connections
+        self.config_file = config_file
+        self.source_config_name = source_config_name
+        self.target_config_name = target_config_name
+        self.conn_type_source = conn_type_source
+        self.conn_type_target = conn_type_target
+        
+        self._owner_thread = threading.get_ident()
+        self._local = threading.local()
+        self._worker_lock = threading.Lock()
+        self._worker_conns = []
+        self._worker_generation = 0
+        self._plan = None
+        self.source_account = None
+        self.source_pool, self.target_pool = None, None
+        self._source_conn, self._target_conn, self._target_cur = None, None, None
+        
+        
+        # every concurrent phase and database worker holds one connection per account
+        if pool_size is None:
+            pool_size = max_workers + len(PHASE_DEPENDENCIES) + 1 + (copy_workers if copy_data else 0)
+        
+        # connections are opened lazily from the pools, only the config is read here
         try:
-            self.source_conn, self.source_cur, account_source = parse_credentials(config_file,
-                                                                                  source_config_name,
-                                                                                  conn_type_source)
-            print("connected to source account")
+            self.source_pool = session_pool(config_file, source_config_name, conn_type_source, size = pool_size)
+            self.source_account = account_source = self.source_pool.account
             
-            self.target_conn, self.target_cur, account_target = parse_credentials(config_file,
-                                                                                  target_config_name,
-                                                                                  conn_type_target)
+            account_target = None
+            if target_config_name is not None:
+                self.target_pool = session_pool(config_file, target_config_name, conn_type_target, size = pool_size)
+                account_target = self.target_pool.account
             
-            print("connected to target account")
+            if cache_path:
+                self.cache = metadata_cache(cache_path, account_source, cache_ttl)
             
             
 
@@ -169,17 +548,78 @@ class transcribe_snowflake_account:
             print(error)
             
         except:
-            print("connection to snowflake accounts could not be established")
+            print("snowflake account credentials could not be read")
+            
+            
+    @property
+    def source_conn(self):
+        """ connection to the source account, opened on first use """
+        
+        if self._source_conn is None:
+            self._source_conn = self.source_pool.acquire()
+            print("connected to source account")
+            
+        return self._source_conn
+    
+    
+    @property
+    def source_cur(self):
+        return self.source_conn.cursor()
+    
+    
+    @property
+    def target_conn(self):
+        """ connection to the target account, opened on first use """
+        
+        if self._target_conn is None and self.target_pool is not None:
+            self._target_conn = self.target_pool.acquire()
+            print("connected to target account")
+            
+        return self._target_conn
+    
+    
+    @property
+    def target_cur(self):
+        if self._target_cur is None and self.target_conn is not None:
+            self._target_cur = self.target_conn.cursor()
+            
+        return self._target_cur
+    
+    
+    def close_connections(self):
+        """ Closes every connection to the source and target accounts """
+        
+        self._close_worker_connections()
+        
+        for pool, conn in [(self.source_pool, self._source_conn), (self.target_pool, self._target_conn)]:
+            if conn is not None:
+                pool.release(conn)
+            if pool is not None:
+                pool.close()
+                
+        self._source_conn, self._target_conn, self._target_cur = None, None, None
+        print("closed connections")
+        
+        
+    def invalidate_cache(self, sql = None):
+        """ Removes cached source metadata for one query, or all of it if sql is None """
         
+        if self.cache is not None:
+            self.cache.invalidate(sql)
         
+        
+    @timed_phase
     def database_objects(self):
         """ - Reads databases from the source account
             - Creates databases in the target account
             - Outputs a list of sql for dropping objects
         """
         
-        sql = 'show databases'
-        df_db = fetch_data_df(sql, self.source_conn)
+        source_conn, target_cur = self._connections()
+        
+        like = self.selector.like()
+        sql = f"show databases like '{like}'" if like else 'show databases'
+        df_db = fetch_data_df(sql, source_conn, cache = self.cache, metrics = self.metrics)
         
         
         # Don't include default snowflake databases:
@@ -190,47 +630,41 @@ class transcribe_snowflake_account:
         
         # Don't include databases on the ignore list:
         databases = df_db[~df_db['name'].isin(self.db_ignore_list)]['name'].unique().tolist()
+        databases = [database for database in databases if self.selector.includes(database)]
         
         # for dropping dbs
-        self.db_drop_sql_list = [f"""DROP DATABASE IF EXISTS "{database}";""" for database in databases]
-        self.sql_drop_list += self.db_drop_sql_list
+        self.db_drop_sql_list = [f"""DROP DATABASE IF EXISTS {quote_identifier(database)};""" for database in databases]
+        self._register_drops('databases', self.db_drop_sql_list)
+        
+        # in diff mode drop the target databases that are no longer in the source
+        if self.diff_mode and self.diff_drops:
+            extra_databases = self._target_snapshot().databases() - set(databases) \
+                                - set(DEFAULT_DATABASES) - set(self.db_ignore_list)
+            extra_databases = [database for database in extra_databases if self.selector.includes_all(database)]
+            drop_db_sql = [f"""DROP DATABASE IF EXISTS {quote_identifier(database)};""" \
+                           for database in sorted(extra_databases)]
+            self._execute('database_objects', drop_db_sql, target_cur)
         
 
+        # table data is copied on its own workers, the tables of a database start once it is replayed
+        if self.copy_data and self._plan is None:
+            self._copy_executor = ThreadPoolExecutor(max_workers = max(1, self.copy_workers))
+            self._copy_futures = []
+
         try:
-            # Get + execute ddl for all objects in one database
-            for database in databases:
+            # Get + execute ddl for each database on its own worker
+            with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+                futures = [executor.submit(self._replay_database, database) for database in databases]
                 
-                try:
-                    sql = f"""select get_ddl('database', '{database}', true)"""
-                    df_db_ddl = pd.read_sql(sql, self.source_conn)
-
-                    list_of_commands = [x for x in [ re.sub(r"[\n\t]*", "", x) for x in df_db_ddl.iloc[0,0].split(";") ]  if x ]
-
-                    # Ignore specified objects (need to make more robust when I have more time)
-                    ignore_objects = ['PROCEDURE', 'FUNCTION', 'STAGE', 'STREAM', 'TASK',
-                                      'FILE FORMAT', 'VIEW', 'PIPE', 'MATERIALIZED', 'SECURE',
-                                      'RECURSIVE']
-                    ignore_objects_lower = [obj.lower() for obj in ignore_objects]
-                    ignore_objects += ignore_objects_lower
-                    ignore_create_replace = [f"create or replace {obj}" for obj in ignore_objects]
-                    ignore_create_replace_upper = [f"CREATE OR REPLACE {obj}" for obj in ignore_objects]
-                    ignore_create = [f"create {obj}" for obj in ignore_objects]   
-                    ignore_create_upper = [f"CREATE {obj}" for obj in ignore_objects]   
-                    misc_ignore_text = [" references ", "MASKING POLICY", "masking policy"]
-                    ignore_text = ignore_create + ignore_create_replace + ignore_create_upper + ignore_create_replace_upper + misc_ignore_text
-
-
-                    list_of_commands_filtered = [ddl for ddl in list_of_commands if all(txt not in ddl for txt in ignore_text)]
-                    list_of_commands_filtered = [ddl for ddl in list_of_commands_filtered if ddl.startswith("CREATE") | ddl.startswith("create")]
-                    
-                    execute_sql_list(list_of_commands_filtered, self.target_cur, return_sql = self.return_sql, return_errors = True)
-                    
-                    
-                except Exception:
-                    print(f"Could Not Create: {database}")
-                    continue
+                # print each database's log in one block so output from workers doesn't interleave
+                for future in as_completed(futures):
+                    for line in future.result():
+                        print(line)
                 
             print("created db objects")
+            
+            if self._copy_executor is not None:
+                self._wait_for_data_copy()
 
             
         except snowflake.connector.errors.ProgrammingError as e:
@@ -240,36 +674,350 @@ class transcribe_snowflake_account:
         except Exception as error:
             print(error)
             print("could not create databases and database objects")
+            
+        finally:
+            if self._copy_executor is not None:
+                self._copy_executor.shutdown(wait = True)
+                self._copy_executor = None
+                
+            # phases running on a scheduler thread leave the cleanup to copy_account
+            if threading.get_ident() == self._owner_thread:
+                self._close_worker_connections()
+        
+        
+    def _copy_table(self, table):
+        """ Copies the rows of one table on a copy worker, returns its log lines and result """
+        
+        log_lines = []
+        
+        def log(*args):
+            log_lines.append(" ".join(str(arg) for arg in args))
+        
+        with self.source_pool.connection() as source_conn, self.target_pool.connection() as target_conn:
+            result = copy_table_data(table, source_conn, target_conn, batch_size = self.copy_batch_size, log = log)
+        
+        self.metrics.record_table_copy(result)
+        
+        return log_lines, result
+    
+    
+    def _wait_for_data_copy(self):
+        """ Waits for the table copies submitted by the database workers and prints a summary """
+        
+        start = time.perf_counter()
+        results = []
+        
+        for future in as_completed(self._copy_futures):
+            log_lines, result = future.result()
+            for line in log_lines:
+                print(line)
+            results.append(result)
+        
+        rows = sum(result['rows'] for result in results)
+        failed = sum(result['error'] is not None for result in results)
+        print(f"copied {rows} rows of {len(results) - failed} tables ({failed} failed), "
+              f"{time.perf_counter() - start:.1f}s after the last database was replayed")
+        
+        
+    def _replay_database(self, database):
+        """ - Fetches the ddl for one database and replays it on the target account
+            - Runs on a worker thread, failures only affect this database
+            - Returns the log lines for the database
+        """
+        
+        log_lines = []
+        
+        def log(*args):
+            log_lines.append(" ".join(str(arg) for arg in args))
         
+        try:
+            source_conn, target_cur = self._connections()
+            
+            list_of_commands_filtered = self._database_ddl(database, source_conn, log)
+            
+            if self.diff_mode:
+                list_of_commands_filtered = self._diff_database(database, list_of_commands_filtered, target_cur, log)
+            
+            self._execute('database_objects', list_of_commands_filtered, target_cur, log = log, group = database)
+            
+            if self._copy_executor is not None:
+                copy_futures = [self._copy_executor.submit(self._copy_table, table) \
+                                for table in created_tables(list_of_commands_filtered)]
+                with self._worker_lock:
+                    self._copy_futures += copy_futures
+            
+        except Exception as error:
+            log(error)
+            log(f"Could Not Create: {database}")
+            
+        return log_lines
     
     
+    def _database_ddl(self, database, source_conn, log):
+        """ The ddl statements of the selected part of a database, filtered by the object policy
+            - a database that is selected as a whole is read with one recursive get_ddl
+            - otherwise its schemas are listed (show schemas ... like) and only the selected ones are read,
+              schemas that are only partly selected are read object by object: the tables and views are listed
+              with show objects ... like, the other types the object policy replays (sequences, procedures, ...)
+              with their own show command (see SHOWN_OBJECT_TYPES). Objects that aren't selected are never read
+            - an object that can't be read is logged and left out
+        """
+        
+        def get_ddl(object_type, name):
+            sql = f"""select get_ddl('{object_type}', {quote_literal(name)}, true)"""
+            df_ddl = fetch_data_df(sql, source_conn, cache = self.cache, log = log, metrics = self.metrics)
+            if df_ddl is None or df_ddl.empty:
+                log(f"Could not read the ddl of {object_type} {name}")
+                return ""
+            return df_ddl.iloc[0,0]
+        
+        def show(sql, like):
+            sql = sql.replace(" in ", f" like '{like}' in ", 1) if like else sql
+            return fetch_data_df(sql, source_conn, cache = self.cache, log = log, metrics = self.metrics)
+        
+        def object_ddl(schema, schema_name, object_type, name):
+            object_ddl = get_ddl(object_type, f"""{schema_name}.{name}""")
+            return [qualify_statement(sql, database, schema) for sql in split_statements(object_ddl)]
+        
+        if self.selector.includes_all(database):
+            return filter_ddl(get_ddl('database', database), self.object_policy)
+        
+        database_name = quote_identifier(database)
+        list_of_commands = [f"""create database if not exists {database_name}"""]
+        
+        df_schemas = show(f"""show schemas in database {database_name}""", self.selector.like(database))
+        for schema in df_schemas['name'].tolist():
+            if schema.upper() == 'INFORMATION_SCHEMA' or not self.selector.includes(database, schema):
+                continue
+            
+            schema_name = f"""{database_name}.{quote_identifier(schema)}"""
+            if self.selector.includes_all(database, schema):
+                list_of_commands += split_statements(get_ddl('schema', schema_name))
+                continue
+            
+            list_of_commands += [f"""create schema if not exists {schema_name}"""]
+            
+            # show objects lists the tables and views of a schema
+            df_objects = show(f"""show objects in schema {schema_name}""", self.selector.like(database, schema))
+            for name, kind in zip(df_objects['name'].tolist(), df_objects['kind'].tolist()):
+                if self.selector.includes(database, schema, name):
+                    list_of_commands += object_ddl(schema, schema_name, kind.lower(), quote_identifier(name))
+            
+            # the other object types are listed one show command each, only the types that are replayed
+            for object_type, (show_kind, ddl_type) in SHOWN_OBJECT_TYPES.items():
+                if not self.object_policy.allows_type(object_type):
+                    continue
+                
+                df_shown = show(f"""show {show_kind} in schema {schema_name}""", self.selector.like(database, schema))
+                if df_shown is None or df_shown.empty:
+                    continue
+                
+                arguments = df_shown['arguments'].tolist() if 'arguments' in df_shown else [None] * len(df_shown)
+                for name, object_arguments in zip(df_shown['name'].tolist(), arguments):
+                    if not self.selector.includes(database, schema, name):
+                        continue
+                    
+                    name = quote_identifier(name)
+                    if object_type in ('FUNCTION', 'PROCEDURE'):
+                        name += _signature(object_arguments)
+                    list_of_commands += object_ddl(schema, schema_name, ddl_type, name)
+        
+        log(f"{database}: read {len(list_of_commands)} statements of the selected schemas and objects")
+        
+        return [sql for sql in list_of_commands if self.object_policy.allows(sql)]
+    
+    
+    def _diff_database(self, database, list_of_commands, target_cur, log):
+        """ Keeps the statements of a database that differ from the target account,
+            plus drops for target objects that are no longer in the source
+        """
+        
+        target_ddl = self._target_snapshot().database_ddl(database, target_cur.connection)
+        if target_ddl is None:
+            return list_of_commands
+        
+        target_commands = filter_ddl(target_ddl, self.object_policy)
+        diff_commands = diff_statements(list_of_commands, target_commands)
+        
+        # target objects outside of the selection are left alone
+        if self.diff_drops and self.selector.includes_all(database):
+            diff_commands += drop_missing_objects(list_of_commands, target_commands)
+            
+        log(f"{database}: {len(diff_commands)} of {len(list_of_commands)} statements differ from the target")
+        
+        return diff_commands
+    
+    
+    def _execute(self, phase, sql_list, target_cur, log = print, group = ""):
+        """ Executes the statements of a phase on the target account,
+            or adds them to the plan when a plan is being compiled
+        """
+        
+        if self._plan is not None:
+            self._plan.add(phase, sql_list, group)
+            return
+        
+        if self.journal is not None:
+            pending_sql_list = self.journal.pending(sql_list)
+            if len(pending_sql_list) < len(sql_list):
+                log(f"{phase}: skipping {len(sql_list) - len(pending_sql_list)} statements applied by an earlier run")
+            sql_list = pending_sql_list
+        
+        def on_result(sql, error, seconds):
+            self.metrics.record_statement(sql, seconds, error, phase)
+            if self.journal is not None:
+                self.journal.record(sql, phase, error)
+        
+        if self.async_grants and phase in GRANT_PHASES:
+            # ownership transfers revoke current grants, so they have to finish before the other grants start
+            ownership_sql_list = [sql for sql in sql_list if 'REVOKE CURRENT GRANTS' in sql]
+            other_sql_list = [sql for sql in sql_list if 'REVOKE CURRENT GRANTS' not in sql]
+            
+            for wave in [ownership_sql_list, other_sql_list]:
+                execute_sql_async(wave, target_cur.connection, max_in_flight = self.max_in_flight,
+                                  return_sql = self.return_sql, return_errors = True, log = log, on_result = on_result,
+                                  controller = self.controller)
+            return
+        
+        execute_sql_list(sql_list, target_cur, return_sql = self.return_sql, return_errors = True, log = log,
+                         batch_size = self.batch_size, on_result = on_result, controller = self.controller)
+    
+    
+    def _register_drops(self, kind, sql_list):
+        """ Adds the drop statements of an object type to the drop list (and the journal) """
+        
+        self.sql_drop_list += sql_list
+        
+        if self.journal is not None and self._plan is None:
+            self.journal.record_drops(kind, sql_list)
+    
+    
+    def _target_snapshot(self):
+        """ Returns the snapshot of the target account used by diff mode """
+        
+        with self._worker_lock:
+            if self._snapshot is None:
+                self._snapshot = target_snapshot(self.target_conn)
+        
+        return self._snapshot
+    
+    
+    def _diff_grants(self, phase, grant_sql_list, build_sql):
+        """ In diff mode, removes the grants that already exist in the target account.
+            The target grants are read with the metadata backend of the phase and turned into
+            sql the same way, only the normalized statements are kept
+        """
+        
+        if not self.diff_mode:
+            return grant_sql_list
+        
+        with self._diff_lock:
+            if phase not in self._target_grants:
+                target_grants = set()
+                for df_chunk in getattr(self._metadata(phase, target = True), phase)(self.target_conn):
+                    target_grants.update(normalize_sql(grant) for grant in build_sql(df_chunk))
+                self._target_grants[phase] = target_grants
+        
+        return [grant for grant in grant_sql_list if normalize_sql(grant) not in self._target_grants[phase]]
+    
+    
+    def _metadata(self, phase, target = False):
+        """ The metadata backend a phase reads roles, users or grants with (see metadata_backend).
+            The phases using the same backend share it, the backend of each phase is recorded in the run report
+        """
+        
+        name = self.metadata_backend.get(phase, 'account_usage') if isinstance(self.metadata_backend, dict) \
+               else self.metadata_backend
+        
+        with self._worker_lock:
+            if (name, target) not in self._backends:
+                if target:
+                    backend = metadata_backend(name, self.target_pool, self.chunk_size, max_workers = self.max_workers)
+                else:
+                    backend = metadata_backend(name, self.source_pool, self.chunk_size, cache = self.cache,
+                                               metrics = self.metrics, max_workers = self.max_workers)
+                self._backends[(name, target)] = backend
+        
+        if not target:
+            self.metrics.record_backend(phase, name)
+        
+        return self._backends[(name, target)]
+    
+    
+    def _connections(self):
+        """ Returns the source connection and target cursor for the calling thread.
+            Worker threads take their own pair of connections from the pools
+        """
+        
+        if threading.get_ident() == self._owner_thread:
+            return self.source_conn, self.target_cur
+        
+        if getattr(self._local, 'generation', None) != self._worker_generation:
+            source_conn = self.source_pool.acquire()
+            target_conn = self.target_pool.acquire() if self.target_pool is not None else None
+            
+            self._local.source_conn = source_conn
+            self._local.target_cur = target_conn.cursor() if target_conn is not None else None
+            self._local.generation = self._worker_generation
+            
+            with self._worker_lock:
+                self._worker_conns += [(self.source_pool, source_conn)]
+                if target_conn is not None:
+                    self._worker_conns += [(self.target_pool, target_conn)]
+        
+        return self._local.source_conn, self._local.target_cur
+    
+    
+    def _close_worker_connections(self):
+        """ Returns the connections taken by worker threads to the pools,
+            where they stay open for the next phase or run
+        """
+        
+        with self._worker_lock:
+            worker_conns, self._worker_conns = self._worker_conns, []
+            # threads still holding a released connection take a new one
+            self._worker_generation += 1
+            
+        for pool, conn in worker_conns:
+            try:
+                pool.release(conn)
+            except Exception:
+                pass
+        
+    
+    
+    @timed_phase
     def roles(self):
         """ - Reads roles from the source account
             - Creates roles in the target account
             - Outputs a list of sql for dropping objects
         """
         
-        # don't re-create default roles
-        sql = """select * from snowflake.account_usage.roles
-                    where name not like 'PUBLIC' and
-                    name not like 'ACCOUNTADMIN' and
-                    name not like 'SECURITYADMIN' and 
-                    name not like 'ORGADMIN' and
-                    name not like 'USERADMIN' and
-                    name not like 'SYSADMIN';"""
-        df_roles = fetch_data_df(sql, self.source_conn)
+        source_conn, target_cur = self._connections()
+        
+        # default roles aren't re-created
+        df_roles = self._metadata('roles').roles(source_conn)
             
             
         roles = df_roles['NAME'].values.tolist()
-        self.drop_roles_sql_list = [f"""DROP ROLE IF EXISTS "{role}";""" for role in roles]
-        self.sql_drop_list += self.drop_roles_sql_list
+        self.drop_roles_sql_list = [f"""DROP ROLE IF EXISTS {quote_identifier(role)};""" for role in roles]
+        self._register_drops('roles', self.drop_roles_sql_list)
         
-        roles_sql =  [f"""CREATE OR REPLACE ROLE {role}""" for role in roles]
+        roles_sql =  [f"""CREATE OR REPLACE ROLE {quote_identifier(role)}""" for role in roles]
+        
+        if self.diff_mode:
+            target_roles = self._target_snapshot().roles()
+            roles_sql = [f"""CREATE OR REPLACE ROLE {quote_identifier(role)}""" for role in roles if role not in target_roles]
+            
+            if self.diff_drops:
+                extra_roles = target_roles - set(roles) - set(DEFAULT_ROLES)
+                roles_sql += [f"""DROP ROLE IF EXISTS {quote_identifier(role)};""" for role in sorted(extra_roles)]
     
-        execute_sql_list(roles_sql, self.target_cur, return_sql = self.return_sql, return_errors = True)
+        self._execute('roles', roles_sql, target_cur)
         
       
         
+    @timed_phase
     def users(self):
         """ - Reads users from the source account
             - Creates users in the target account
@@ -277,14 +1025,12 @@ class transcribe_snowflake_account:
             - Users created with: name, login_name, display_name, default_role, email
         """
         
+        source_conn, target_cur = self._connections()
+        
         self.user_drop_list = []
         
         ## Ingore default snowflake role and the user who was used to create the account
-        sql = """select * from snowflake.account_usage.users
-                where name not like 'SNOWFLAKE' and
-                created_on not in (SELECT min(created_on) FROM snowflake.account_usage.users);"""
-        
-        df_users = fetch_data_df(sql, self.source_conn)
+        df_users = self._metadata('users').users(source_conn)
 
         
         names = df_users['NAME'].values.tolist()
@@ -293,46 +1039,61 @@ class transcribe_snowflake_account:
         default_roles = df_users['DEFAULT_ROLE'].values.tolist()
         emails = df_users['EMAIL'].values.tolist()
         
-        self.drop_user_sql_list = [f"""DROP USER IF EXISTS "{user}";""" for user in names]
-        self.sql_drop_list += self.drop_user_sql_list
+        self.drop_user_sql_list = [f"""DROP USER IF EXISTS {quote_identifier(user)};""" for user in names]
+        self._register_drops('users', self.drop_user_sql_list)
         
         user_sql_list = []
+        target_users = self._target_snapshot().users() if self.diff_mode else {}
         
         # Construct user sql strings
         for i in range(0, len(df_users)):
 
-            name = f'"{names[i]}"'
+            name = quote_identifier(names[i])
             password = "'abc123'"
 
-            if login_names[i] != None:
-                login_name = f"login_name='{login_names[i]}'"
+            if not is_missing(login_names[i]):
+                login_name = f"login_name={quote_literal(login_names[i])}"
             else:
                 login_name = ""
 
-            if display_names[i] != None:
-                display_name = f" display_name='{display_names[i]}'"
+            if not is_missing(display_names[i]):
+                display_name = f" display_name={quote_literal(display_names[i])}"
             else:
                 display_name = ""
 
-            if default_roles[i] != None:   
-                default_role = f" default_role={default_roles[i]}"
+            if not is_missing(default_roles[i]):   
+                default_role = f" default_role={quote_identifier(default_roles[i])}"
             else:
                 default_role = ""
 
-            if emails[i] != None:
-                email = f" email='{emails[i]}'"
+            if not is_missing(emails[i]):
+                email = f" email={quote_literal(emails[i])}"
             else:
                 email = ""
 
+            # in diff mode existing users are altered, and only if they differ.
+            # an ALTER USER ... SET without properties isn't valid, users without any are left alone
+            if names[i] in target_users:
+                source_user = normalize_values([login_names[i], display_names[i], default_roles[i], emails[i]])
+                if source_user != target_users[names[i]] and (login_name or display_name or default_role or email):
+                    user_sql_list += [f"""ALTER USER {name} SET {login_name} {display_name} {default_role} {email}"""]
+                continue
+
             sql = [f"""CREATE OR REPLACE USER {name} password={password} {login_name} \
                         {display_name} {default_role} {email}"""]
 
             user_sql_list += sql
+        
+        if self.diff_mode and self.diff_drops:
+            snapshot = self._target_snapshot()
+            extra_users = set(target_users) - set(names) - snapshot.protected_users()
+            user_sql_list += [f"""DROP USER IF EXISTS {quote_identifier(user)};""" for user in sorted(extra_users)]
             
-        execute_sql_list(user_sql_list, self.target_cur, return_sql = self.return_sql, return_errors = True)
+        self._execute('users', user_sql_list, target_cur)
 
         
     
+    @timed_phase
     def warehouses(self):
         """ - Reads warehouses from the source account
             - Creates warehouses in the target account
@@ -340,163 +1101,274 @@ class transcribe_snowflake_account:
             - Warehouses created with: name, size
         """
         
+        source_conn, target_cur = self._connections()
+        
         sql = """show warehouses;"""
-        df_wh = fetch_data_df(sql, self.source_conn)
+        df_wh = fetch_data_df(sql, source_conn, cache = self.cache, metrics = self.metrics)
 
         warehouses = df_wh['name'].values.tolist()
         wh_sizes = df_wh['size'].values.tolist()
         
-        self.drop_wh_list = [f"""DROP WAREHOUSE "{wh}";""" for wh in warehouses]
-        self.sql_drop_list += self.drop_wh_list
+        self.drop_wh_list = [f"""DROP WAREHOUSE {quote_identifier(wh)};""" for wh in warehouses]
+        self._register_drops('warehouses', self.drop_wh_list)
 
-        wh_list = [ f"""CREATE OR REPLACE warehouse {wh} warehouse_size='{size}' initially_suspended=true;""" \
+        wh_list = [ f"""CREATE OR REPLACE warehouse {quote_identifier(wh)} warehouse_size={quote_literal(size)} """ \
+                    """initially_suspended=true;""" \
                    for wh, size in zip(warehouses, wh_sizes)]
         
-        execute_sql_list(wh_list, self.target_cur, return_sql = self.return_sql, return_errors = True)
+        # in diff mode only create missing warehouses and resize the ones that changed
+        if self.diff_mode:
+            snapshot = self._target_snapshot()
+            target_wh = snapshot.warehouses()
+            wh_list = [ f"""CREATE OR REPLACE warehouse {quote_identifier(wh)} warehouse_size={quote_literal(size)} """ \
+                         """initially_suspended=true;""" \
+                       for wh, size in zip(warehouses, wh_sizes) if wh not in target_wh]
+            wh_list += [ f"""ALTER WAREHOUSE {quote_identifier(wh)} SET warehouse_size={quote_literal(size)};""" \
+                        for wh, size in zip(warehouses, wh_sizes) \
+                        if wh in target_wh and normalize_values([size]) != target_wh[wh]]
+            
+            if self.diff_drops:
+                extra_wh = set(target_wh) - set(warehouses) - snapshot.protected_warehouses()
+                wh_list += [f"""DROP WAREHOUSE IF EXISTS {quote_identifier(wh)};""" for wh in sorted(extra_wh)]
+        
+        self._execute('warehouses', wh_list, target_cur)
         
 
     
+    @timed_phase
     def user_role_grants(self):
         """ - Reads grants from the source account
             - Creates role grants for users in the target account
             - Future grants not supported yet
         """
         
-        sql = """select * from snowflake.account_usage.grants_to_users;"""
-        df_user_grants  = fetch_data_df(sql, self.source_conn)
+        source_conn, target_cur = self._connections()
         
-        
-        # only get the grants that still exist
-        df_user_grants = df_user_grants[df_user_grants['DELETED_ON'].isnull()]
-
-        roles = df_user_grants['ROLE'].values.tolist()
-        users = df_user_grants['GRANTEE_NAME'].values.tolist()
-        
-        user_role_grant_list = [f"""GRANT ROLE "{role}" TO USER "{user}";""" \
-                                for role, user in zip(roles, users)]
+        # rows are fetched, turned into sql and executed one chunk at a time
+        for df_user_grants in self._metadata('user_role_grants').user_role_grants(source_conn):
+            
+            user_role_grant_list = user_role_grant_sql(df_user_grants)
+            user_role_grant_list = self._diff_grants('user_role_grants', user_role_grant_list, user_role_grant_sql)
 
-        execute_sql_list(user_role_grant_list, self.target_cur, return_sql = self.return_sql, return_errors = True)
+            self._execute('user_role_grants', user_role_grant_list, target_cur)
         
         
         
+    @timed_phase
     def role_role_grants(self): 
         """ - Reads grants from the source account
             - Creates role grants for roles in the target account
             - Future grants not supported yet
         """
         
-        sql = """select * from snowflake.account_usage.grants_to_roles;"""
-        df_grants  = fetch_data_df(sql, self.source_conn)
+        source_conn, target_cur = self._connections()
         
-        # just looking at roles in this step
-        df_role_grants = df_grants[df_grants['GRANTED_ON'] == 'ROLE']
+        for df_role_grants in self._metadata('role_role_grants').role_role_grants(source_conn):
         
-        # only get the grants that still exist
-        df_role_grants = df_role_grants[df_role_grants ['DELETED_ON'].isnull()]
-        
-        role_sources = df_role_grants['NAME'].values.tolist()
-        role_targets =df_role_grants['GRANTEE_NAME'].values.tolist()
-        
-        role_role_grant_list = [f"""GRANT ROLE "{role_source}" TO ROLE "{role_target}";""" \
-                                    for role_source, role_target in zip(role_sources, role_targets)]
-        
-        execute_sql_list(role_role_grant_list, self.target_cur, return_sql = self.return_sql, return_errors = True)
+            role_role_grant_list = role_role_grant_sql(df_role_grants)
+            role_role_grant_list = self._diff_grants('role_role_grants', role_role_grant_list, role_role_grant_sql)
+            
+            self._execute('role_role_grants', role_role_grant_list, target_cur)
         
         
             
         
+    @timed_phase
     def role_object_grants(self):
         """ - Reads grants from the source account
             - Creates object grants for roles in the target account
             - Future grants not supported yet
         """
         
-        sql = """select * from snowflake.account_usage.grants_to_roles;"""
-        df_grants  = fetch_data_df(sql, self.source_conn)
-        
-        supported_object_types = ['WAREHOUSE', 'DATABASE', 'SCHEMA', 'TABLE', 'VIEW']
-        df_obj_grants = df_grants[df_grants['GRANTED_ON'].isin(supported_object_types)]
-        
-        # filter out any snowflake objects
-        snowflake_obj_list = ['SNOWFLAKE_SAMPLE_DATA', 'SNOWFLAKE']
-        df_obj_grants = df_obj_grants[~df_obj_grants['NAME'].isin(snowflake_obj_list)]
-        
-        privileges = df_obj_grants['PRIVILEGE'].values.tolist()
-        object_types = df_obj_grants['GRANTED_ON'].values.tolist()
-        object_names = df_obj_grants['NAME'].values.tolist()
-        object_name_schemas = df_obj_grants['TABLE_SCHEMA'].values.tolist()
-        object_name_dbs = df_obj_grants['TABLE_CATALOG'].values.tolist()
-        grantee_roles = df_obj_grants['GRANTEE_NAME'].values.tolist()
-
-        grants_sql_list = []
-        for i in range(0, len(df_obj_grants)):  
-            privilege = privileges[i]
-            object_type = object_types[i]
-            object_name = object_names[i]
-            grantee_role = grantee_roles[i]
-            object_name_schema = object_name_schemas[i]
-            object_name_db = object_name_dbs[i]
-
-            # Some objects need a full name/path
-            if object_type == 'TABLE' or object_type == 'VIEW':
-                full_object_name = f"{object_name_db}.{object_name_schema}.{object_name}"
-            elif object_type == 'SCHEMA':
-                full_object_name = f"{object_name_db}.{object_name}"
-            else:
-                full_object_name = object_name
-
-            # some restrictions on granting ownership
-            if privilege == 'OWNERSHIP':   
-                sql = [f"""GRANT {privilege} ON {object_type} {full_object_name} TO ROLE  {grantee_role} REVOKE CURRENT GRANTS; """]
-            else:
-                sql = [f"""GRANT {privilege} ON {object_type} {full_object_name} TO ROLE  {grantee_role}; """]
-
-            grants_sql_list += sql
+        import pandas as pd
+        
+        source_conn, target_cur = self._connections()
+        
+        if self.compact_grants:
+            build_sql = lambda df: role_object_grant_sql(compact_object_grants(df))
+        else:
+            build_sql = role_object_grant_sql
+        
+        grant_rows, grant_statements = 0, 0
+        df_carry = None
+        
+        # only supported objects, no snowflake objects.
+        # ordered so the privileges of an object and grantee arrive together for compaction
+        for df_obj_grants in self._metadata('role_object_grants').role_object_grants(source_conn):
+            
+            # grants on objects outside of the selection
+            df_obj_grants = self.selector.selected_grants(df_obj_grants)
+            
+            if self.compact_grants:
+                if df_carry is not None:
+                    df_obj_grants = pd.concat([df_carry, df_obj_grants], ignore_index = True)
+                df_obj_grants, df_carry = _split_last_group(df_obj_grants)
+            
+            grants_sql_list = build_sql(df_obj_grants)
+            grant_rows += len(df_obj_grants)
+            grant_statements += len(grants_sql_list)
+            
+            grants_sql_list = self._diff_grants('role_object_grants', grants_sql_list, build_sql)
+                
+            self._execute('role_object_grants', grants_sql_list, target_cur)
+            
+        if df_carry is not None and not df_carry.empty:
+            grants_sql_list = build_sql(df_carry)
+            grant_rows += len(df_carry)
+            grant_statements += len(grants_sql_list)
             
-        execute_sql_list(grants_sql_list, self.target_cur, return_sql = self.return_sql, return_errors = True)
+            self._execute('role_object_grants', self._diff_grants('role_object_grants', grants_sql_list, build_sql),
+                          target_cur)
+            
+        if self.compact_grants and grant_statements:
+            print(f"compacted {grant_rows} object grants into {grant_statements} statements "
+                  f"({grant_rows / grant_statements:.1f}x fewer)")
+        
+        
+    def copy_account(self, max_parallel_phases = 4, phases = None):
+        """ Function to create all objects (the databases, schemas and objects of the selector)
+            - Phases that don't depend on each other run concurrently on their own connections,
+              grants start as soon as the objects they refer to exist
+            - phases limits the run to some of the phases of PHASE_DEPENDENCIES (eg. ['users', 'roles']),
+              the phases they depend on are expected to be done already. None runs every phase
+            - Prints the wall time of each phase and the critical path at the end
+        """
         
+        phases = list(PHASE_DEPENDENCIES) if phases is None else phases
+        unknown = set(phases) - set(PHASE_DEPENDENCIES)
+        if unknown:
+            raise ValueError(f"unknown phases {sorted(unknown)}, use some of {list(PHASE_DEPENDENCIES)}")
         
-    def copy_account(self):
-        """ Function to create all objects. Specific object selection not supported yet """
+        scheduler = phase_scheduler(max_workers = max_parallel_phases)
+        for phase in phases:
+            scheduler.add(phase, getattr(self, phase),
+                          depends_on = [depends_on for depends_on in PHASE_DEPENDENCIES[phase] if depends_on in phases])
         
-        self.database_objects()
-        self.users()
-        self.roles()
-        self.warehouses()
-        self.user_role_grants()
-        self.role_role_grants()
-        self.role_object_grants()
+        try:
+            scheduler.run()
+        finally:
+            self._close_worker_connections()
+            if self.journal is not None:
+                self.journal.sync()
         
         print("created account objects")
+        scheduler.report()
+        self.write_metrics()
+        
+        
+    def write_metrics(self):
+        """ Prints a timing summary and writes the run report / prometheus metrics when paths are set """
+        
+        self.metrics.record_execution(self.controller.report())
+        self.metrics.print_summary()
+        
+        if self.report_path:
+            self.metrics.to_json(self.report_path)
+        if self.metrics_path:
+            self.metrics.to_prometheus(self.metrics_path)
+        
+        
+        
+        
+    def compile_plan(self, path, max_parallel_phases = 4):
+        """ - Reads the source account and writes every statement copy_account would execute
+              to a plan file, together with the drop statements. Nothing is executed on the target
+            - The plan can be replayed on one or more target accounts with plan_replay.plan_replayer
+        """
+        
+        diff_mode, self.diff_mode = self.diff_mode, False
+        if diff_mode:
+            print("diff mode reads the target account, compiling a full plan instead")
+        
+        self.sql_drop_list = []
+        
+        try:
+            with replication_plan(path, self.source_account, PHASE_DEPENDENCIES) as plan:
+                self._plan = plan
+                self.copy_account(max_parallel_phases)
+                plan.add('drop', self.sql_drop_list)
+                
+        finally:
+            self._plan = None
+            self.diff_mode = diff_mode
+            
+        print(f"wrote {plan.statement_count} statements to {path}")
+        
         
+    def drop_objects(self, objects = 'all', max_workers = None):
+        """ Drops all created objects. Depends on other functions being ran,
+            or on a journal from an earlier run (the drop lists are read from it)
+            - users and roles go first, then warehouses and databases (see DROP_LEVELS)
+            - the drops of a level run concurrently on max_workers pooled connections,
+              None uses the max_workers of the replication
+        """
         
+        drop_lists = {'all': 'sql_drop_list',
+                      'databases': 'db_drop_sql_list',
+                      'users': 'drop_user_sql_list',
+                      'roles': 'drop_roles_sql_list',
+                      'warehouses': 'drop_wh_list'}
         
+        if objects not in drop_lists:
+            print(f"unknown objects: {objects}, can be one of {', '.join(drop_lists)}")
+            return
         
-    def drop_objects(self, objects = 'all'):
-        """ Drops all created objects. Depends on other functions being ran """
+        attribute = drop_lists[objects]
+        self._execute_drops(self._drop_list(objects, attribute), max_workers)
+        setattr(self, attribute, [])
         
-        if objects == 'all':
-            execute_sql_list(self.sql_drop_list, self.target_cur, self.return_sql )
-            self.sql_drop_list = []
+        # everything is gone, a rerun has to start over
+        if self.journal is not None:
+            if objects == 'all':
+                self.journal.reset()
+            else:
+                self.journal.clear_drops(objects, dependent_phases(DROP_PHASES[objects]))
+            
             
-        if objects == 'databases':
-            execute_sql_list(self.db_drop_sql_list, self.target_cur, self.return_sql)
-            self.db_drop_sql_list = []
+    def _execute_drops(self, sql_list, max_workers = None):
+        """ Executes drop statements level by level, the statements of a level are spread over the workers """
+        
+        workers = max(1, self.max_workers if max_workers is None else max_workers)
+        
+        for level in drop_levels(sql_list):
+            slices = [level[i::workers] for i in range(min(workers, len(level)))]
+            
+            with ThreadPoolExecutor(max_workers = len(slices)) as executor:
+                futures = [executor.submit(self._drop_slice, sql_slice) for sql_slice in slices]
+                
+                for future in as_completed(futures):
+                    for line in future.result():
+                        print(line)
             
-        if objects == 'users':
-            execute_sql_list(self.drop_user_sql_list, self.target_cur, self.return_sql)
-            self.drop_user_sql_list = []
             
+    def _drop_slice(self, sql_list):
+        """ Executes a share of the drops of one level on a worker thread, returns its log lines """
         
-        if objects == 'roles':
-            execute_sql_list(self.self.drop_roles_sql_list, self.target_cur, self.return_sql)
-            self.drop_roles_sql_list = []
+        log_lines = []
         
-        if objects == 'warehouses':
-            execute_sql_list(self.drop_wh_list, self.target_cur, self.return_sql)
-            self.drop_wh_list = []
+        def log(*args):
+            log_lines.append(" ".join(str(arg) for arg in args))
+        
+        def on_result(sql, error, seconds):
+            self.metrics.record_statement(sql, seconds, error, 'drop')
+        
+        # drops only need the target account, the connection goes back to the pool for the next level
+        try:
+            with self.target_pool.connection() as conn:
+                execute_sql_list(sql_list, conn.cursor(), return_sql = self.return_sql, return_errors = True,
+                                 log = log, batch_size = self.batch_size, on_result = on_result,
+                                 controller = self.controller)
+        except Exception as error:
+            log(error)
+            log(f"Could not drop {len(sql_list)} objects")
+        
+        return log_lines
             
+            
+    def _drop_list(self, kind, attribute):
+        """ The drop statements of an object type, from the journal when there is one """
         
-
-    
-    
\ No newline at end of file
+        if self.journal is not None:
+            return self.journal.drop_list(None if kind == 'all' else kind)
+        
+        return getattr(self, attribute)
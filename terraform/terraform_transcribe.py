@@ -1,152 +1,255 @@
 import pandas as pd
-import snowflake.connector 
-import configparser
+import os
+import sys
+import time
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+# the connection code is shared with the snowflake -> snowflake scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'snowflake'))
+from session_pool import session_pool
+from tf_writer import resource_writer, render_hcl
+
+
+# every grant of a role to a user or another role, in the columns of "show grants of role"
+ROLE_GRANTS_SQL = """select role, 'USER' as granted_to, grantee_name
+                       from snowflake.account_usage.grants_to_users
+                       where deleted_on is null
+                     union all
+                     select name as role, 'ROLE' as granted_to, grantee_name
+                       from snowflake.account_usage.grants_to_roles
+                       where granted_on = 'ROLE' and privilege = 'USAGE' and deleted_on is null"""
+
+# per resource content hashes of the last incremental run, kept in the output directory
+MANIFEST_FILE = '.tf_manifest.json'
+
+# show users columns written to snowflake_user resources
+USER_ATTRIBUTES = ['name', 'login_name', 'comment', 'disabled', 'display_name', 'email', 'first_name', 'last_name',
+                   'default_warehouse', 'default_role', 'must_change_password']
 
 
 class terraform_transcribe:
     
-    def __init__(self, config_file):
-        self.config = configparser.ConfigParser()
-        self.config.read(config_file)
+    # resource type -> generator method of (resource type, name, attributes) taking an optional connection.
+    # generate_files runs every extractor in this registry
+    RESOURCE_EXTRACTORS = {'snowflake_role': 'role_resources',
+                           'snowflake_user': 'user_resources',
+                           'snowflake_role_grants': 'role_grant_resources'}
+    
+    def __init__(self, config_file, config_name = 'snowflake', conn_type = 'password', pool_size = 4,
+                 grants_source = 'account_usage', chunk_size = 10000):
+        # rows of show roles / show users held in memory at a time
+        self.chunk_size = chunk_size
         
-        self.user = self.config['snowflake']['user']
-        self.password = self.config['snowflake']['password']
-        self.account = self.config['snowflake']['account']
+        # 'account_usage' reads every role grant in one query, 'show' runs show grants of role per role
+        self.grants_source = grants_source
         
-        self.conn = snowflake.connector.connect(
-                user = self.user,
-                password = self.password,
-                account = self.account
-            )
+        # connections are opened lazily from the pool, only the config is read here
+        self.pool = session_pool(config_file, config_name, conn_type, size = pool_size)
+        self.account = self.pool.account
         
-        self.cur = self.conn.cursor()
+        self._conn = None
+        self._cur = None
+        self.extract_seconds = {}
       
     
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = self.pool.acquire()
+        return self._conn
     
-    def create_role_resource(self):
+    
+    @property
+    def cur(self):
+        if self._cur is None:
+            self._cur = self.conn.cursor()
+        return self._cur
+    
+    
+    def _query_chunks(self, sql, conn = None):
+        """ Runs a query and yields its rows as dataframes of up to chunk_size rows """
         
-        sql = 'show roles'
-        roles_df = pd.read_sql(sql, self.conn)
-        print("total rows: ", )
-
-        tf_roles = []
-        for i in range(0, len(roles_df)):
-            role = roles_df['name'].values[i]
-            comment = roles_df['comment'].values[i]
-
-            # comment is an optional parameter
-            if comment == '':
-                tf_role = (f"""resource "snowflake_role" "{role}" {{ \n \t name = "{role}" \n }} \n \n""")
-            else:
-                tf_role = f"""resource "snowflake_role" "{role}" {{ \n \t name = "{role}" \n \t comment = "{comment}" \n }} \n \n"""
-
-            tf_roles.append(tf_role)
-
-        tf_roles_str = ''.join(tf_roles)
-
-        return tf_roles_str
+        cur = (conn or self.conn).cursor()
+        try:
+            cur.execute(sql)
+            columns = [col[0] for col in cur.description]
+            
+            while True:
+                rows = cur.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                yield pd.DataFrame(rows, columns = columns)
+        finally:
+            cur.close()
+    
+    
+    def role_resources(self, conn = None):
+        """ Generator of ('snowflake_role', name, attributes) for every role """
+        
+        for roles_df in self._query_chunks('show roles', conn):
+            for role, comment in zip(roles_df['name'], roles_df['comment']):
+                attrs = {'name': role}
+                
+                # comment is an optional parameter
+                if comment:
+                    attrs['comment'] = comment
+                    
+                yield 'snowflake_role', role, attrs
+    
+    
+    def create_role_resource(self):
+        return ''.join(render_hcl(*resource) for resource in self.role_resources())
 
     
     
+    def user_resources(self, conn = None):
+        """ Generator of ('snowflake_user', name, attributes) for every user """
+        
+        for users_df in self._query_chunks('show users', conn):
+            for user in users_df[USER_ATTRIBUTES].to_dict('records'):
+                attrs = {key: value for key, value in user.items() if value is not None}
+                
+                for key in ('disabled', 'must_change_password'):
+                    if key in attrs:
+                        attrs[key] = str(attrs[key]).lower() == 'true'
+                        
+                yield 'snowflake_user', user['name'], attrs
+    
+    
     def create_user_resource(self):
+        return ''.join(render_hcl(*resource) for resource in self.user_resources())
+
+    
+    
+    def fetch_role_grants(self, conn = None):
+        """ Returns every grant of a role to a user or role as a dataframe (role, granted_to, grantee_name)
+            - 'account_usage': one bulk query (the views can lag behind by up to 2 hours)
+            - 'show': one "show grants of role" per role, up to pool_size - 1 at a time.
+              Also used when the account_usage views can't be read
+        """
         
-        sql = 'show users'
-        users_df = pd.read_sql(sql, self.conn)
+        conn = conn or self.conn
         
-        print("total users: ", len(users_df))
-
-        tf_users = []
-        for i in range(0, len(users_df)):
-            name = users_df['name'].values[i]
-            login_name = users_df['login_name'].values[i]
-            comment = users_df['comment'].values[i]
-            disabled = users_df['disabled'].values[i]
-            display_name = users_df['display_name'].values[i]
-            email = users_df['email'].values[i]
-            first_name = users_df['first_name'].values[i]
-            last_name = users_df['last_name'].values[i]
-            default_warehouse = users_df['default_warehouse'].values[i]
-            default_role = users_df['default_role'].values[i]
-            must_change_password = users_df['must_change_password'].values[i]
-
-            tf_user = f"""resource "snowflake_user" "{name}" {{ \n \
-                          name         = "{name}" \n \
-                          login_name   = "{login_name}" \n \
-                          comment      = "{comment}" \n \
-                          disabled     = {disabled} \n \
-                          display_name = "{display_name}" \n \
-                          email        = "{email}" \n \
-                          first_name   = "{first_name}" \n \
-                          last_name    = "{last_name}" \n \
-                          default_warehouse = "{default_warehouse}" \n \
-                          default_role      = "{default_role}" \n \
-                          must_change_password = {must_change_password} \n }} \n \n"""
-
-
-            tf_users.append(tf_user)
-
-        tf_users_str = ''.join(tf_users)
-
-        return tf_users_str
-
+        if self.grants_source == 'account_usage':
+            try:
+                grants_df = pd.read_sql(ROLE_GRANTS_SQL, conn)
+                grants_df.columns = [column.lower() for column in grants_df.columns]
+                return grants_df
+            
+            except Exception as error:
+                print(error)
+                print("could not read snowflake.account_usage, reading grants with show grants of role")
+        
+        roles = pd.read_sql('show roles', conn)['name'].values.tolist()
+        
+        def show_grants(conn, role):
+            return pd.read_sql(f'show grants of role "{role}"', conn)[['role', 'granted_to', 'grantee_name']]
+        
+        # conn is held by this thread, the workers share the rest of the pool
+        if self.pool.size <= 1:
+            grant_dfs = [show_grants(conn, role) for role in roles]
+        else:
+            def worker(role):
+                with self.pool.connection() as conn:
+                    return show_grants(conn, role)
+            
+            with ThreadPoolExecutor(max_workers = self.pool.size - 1) as executor:
+                grant_dfs = list(executor.map(worker, roles))
+        
+        if not grant_dfs:
+            return pd.DataFrame(columns = ['role', 'granted_to', 'grantee_name'])
+        
+        return pd.concat(grant_dfs, ignore_index = True)
     
     
-    def create_role_grants_resource(self):
-        sql = 'show roles'
-        roles_df = pd.read_sql(sql, self.conn)
-        
-        # get grants for all roles (also shows users)
-        grants_df = pd.DataFrame()
-        for i in range(0, len(roles_df)):
-            role = roles_df['name'].values[i]
-            sql = f'show grants of role "{role}"'
-            print(sql)
-            grant_df = pd.read_sql(sql, self.conn)
-
-            grants_df = pd.concat([grant_df, grants_df], ignore_index=True)
+    def role_grant_resources(self, conn = None):
+        """ Generator of ('snowflake_role_grants', name, attributes), one per role with grants """
         
+        grants_df = self.fetch_role_grants(conn)
         
-        tf_role_map = []
-        for i in range(0, len(grants_df['role'].unique())):
-            role = grants_df['role'].unique()[i]
-            print(role)
-
-            role_users = grants_df[(grants_df['role'] == role) & \
-                              (grants_df['granted_to'] == 'USER')]['grantee_name'].values.tolist()
-            role_roles = grants_df[(grants_df['role'] == role) & \
-                              (grants_df['granted_to'] == 'ROLE')]['grantee_name'].values.tolist()
-
-            role_users_str = "[ \n" + ", \n".join([f""" \t \t "${{ {unique_user} }}" """ for unique_user in role_users]) + " \n \t ]"
-            role_roles_str = "[ \n" + ", \n".join([f""" \t \t "${{ {unique_role} }}" """ for unique_role in role_roles]) + " \n \t ]"
-
-            tf_grants = f"""resource "snowflake_role_grants" "{role}_grants" {{
-                    role_name = "${{snowflake.role.role.{role}}}"  \n
-                    roles = {role_roles_str} \n
-                    users = {role_users_str}  \n }}  \n \n"""
-
-            tf_role_map.append(tf_grants)
-
-        tf_users_str = ''.join(tf_role_map)
+        # grantees of each role in one pass: (role, granted_to) -> [grantee_name, ...]
+        grantees = grants_df.groupby(['role', 'granted_to'], sort = False)['grantee_name'].agg(list).to_dict()
         
-        return tf_users_str
+        for role in grants_df['role'].unique():
+            role_users = grantees.get((role, 'USER'), [])
+            role_roles = grantees.get((role, 'ROLE'), [])
+            
+            yield 'snowflake_role_grants', f"{role}_grants", \
+                  {'role_name': f"${{snowflake.role.role.{role}}}",
+                   'roles': [f"${{ {unique_role} }}" for unique_role in role_roles],
+                   'users': [f"${{ {unique_user} }}" for unique_user in role_users]}
+    
+    
+    def create_role_grants_resource(self):
+        return ''.join(render_hcl(*resource) for resource in self.role_grant_resources())
 
         
     def close_conn(self):
-        self.conn.close()
+        if self._conn is not None:
+            self.pool.release(self._conn)
+            self._conn, self._cur = None, None
+        self.pool.close()
         return print("closed connection")
     
-    def generate_files(self):
-        tf_roles_all = self.create_role_resource()
-        with open('tf_roles.tf', 'w') as f:
-            f.write(tf_roles_all)
-        tf_users_all = self.create_user_resource()
-        with open('tf_users.tf', 'w') as f:
-            f.write(tf_users_all)
-        tf_grants_all = self.create_role_grants_resource()
-        with open('tf_grants.tf', 'w') as f:
-            f.write(tf_grants_all)
+    def generate_files(self, directory = '.', shard_by = None, shard_count = 16, prefix_length = 1,
+                       output_format = 'hcl', buffer_size = 1000, incremental = False, max_workers = None):
+        """ Streams the resources of every extractor in RESOURCE_EXTRACTORS to terraform files in directory,
+            see tf_writer.resource_writer for the sharding and output options.
+            - incremental only rewrites the files whose resources changed since the last incremental run
+              (tracked in directory/.tf_manifest.json)
+            - extractors run concurrently on up to max_workers pooled connections (None: one per extractor,
+              1: one after the other), the files of a resource type are completed as soon as its extractor ends
+        """
+        
+        manifest_path = os.path.join(directory, MANIFEST_FILE) if incremental else None
+        
+        # a connection held by this thread isn't available to the workers
+        max_workers = min(max_workers or len(self.RESOURCE_EXTRACTORS), self.pool.size - (self._conn is not None))
+        
+        seconds = {}
+        
+        with resource_writer(directory, shard_by = shard_by, shard_count = shard_count,
+                             prefix_length = prefix_length, output_format = output_format,
+                             buffer_size = buffer_size, manifest_path = manifest_path) as writer:
+            
+            def extract(resource_type, conn = None):
+                start = time.perf_counter()
+                writer.write_all(getattr(self, self.RESOURCE_EXTRACTORS[resource_type])(conn))
+                writer.finish(resource_type)
+                seconds[resource_type] = time.perf_counter() - start
+                
+            def worker(resource_type):
+                with self.pool.connection() as conn:
+                    extract(resource_type, conn)
+            
+            if max_workers <= 1:
+                for resource_type in self.RESOURCE_EXTRACTORS:
+                    extract(resource_type)
+            else:
+                with ThreadPoolExecutor(max_workers = max_workers) as executor:
+                    futures = {executor.submit(worker, resource_type): resource_type
+                               for resource_type in self.RESOURCE_EXTRACTORS}
+                    
+                    for future in as_completed(futures):
+                        future.result()
+                        print(f"{futures[future]}: {writer.counts.get(futures[future], 0)} resources "
+                              f"in {seconds[futures[future]]:.1f}s")
+        
+        if max_workers <= 1:
+            for resource_type, count in writer.counts.items():
+                print(f"{resource_type}: {count} resources in {seconds[resource_type]:.1f}s")
+        
+        if incremental:
+            print("{added} added, {changed} changed, {removed} removed resources".format(**writer.changes))
+            print(f"rewrote {len(writer.rewritten)} of {len(writer.paths)} files, "
+                  f"removed {len(writer.removed_files)} files that are no longer produced")
+        else:
+            print(f"wrote {len(writer.paths)} files")
+        
+        self.extract_seconds = seconds
+        
+        return writer.paths
 
 
 
@@ -0,0 +1,305 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+
+
+
+# file name of each resource type when the output isn't sharded
+RESOURCE_FILES = {'snowflake_role': 'tf_roles',
+                  'snowflake_user': 'tf_users',
+                  'snowflake_role_grants': 'tf_grants'}
+
+
+
+def hcl_value(value):
+    """ A python value as an hcl expression: strings are quoted, lists become tuples """
+
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+
+    if isinstance(value, (int, float)):
+        return str(value)
+
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return '[]'
+        return "[\n" + "".join(f"    {hcl_value(item)},\n" for item in value) + "  ]"
+
+    return json.dumps(str(value))
+
+
+
+def render_hcl(resource_type, name, attrs):
+    """ One resource block in hcl """
+
+    width = max((len(key) for key in attrs), default = 0)
+    body = "".join(f"  {key:<{width}} = {hcl_value(value)}\n" for key, value in attrs.items())
+
+    return f'resource "{resource_type}" "{name}" {{\n{body}}}\n\n'
+
+
+
+class resource_writer:
+    """
+    Streams terraform resources to disk as they are generated. Resources are rendered
+    as they come in and written in batches, so only buffer_size of them are held in memory.
+    Each resource type gets its own file(s), optionally split into shards.
+    Extractors of different resource types can write from their own threads.
+    Files are written to a temporary file that replaces the file once its resource type
+    is finished: when the writer is left with an exception the unfinished files are
+    removed and the existing files are kept
+
+    Attributes:
+        directory : str
+            where the files are written
+        shard_by : str
+            None writes one file per resource type (tf_roles.tf, ...). 'prefix' splits each type by the
+            first prefix_length characters of the resource name (tf_users_a.tf, ...), 'hash' into
+            shard_count files by a hash of the name (tf_users_03.tf, ...)
+        shard_count : int
+            number of files per resource type when shard_by is 'hash'
+        prefix_length : int
+            characters of the name used as the shard key when shard_by is 'prefix'
+        output_format : str
+            'hcl' writes .tf files, 'json' writes .tf.json files
+        buffer_size : int
+            rendered resources kept in memory before they are written
+        manifest_path : str
+            incremental mode: a manifest of the content hash of every resource in every file.
+            Files only replace the existing file when one of their resources changed, files that
+            are no longer produced are removed. None always rewrites every file
+
+    """
+
+    def __init__(self, directory = '.', shard_by = None, shard_count = 16, prefix_length = 1,
+                 output_format = 'hcl', buffer_size = 1000, manifest_path = None):
+
+        if shard_by not in (None, 'prefix', 'hash'):
+            raise ValueError(f"unknown shard_by: {shard_by}")
+        if output_format not in ('hcl', 'json'):
+            raise ValueError(f"unknown output format: {output_format}")
+
+        self.directory = directory
+        self.shard_by = shard_by
+        self.shard_count = shard_count
+        self.prefix_length = prefix_length
+        self.output_format = output_format
+        self.buffer_size = buffer_size
+        self.manifest_path = manifest_path
+
+        self.counts = {}
+        self.paths = []
+        self.rewritten = []
+        self.removed_files = []
+        self.changes = {'added': 0, 'changed': 0, 'removed': 0}
+        self._buffers = {}
+        self._buffered = 0
+        self._files = {}
+        self._file_types = {}
+        self._finished = []
+        self._lock = threading.Lock()
+
+        # file name -> {resource address: content hash}
+        self._hashes = {}
+        self._manifest = {}
+        if manifest_path and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self._manifest = json.load(f)['files']
+
+
+    def shard_key(self, name):
+        """ The shard of a resource name, None when the output isn't sharded """
+
+        if self.shard_by == 'prefix':
+            prefix = re.sub(r'[^a-z0-9]', '_', str(name)[:self.prefix_length].lower())
+            return prefix or '_'
+
+        if self.shard_by == 'hash':
+            width = len(str(self.shard_count - 1))
+            return f"{zlib.crc32(str(name).encode()) % self.shard_count:0{width}d}"
+
+        return None
+
+
+    def path(self, resource_type, shard):
+        stem = RESOURCE_FILES.get(resource_type, resource_type)
+        if shard is not None:
+            stem = f"{stem}_{shard}"
+
+        extension = '.tf.json' if self.output_format == 'json' else '.tf'
+        return os.path.join(self.directory, stem + extension)
+
+
+    def render(self, resource_type, name, attrs):
+        if self.output_format == 'json':
+            return f"{json.dumps(str(name))}: {json.dumps(attrs)}"
+
+        return render_hcl(resource_type, name, attrs)
+
+
+    def write(self, resource_type, name, attrs):
+        """ Adds one resource, the buffer is flushed once it holds buffer_size resources """
+
+        path = self.path(resource_type, self.shard_key(name))
+        rendered = self.render(resource_type, name, attrs)
+        digest = hashlib.sha1(rendered.encode()).hexdigest() if self.manifest_path else None
+
+        with self._lock:
+            self._buffers.setdefault((path, resource_type), []).append(rendered)
+            self._buffered += 1
+
+            if digest is not None:
+                self._hashes.setdefault(os.path.basename(path), {})[f"{resource_type}.{name}"] = digest
+
+            self.counts[resource_type] = self.counts.get(resource_type, 0) + 1
+
+            if self._buffered >= self.buffer_size:
+                self._flush()
+
+
+    def write_all(self, resources):
+        """ Writes an iterable of (resource type, name, attrs) """
+
+        for resource_type, name, attrs in resources:
+            self.write(resource_type, name, attrs)
+
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+
+    def _flush(self, resource_type = None):
+        """ Writes the buffered resources, of one resource type or all of them """
+
+        for (path, buffered_type), rendered in self._buffers.items():
+            if not rendered or resource_type not in (None, buffered_type):
+                continue
+
+            f = self._files.get(path)
+            if f is None:
+                # files are written next to the existing file until they are finished
+                f = self._files[path] = open(path + '.tmp', 'w')
+                self._file_types[path] = buffered_type
+                self.paths.append(path)
+                if self.output_format == 'json':
+                    f.write(f'{{\n"resource": {{\n{json.dumps(buffered_type)}: {{\n')
+                    f.write(",\n".join(rendered))
+                else:
+                    f.write("".join(rendered))
+            elif self.output_format == 'json':
+                f.write(",\n" + ",\n".join(rendered))
+            else:
+                f.write("".join(rendered))
+
+            self._buffered -= len(rendered)
+            rendered.clear()
+
+
+    def finish(self, resource_type):
+        """ Completes the files of one resource type, once every resource of the type was written """
+
+        with self._lock:
+            self._finish(resource_type)
+
+
+    def _finish(self, resource_type):
+        self._flush(resource_type)
+
+        for path, f in list(self._files.items()):
+            if self._file_types[path] != resource_type:
+                continue
+
+            if self.output_format == 'json':
+                f.write("\n}\n}\n}\n")
+            f.close()
+            del self._files[path]
+
+            self._replace(path)
+            self._finished.append(os.path.basename(path))
+
+
+    def _replace(self, path):
+        """ Replaces a file with its finished temporary file. In incremental mode only when
+            the hashes of its resources changed
+        """
+
+        name = os.path.basename(path)
+        if not self.manifest_path or self._hashes.get(name) != self._manifest.get(name) or not os.path.exists(path):
+            os.replace(path + '.tmp', path)
+            self.rewritten.append(path)
+        else:
+            os.remove(path + '.tmp')
+
+
+    def close(self):
+        """ Writes what is left in the buffer and closes the files """
+
+        with self._lock:
+            self._flush()
+
+            for resource_type in set(self._file_types[path] for path in self._files):
+                self._finish(resource_type)
+
+            if self.manifest_path:
+                self._apply_changes()
+
+
+    def abort(self):
+        """ Removes the files that weren't finished and keeps the existing ones. In incremental
+            mode the manifest is only updated for the files that were finished
+        """
+
+        with self._lock:
+            for path, f in list(self._files.items()):
+                f.close()
+                os.remove(path + '.tmp')
+                del self._files[path]
+
+            self._buffers.clear()
+            self._buffered = 0
+
+            if self.manifest_path and self._finished:
+                files = dict(self._manifest, **{name: self._hashes[name] for name in self._finished})
+                self._write_manifest(files)
+
+
+    def _apply_changes(self):
+        """ Removes the files that aren't produced anymore, counts the added / changed / removed
+            resources and writes the new manifest
+        """
+
+        old = {address: digest for hashes in self._manifest.values() for address, digest in hashes.items()}
+        new = {address: digest for hashes in self._hashes.values() for address, digest in hashes.items()}
+
+        self.changes = {'added': len(new.keys() - old.keys()),
+                        'changed': sum(1 for address in new.keys() & old.keys() if new[address] != old[address]),
+                        'removed': len(old.keys() - new.keys())}
+
+        for name in self._manifest.keys() - self._hashes.keys():
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path):
+                os.remove(path)
+                self.removed_files.append(path)
+
+        self._write_manifest(self._hashes)
+
+
+    def _write_manifest(self, files):
+        with open(self.manifest_path + '.tmp', 'w') as f:
+            json.dump({'files': files}, f, indent = 1, sort_keys = True)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
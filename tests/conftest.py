@@ -0,0 +1,93 @@
+""" Tests run against the fake accounts of benchmarks/fake_snowflake.py, no snowflake account is needed.
+
+    python -m pytest tests
+"""
+
+import itertools
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path[:0] = [os.path.join(ROOT, 'benchmarks'), os.path.join(ROOT, 'snowflake'), os.path.join(ROOT, 'terraform')]
+
+import fake_snowflake
+
+# the fake connector has to be in place before the replication modules import it.
+# accounts are added to the registry per test
+REGISTRY = fake_snowflake.install()
+
+CONFIG = """[snowflake_source_account]
+user = test
+password = test
+account = {source}
+warehouse = TEST_WH
+
+[snowflake_target_account]
+user = test
+password = test
+account = {target}
+warehouse = TEST_WH
+
+[snowflake]
+user = test
+password = test
+account = {source}
+"""
+
+_names = itertools.count()
+
+
+
+def pytest_configure(config):
+    # pandas warns about every DBAPI connection that isn't sqlalchemy / sqlite
+    config.addinivalue_line('filterwarnings', 'ignore:pandas only supports SQLAlchemy')
+
+
+
+@pytest.fixture
+def fake_accounts(tmp_path):
+    """ make(source_scale, target_scale, **target_options) -> (source, target, config_file).
+        Requests don't sleep and the target keeps the statements it executed
+    """
+
+    def make(source_scale = 1, target_scale = 0, source_options = None, **target_options):
+        number = next(_names)
+        source = fake_snowflake.fake_account(f"test_source_{number}", source_scale, latency = 0.0,
+                                             statement_latency = 0.0, row_latency = 0.0, **(source_options or {}))
+        target_options = dict(dict(latency = 0.0, statement_latency = 0.0, row_latency = 0.0, keep_statements = True),
+                              **target_options)
+        target = fake_snowflake.fake_account(f"test_target_{number}", target_scale, **target_options)
+        REGISTRY.update({source.name: source, target.name: target})
+
+        config_file = tmp_path / f"accounts_{number}.config"
+        config_file.write_text(CONFIG.format(source = source.name, target = target.name))
+
+        return source, target, str(config_file)
+
+    return make
+
+
+
+@pytest.fixture
+def make_transcribe(fake_accounts):
+    """ make(source_scale, target_scale, target_options = None, **options) -> (transcribe, source, target) """
+
+    from transcribe import transcribe_snowflake_account
+
+    created = []
+
+    def make(source_scale = 1, target_scale = 0, target_options = None, source_options = None, **options):
+        source, target, config_file = fake_accounts(source_scale, target_scale, source_options,
+                                                    **(target_options or {}))
+        options = dict(dict(conn_type_source = 'password', conn_type_target = 'password', return_sql = False),
+                       **options)
+        sf_transcribe = transcribe_snowflake_account(config_file, **options)
+        created.append(sf_transcribe)
+        return sf_transcribe, source, target
+
+    yield make
+
+    for sf_transcribe in created:
+        sf_transcribe.close_connections()
@@ -0,0 +1,28 @@
+import fake_snowflake
+from async_grants import execute_sql_async
+
+
+
+def test_statements_run_as_async_queries_within_the_limit():
+    account = fake_snowflake.fake_account('async_target', 0, latency = 0.002, statement_latency = 0.01,
+                                          concurrency_limit = 8, keep_statements = True)
+    account._fails = lambda sql: sql.endswith('"R3"')
+    sql_list = [f'GRANT ROLE "R{i}" TO ROLE "R{i + 1}"' for i in range(40)]
+    results = {}
+
+    execute_sql_async(sql_list, fake_snowflake.fake_connection(account), max_in_flight = 8, poll_interval = 0.005,
+                      log = lambda *args: None, on_result = lambda sql, error, seconds: results.update({sql: error}))
+
+    assert sorted(account.executed) == sorted(sql for sql in sql_list if not sql.endswith('"R3"'))
+    assert [sql for sql, error in results.items() if error is not None] == ['GRANT ROLE "R2" TO ROLE "R3"']
+    assert account.throttled == 0 and account.in_flight == 0
+
+
+def test_async_grants_match_the_synchronous_ones(make_transcribe):
+    statements = []
+    for async_grants in [False, True]:
+        sf_transcribe, source, target = make_transcribe(async_grants = async_grants)
+        sf_transcribe.role_object_grants()
+        statements.append(sorted(target.executed))
+
+    assert statements[0] == statements[1] and statements[0]
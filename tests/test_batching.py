@@ -0,0 +1,46 @@
+import fake_snowflake
+from transcribe import execute_sql_list
+
+
+
+def target_cursor(failing = ()):
+    account = fake_snowflake.fake_account('batch_target', 0, latency = 0.0, statement_latency = 0.0,
+                                          keep_statements = True)
+    account._fails = lambda sql: sql in failing
+    return account, fake_snowflake.fake_connection(account).cursor()
+
+
+def grants(count):
+    return [f'GRANT ROLE "R{i}" TO ROLE "SYSADMIN";' for i in range(count)]
+
+
+
+def test_statements_are_sent_in_batches():
+    account, cursor = target_cursor()
+
+    execute_sql_list(grants(120), cursor, batch_size = 50)
+
+    assert account.requests == 3
+    assert account.statements == 120
+    assert account.executed == [sql.rstrip(';') for sql in grants(120)]
+
+
+def test_failing_statement_is_isolated_and_reported():
+    failing = grants(10)[6].rstrip(';')
+    account, cursor = target_cursor(failing = [failing])
+    results = []
+
+    execute_sql_list(grants(10), cursor, batch_size = 10, log = lambda *args: None,
+                     on_result = lambda sql, error, seconds: results.append((sql, error is None)))
+
+    assert sorted(results) == sorted((sql.rstrip(';'), sql.rstrip(';') != failing) for sql in grants(10))
+    assert set(account.executed) == set(sql.rstrip(';') for sql in grants(10)) - {failing}
+
+
+def test_batch_size_one_sends_every_statement_on_its_own():
+    account, cursor = target_cursor()
+
+    execute_sql_list(grants(5), cursor, batch_size = 1)
+
+    assert account.requests == 5
+    assert account.executed == [sql.rstrip(';') for sql in grants(5)]
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+from replication_plan import read_plan
+from sql_builder import is_true
+from transcribe import _split_last_group, compact_object_grants, role_object_grant_sql, transcribe_snowflake_account
+
+
+
+def grants(*rows):
+    return pd.DataFrame(rows, columns = ['PRIVILEGE', 'GRANTED_ON', 'NAME', 'TABLE_SCHEMA', 'TABLE_CATALOG',
+                                         'GRANTEE_NAME', 'GRANT_OPTION'])
+
+
+
+def test_privileges_of_an_object_and_role_are_merged():
+    df = grants(('SELECT', 'TABLE', 'T', 'S', 'DB', 'R', False),
+                ('INSERT', 'TABLE', 'T', 'S', 'DB', 'R', False),
+                ('SELECT', 'TABLE', 'T', 'S', 'DB', 'R2', True),
+                ('OWNERSHIP', 'TABLE', 'T', 'S', 'DB', 'R', False))
+
+    assert role_object_grant_sql(compact_object_grants(df)) == [
+        'GRANT OWNERSHIP ON TABLE "DB"."S"."T" TO ROLE  "R" REVOKE CURRENT GRANTS; ',
+        'GRANT INSERT, SELECT ON TABLE "DB"."S"."T" TO ROLE  "R"; ',
+        'GRANT SELECT ON TABLE "DB"."S"."T" TO ROLE  "R2" WITH GRANT OPTION; ']
+
+
+@pytest.mark.parametrize('value, expected', [(True, True), (False, False), ('true', True), ('FALSE', False),
+                                             (1, True), (0, False), ('1', True), (1.0, True), (None, False)])
+def test_is_true(value, expected):
+    assert is_true([value]) == [expected]
+    assert is_true(pd.Series([value, value])) == [expected, expected]
+
+
+def test_last_group_with_missing_names_is_split_off():
+    df = grants(('USAGE', 'DATABASE', 'DB1', None, None, 'R', False),
+                ('USAGE', 'DATABASE', 'DB2', None, None, 'R', False),
+                ('MONITOR', 'DATABASE', 'DB2', None, None, 'R', False))
+
+    df_done, df_carry = _split_last_group(df)
+
+    assert df_done['NAME'].tolist() == ['DB1']
+    assert df_carry['PRIVILEGE'].tolist() == ['USAGE', 'MONITOR']
+
+
+
+def compile_grants(config_file, path, **options):
+    sf_transcribe = transcribe_snowflake_account(config_file, conn_type_source = 'password', conn_type_target = 'password',
+                                                 return_sql = False, **options)
+    try:
+        sf_transcribe.compile_plan(str(path))
+    finally:
+        sf_transcribe.close_connections()
+
+    return read_plan(str(path))[1]['role_object_grants']['']
+
+
+def test_chunk_size_does_not_change_the_grants(fake_accounts, tmp_path):
+    source, target, config_file = fake_accounts()
+
+    plans = [compile_grants(config_file, tmp_path / f"plan_{chunk_size}.jsonl", chunk_size = chunk_size)
+             for chunk_size in [100000, 7, 50, 64]]
+
+    assert all(sorted(plan) == sorted(plans[0]) for plan in plans[1:])
+    assert len(plans[0]) < len(source.grants()['objects'])
+
+
+def test_warm_cache_compiles_the_same_grants(fake_accounts, tmp_path):
+    source, target, config_file = fake_accounts()
+    cache_path = str(tmp_path / "metadata.sqlite")
+
+    cold = compile_grants(config_file, tmp_path / "cold.jsonl", cache_path = cache_path)
+    warm = compile_grants(config_file, tmp_path / "warm.jsonl", cache_path = cache_path)
+
+    assert warm == cold
+    assert any(sql.strip().endswith('WITH GRANT OPTION;') for sql in warm)
@@ -0,0 +1,68 @@
+import fake_snowflake
+from data_copy import created_tables, copy_table_data
+
+
+
+def test_created_tables_only_lists_tables_that_hold_data():
+    sql_list = ['create or replace database DB',
+                'create or replace schema DB.S',
+                'create or replace TABLE DB.S.T (ID NUMBER)',
+                'create or replace transient table "DB"."S"."Lower" (ID NUMBER)',
+                'create or replace view DB.S.V as select 1',
+                'create or replace external table DB.S.E (ID NUMBER)',
+                'create or replace temporary table DB.S.TMP (ID NUMBER)']
+
+    assert created_tables(sql_list) == [('DB', 'S', 'T'), ('DB', 'S', 'Lower')]
+
+
+
+def test_copy_table_data_loads_every_row_in_batches(fake_accounts):
+    source, target, _ = fake_accounts(1, source_options = dict(rows_per_table = 25))
+    table = source.tables()[0]
+    target.loaded_rows[table] = 7
+    requests = target.requests
+    lines = []
+
+    result = copy_table_data(table, fake_snowflake.fake_connection(source), fake_snowflake.fake_connection(target),
+                             batch_size = 10, log = lines.append)
+
+    # the old rows are truncated first
+    assert target.loaded_rows[table] == 25
+    assert (result['rows'], result['source_rows'], result['target_rows'], result['error']) == (25, 25, 25, None)
+    # truncate, 3 staged chunks of batch_size rows and their copy into, count
+    assert target.requests - requests == 1 + 3 + 1 + 1
+    assert lines[0].startswith(f"copied 25 rows of {'.'.join(table)}")
+
+
+
+def test_copy_account_copies_every_table_once_its_database_is_replayed(make_transcribe):
+    sf_transcribe, source, target = make_transcribe(source_options = dict(rows_per_table = 5), copy_data = True,
+                                                    copy_workers = 3, max_workers = 2)
+
+    sf_transcribe.database_objects()
+
+    assert target.loaded_rows == {table: 5 for table in source.tables()}
+    copies = sf_transcribe.metrics.report()['table_copies']
+    assert len(copies) == len(source.tables())
+    assert all(copy['error'] is None for copy in copies)
+
+
+
+def test_failed_table_copy_is_recorded(make_transcribe, monkeypatch):
+    sf_transcribe, source, target = make_transcribe(source_options = dict(rows_per_table = 5), copy_data = True)
+    failing = source.tables()[3]
+
+    load = target.load
+
+    def failing_load(table, rows, chunks):
+        if table == failing:
+            raise fake_snowflake.ProgrammingError("Warehouse 'TEST_WH' cannot be resumed", 606, '57P03')
+        load(table, rows, chunks)
+
+    monkeypatch.setattr(target, 'load', failing_load)
+
+    sf_transcribe.database_objects()
+
+    errors = {copy['table']: copy['error'] for copy in sf_transcribe.metrics.report()['table_copies'] if copy['error']}
+    assert list(errors) == ['.'.join(failing)]
+    assert len(target.loaded_rows) == len(source.tables()) - 1
@@ -0,0 +1,40 @@
+from ddl_parser import classify_statement, ddl_policy, qualify_statement, split_name, split_statements
+
+
+
+def test_semicolons_in_literals_comments_and_bodies_dont_split():
+    ddl = """create or replace TABLE T (NOTE VARCHAR DEFAULT 'a;b');
+-- a comment; with a semicolon
+create or replace procedure P() returns varchar language javascript as $$ return 'x;y'; $$;
+create or replace view "V;1" as select 1"""
+
+    assert [classify_statement(sql)[1:] for sql in split_statements(ddl)] == [
+        ('TABLE', 'T'), ('PROCEDURE', 'P'), ('VIEW', '"V;1"')]
+
+
+def test_statements_are_classified():
+    assert classify_statement("create or replace transient TABLE DB.S.T (ID NUMBER)") == ('CREATE', 'TABLE', 'DB.S.T')
+    assert classify_statement("CREATE FILE FORMAT IF NOT EXISTS DB.S.CSV") == ('CREATE', 'FILE FORMAT', 'DB.S.CSV')
+    assert classify_statement("/* x */ grant select on table T to role R")[:2] == ('GRANT', 'SELECT')
+    assert classify_statement("select 1") is None
+
+
+def test_names_are_split_and_qualified():
+    assert split_name('DB."my ""schema""".T') == ['DB', 'my "schema"', 'T']
+    assert qualify_statement("create or replace TABLE T (ID NUMBER)", 'DB', 'my schema') == \
+        'create or replace TABLE "DB"."my schema".T (ID NUMBER)'
+    assert qualify_statement("create or replace TABLE DB.S.T (ID NUMBER)", 'DB', 'S') == \
+        "create or replace TABLE DB.S.T (ID NUMBER)"
+
+
+def test_policy_keeps_the_allowed_create_statements():
+    ddl = """create or replace database DB;
+create or replace schema DB.S;
+create or replace TABLE DB.S.T (ID NUMBER REFERENCES DB.S.U (ID));
+create or replace TABLE DB.S.U (ID NUMBER);
+create or replace view DB.S.V as select 1;
+alter table DB.S.U add column X NUMBER"""
+
+    assert [classify_statement(sql)[2] for sql in ddl_policy().filter(ddl)] == ['DB', 'DB.S', 'DB.S.U']
+    assert [classify_statement(sql)[2] for sql in ddl_policy(include_types = ['TABLE'], exclude_text = []).filter(ddl)] \
+        == ['DB', 'DB.S.T', 'DB.S.U']
@@ -0,0 +1,28 @@
+from transcribe import drop_levels
+
+
+
+def test_users_and_roles_are_dropped_before_what_they_refer_to():
+    sql_list = ['DROP DATABASE IF EXISTS "DB";', 'DROP ROLE IF EXISTS "R";', 'DROP WAREHOUSE "WH";',
+                'DROP USER IF EXISTS "U";', 'DROP SCHEMA IF EXISTS DB.S;']
+
+    assert drop_levels(sql_list) == [['DROP ROLE IF EXISTS "R";', 'DROP USER IF EXISTS "U";'],
+                                     ['DROP DATABASE IF EXISTS "DB";', 'DROP WAREHOUSE "WH";'],
+                                     ['DROP SCHEMA IF EXISTS DB.S;']]
+
+
+
+def test_drop_objects_drops_roles_before_databases(make_transcribe):
+    sf_transcribe, source, target = make_transcribe(max_workers = 3)
+
+    sf_transcribe.database_objects()
+    sf_transcribe.roles()
+    sf_transcribe.warehouses()
+    del target.executed[:]
+
+    sf_transcribe.drop_objects()
+
+    kinds = [sql.split()[1].upper() for sql in target.executed]
+    assert len(kinds) == len(source.roles) + len(source.databases) + len(source.warehouses)
+    assert set(kinds[:len(source.roles)]) == {'ROLE'}
+    assert set(kinds[len(source.roles):]) == {'DATABASE', 'WAREHOUSE'}
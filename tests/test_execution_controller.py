@@ -0,0 +1,116 @@
+import pytest
+
+import fake_snowflake
+from execution_controller import classify_error, execution_controller
+
+
+
+def test_classify_error():
+    assert classify_error(fake_snowflake.ProgrammingError("Too many concurrent requests", 625, '57014')) == 'throttle'
+    assert classify_error(fake_snowflake.ProgrammingError("Connection reset by peer", 251012, '08006')) == 'transient'
+    assert classify_error(TimeoutError("read timed out")) == 'transient'
+    assert classify_error(fake_snowflake.ProgrammingError("SQL compilation error", 2003, '42601')) == 'permanent'
+    assert classify_error(fake_snowflake.ProgrammingError("Object does not exist", 2003, '02000')) == 'permanent'
+
+
+
+def test_object_names_and_positions_dont_make_an_error_retryable():
+    def classify(msg, errno = 1003, sqlstate = '42000'):
+        return classify_error(fake_snowflake.ProgrammingError(msg, errno, sqlstate))
+
+    assert classify("SQL compilation error: syntax error line 1 at position 503 unexpected ')'.") == 'permanent'
+    assert classify("SQL compilation error: Object 'DB.S.LOCKERS' does not exist or not authorized.", 2003,
+                    '02000') == 'permanent'
+    assert classify("Insert value list does not match column list of table 'ORDERS_TIMEOUT'", 2020,
+                    '21S01') == 'permanent'
+    assert classify("SQL compilation error: Table 'DB.S.THROTTLE_LOG' does not exist.", 2003) == 'permanent'
+    assert classify("Numeric value 'connection reset by peer' is not recognized", 100038, '22018') == 'permanent'
+
+
+def test_statement_timeouts_are_permanent():
+    error = fake_snowflake.ProgrammingError("Statement reached its statement or warehouse timeout of 3600 second(s) "
+                                            "and was canceled.", 630, '57014')
+
+    assert classify_error(error) == 'permanent'
+    assert not execution_controller().should_retry(classify_error(error), 0)
+
+
+
+def fails(*errors):
+    """ A function that raises the errors one after the other, then returns 'done' """
+
+    errors = list(errors)
+    calls = []
+
+    def func():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return 'done'
+
+    return func, calls
+
+
+
+def test_transient_errors_are_retried():
+    controller = execution_controller(max_retries = 3, base_delay = 0.0)
+    func, calls = fails(ConnectionError("connection reset"), TimeoutError("timed out"))
+
+    assert controller.call(func) == 'done'
+    assert len(calls) == 3
+    assert controller.report()['retries'] == 2 and controller.in_flight == 0
+
+
+
+def test_permanent_errors_and_exhausted_retries_are_raised():
+    controller = execution_controller(max_retries = 1, base_delay = 0.0)
+
+    func, calls = fails(fake_snowflake.ProgrammingError("SQL compilation error", 2003, '42601'))
+    with pytest.raises(fake_snowflake.ProgrammingError):
+        controller.call(func)
+    assert len(calls) == 1
+
+    func, calls = fails(ConnectionError("connection reset"), ConnectionError("connection reset"))
+    with pytest.raises(ConnectionError):
+        controller.call(func)
+    assert len(calls) == 2
+    assert controller.report()['given_up'] == 1 and controller.in_flight == 0
+
+
+
+def test_throttling_halves_the_limit_and_successes_raise_it():
+    controller = execution_controller(max_in_flight = 16, latency_tolerance = None)
+
+    controller.on_error(fake_snowflake.ProgrammingError("Too many concurrent requests", 625, '57014'))
+    assert controller.limit() == 8
+
+    for _ in range(40):
+        controller.on_success(0.01)
+    assert 8 < controller.limit() <= 16
+
+
+
+def test_replication_retries_transient_errors_of_the_target(make_transcribe):
+    # one request per statement, so enough of them fail
+    sf_transcribe, source, target = make_transcribe(target_options = dict(transient_error_rate = 0.2),
+                                                    max_workers = 4, batch_size = 1, max_retries = 20)
+    sf_transcribe.controller.base_delay = 0.001
+
+    sf_transcribe.database_objects()
+
+    assert len([sql for sql in target.executed if sql.startswith('create or replace TABLE')]) == len(source.tables())
+    assert sf_transcribe.controller.report()['transient_errors'] == target.transient_errors > 0
+
+
+
+def test_replication_adapts_to_the_concurrency_limit_of_the_target(make_transcribe):
+    sf_transcribe, source, target = make_transcribe(target_options = dict(concurrency_limit = 2, latency = 0.01),
+                                                    max_workers = 4, max_in_flight = 8, max_retries = 20)
+    sf_transcribe.controller.base_delay = 0.001
+
+    sf_transcribe.database_objects()
+
+    report = sf_transcribe.controller.report()
+    assert len([sql for sql in target.executed if sql.startswith('create or replace TABLE')]) == len(source.tables())
+    assert report['throttled'] == target.throttled > 0
+    assert report['min_window'] < 8 and report['given_up'] == 0
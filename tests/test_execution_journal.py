@@ -0,0 +1,85 @@
+from execution_journal import execution_journal
+from transcribe import dependent_phases, transcribe_snowflake_account
+
+
+
+def test_completed_statements_are_skipped_after_a_restart(tmp_path):
+    path = str(tmp_path / "run.journal")
+
+    journal = execution_journal(path)
+    journal.record("CREATE ROLE A", 'roles')
+    journal.record("CREATE ROLE B", 'roles', error = Exception("failed"))
+    journal.close()
+
+    journal = execution_journal(path)
+    assert journal.pending(["CREATE ROLE  A;", "CREATE ROLE B"]) == ["CREATE ROLE B"]
+
+
+def test_cut_off_record_is_ignored(tmp_path):
+    path = tmp_path / "run.journal"
+
+    journal = execution_journal(str(path))
+    journal.record("CREATE ROLE A", 'roles')
+    journal.close()
+    path.write_text(path.read_text() + '{"hash": "ab')
+
+    journal = execution_journal(str(path))
+    journal.record("CREATE ROLE B", 'roles')
+    journal.close()
+
+    assert execution_journal(str(path)).pending(["CREATE ROLE A", "CREATE ROLE B"]) == []
+
+
+def test_partial_drop_forgets_the_statements_of_its_phases(tmp_path):
+    path = str(tmp_path / "run.journal")
+
+    journal = execution_journal(path)
+    journal.record("CREATE ROLE A", 'roles')
+    journal.record("CREATE USER U", 'users')
+    journal.record("GRANT ROLE A TO USER U", 'user_role_grants')
+    journal.record_drops('roles', ["DROP ROLE IF EXISTS A"])
+    journal.record_drops('users', ["DROP USER IF EXISTS U"])
+    journal.clear_drops('roles', dependent_phases('roles'))
+
+    sql_list = ["CREATE ROLE A", "CREATE USER U", "GRANT ROLE A TO USER U"]
+    assert journal.pending(sql_list) == ["CREATE ROLE A", "GRANT ROLE A TO USER U"]
+    assert journal.drop_list() == ["DROP USER IF EXISTS U"]
+    journal.close()
+
+    journal = execution_journal(path)
+    assert journal.pending(sql_list) == ["CREATE ROLE A", "GRANT ROLE A TO USER U"]
+    assert journal.drop_list() == ["DROP USER IF EXISTS U"]
+
+
+def test_dependent_phases():
+    assert dependent_phases('roles') == ['roles', 'user_role_grants', 'role_role_grants', 'role_object_grants']
+    assert dependent_phases('warehouses') == ['warehouses', 'role_object_grants']
+
+
+
+def test_roles_are_created_again_after_they_are_dropped(fake_accounts, tmp_path):
+    source, target, config_file = fake_accounts()
+    journal_path = str(tmp_path / "run.journal")
+
+    def replicate_roles():
+        sf_transcribe = transcribe_snowflake_account(config_file, conn_type_source = 'password',
+                                                     conn_type_target = 'password', return_sql = False,
+                                                     journal_path = journal_path)
+        try:
+            sf_transcribe.roles()
+            return sf_transcribe
+        finally:
+            sf_transcribe.close_connections()
+
+    def created_roles():
+        return len([sql for sql in target.executed if sql.upper().startswith('CREATE')])
+
+    replicate_roles().drop_objects('roles')
+    assert created_roles() == len(source.roles)
+
+    # a rerun from the same journal creates the dropped roles again, and skips them after that
+    replicate_roles()
+    assert created_roles() == 2 * len(source.roles)
+
+    replicate_roles()
+    assert created_roles() == 2 * len(source.roles)
@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+import fake_snowflake
+from bench_transcribe import bench_copy_account
+
+
+
+def test_failing_statements_are_the_same_on_every_run():
+    account = fake_snowflake.fake_account('test_errors', 0, latency = 0.0, statement_latency = 0.0, error_rate = 0.3)
+    statements = [f"grant usage on database DB_{i:04d} to role ROLE_{i:05d}" for i in range(200)]
+
+    failing = [sql for sql in statements if account._fails(sql)]
+
+    assert 0 < len(failing) < len(statements)
+    assert failing == [sql for sql in statements if account._fails(sql)]
+
+
+
+def test_requests_above_the_concurrency_limit_are_throttled():
+    account = fake_snowflake.fake_account('test_throttled', 0, latency = 0.05, statement_latency = 0.0,
+                                          concurrency_limit = 2)
+    errors = []
+
+    def request():
+        try:
+            account.execute('create or replace role R')
+        except fake_snowflake.ProgrammingError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target = request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert account.throttled == len(errors) > 0
+    assert all(error.sqlstate == '57014' for error in errors)
+    assert account.in_flight == 0
+
+
+
+def test_cursor_returns_the_rows_of_a_query():
+    account = fake_snowflake.fake_account('test_cursor', 1, latency = 0.0, statement_latency = 0.0)
+    cursor = fake_snowflake.fake_connection(account).cursor()
+
+    cursor.execute('show databases')
+
+    assert set(account.databases) <= {row[1] for row in cursor.fetchall()}
+
+
+
+@pytest.mark.parametrize('batch_size', [1, 50])
+def test_bench_copy_account_reports_the_replication(fake_accounts, batch_size):
+    source, target, config_file = fake_accounts(1, keep_statements = False)
+
+    result = bench_copy_account(config_file, target, max_workers = 2, batch_size = batch_size)
+
+    assert result['errors'] == 0
+    assert result['statements'] == target.statements > 0
+    assert result['target_requests'] == target.requests
+    assert set(result['phases']) >= {'database_objects', 'users', 'roles', 'warehouses'}
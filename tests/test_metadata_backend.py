@@ -0,0 +1,58 @@
+import pytest
+
+from metadata_backend import metadata_backend, show_backend
+
+
+
+ACCOUNT_PHASES = ['users', 'roles', 'user_role_grants', 'role_role_grants', 'role_object_grants']
+
+
+
+def replicated(make_transcribe, backend):
+    sf_transcribe, source, target = make_transcribe(metadata_backend = backend, max_workers = 2)
+    sf_transcribe.copy_account(phases = ACCOUNT_PHASES)
+    return sorted(target.executed), source
+
+
+
+def test_show_backend_replicates_the_same_statements(make_transcribe):
+    account_usage, source = replicated(make_transcribe, 'account_usage')
+    show, _ = replicated(make_transcribe, 'show')
+
+    assert show == account_usage
+    assert sum(sql.startswith('CREATE OR REPLACE USER') for sql in show) == len(source.users) - 1
+    assert any(sql.startswith('GRANT OWNERSHIP') for sql in show)
+
+
+def test_backends_can_be_chosen_per_phase(make_transcribe):
+    account_usage, _ = replicated(make_transcribe, 'account_usage')
+    mixed, _ = replicated(make_transcribe, {'role_object_grants': 'show', 'users': 'show'})
+
+    assert mixed == account_usage
+
+
+
+def test_show_grants_of_role_run_once_for_both_grant_phases(make_transcribe):
+    sf_transcribe, source, _ = make_transcribe(metadata_backend = 'show', max_workers = 2)
+    statements = []
+    query = source.query
+
+    def recording_query(sql):
+        statements.append(sql)
+        return query(sql)
+
+    source.query = recording_query
+    sf_transcribe.copy_account(phases = ['user_role_grants', 'role_role_grants'])
+
+    # every role, the default roles included
+    shows = [sql for sql in statements if sql.lower().startswith('show grants of role')]
+    assert len(shows) == len(set(shows))
+    assert {f'show grants of role "{role}"' for role in source.roles} <= set(shows)
+
+
+
+def test_unknown_backend_is_rejected():
+    assert isinstance(metadata_backend('show'), show_backend)
+
+    with pytest.raises(ValueError):
+        metadata_backend('information_schema')
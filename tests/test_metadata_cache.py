@@ -0,0 +1,100 @@
+import pandas as pd
+import pytest
+
+import fake_snowflake
+from metadata_cache import metadata_cache
+
+
+
+def frame(rows):
+    return pd.DataFrame({'NAME': [f"ROLE_{i}" for i in range(rows)], 'COMMENT': [None] * rows})
+
+
+
+def test_results_are_cached_per_account_and_query(tmp_path):
+    cache = metadata_cache(str(tmp_path / "cache.sqlite"), 'source')
+    cache.put("select name, comment from roles", frame(3))
+
+    assert cache.get("select name,  comment\n from roles")['NAME'].tolist() == ['ROLE_0', 'ROLE_1', 'ROLE_2']
+    assert cache.get("select name from roles") is None
+    assert metadata_cache(str(tmp_path / "cache.sqlite"), 'other').get("select name, comment from roles") is None
+
+
+def test_queries_that_differ_in_case_are_cached_apart(tmp_path):
+    cache = metadata_cache(str(tmp_path / "cache.sqlite"), 'source')
+    cache.put("""select get_ddl('table', '"DB"."S"."MYTABLE"')""", frame(1))
+
+    assert cache.get("""select get_ddl('table', '"DB"."S"."MyTable"')""") is None
+
+
+def test_expired_and_invalidated_results_are_misses(tmp_path):
+    cache = metadata_cache(str(tmp_path / "cache.sqlite"), 'source', ttl = 0)
+    cache.put("select 1", frame(1))
+    assert cache.get("select 1") is None
+
+    cache = metadata_cache(str(tmp_path / "cache.sqlite"), 'source', ttl = None)
+    cache.put("select 1", frame(1))
+    cache.invalidate()
+    assert cache.get("select 1") is None
+
+
+def test_warm_cache_doesnt_query_the_source(make_transcribe, tmp_path):
+    cache_path = str(tmp_path / "cache.sqlite")
+
+    sf_transcribe, source, target = make_transcribe(cache_path = cache_path)
+    sf_transcribe.roles()
+    requests = source.requests
+    sf_transcribe.roles()
+
+    assert source.requests == requests
+    assert len([sql for sql in target.executed if sql.startswith('CREATE')]) == 2 * len(source.roles)
+
+
+
+def test_chunks_are_registered_once_every_chunk_is_written(tmp_path):
+    cache = metadata_cache(str(tmp_path / "cache.sqlite"), 'source')
+    sql = "select name, comment from roles"
+
+    chunks = cache.put_chunks(sql, (frame(4) for _ in range(3)))
+    next(chunks)
+    assert cache.iter_chunks(sql, 5) is None
+
+    assert len(list(chunks)) == 2
+    assert [len(df) for df in cache.iter_chunks(sql, 5)] == [5, 5, 2]
+
+
+def test_grants_are_streamed_in_chunks(make_transcribe, tmp_path):
+    cache_path = str(tmp_path / "cache.sqlite")
+
+    # a cold and a warm run per chunk size
+    statements = []
+    for chunk_size in [100000, 9]:
+        sf_transcribe, source, target = make_transcribe(chunk_size = chunk_size, cache_path = cache_path)
+        sf_transcribe.user_role_grants()
+        sf_transcribe.user_role_grants()
+        statements.append(target.executed)
+
+    assert statements[0] == statements[1]
+    assert len(statements[0]) == 2 * len(source.grants()['users'])
+
+
+def test_error_in_the_middle_of_a_stream_fails_the_phase(make_transcribe, tmp_path, monkeypatch):
+    sf_transcribe, source, target = make_transcribe(chunk_size = 9, cache_path = str(tmp_path / "cache.sqlite"))
+    fetchmany = fake_snowflake.fake_cursor.fetchmany
+
+    def failing_fetchmany(cursor, size = 1):
+        if cursor._position > 0:
+            raise fake_snowflake.ProgrammingError("Connection reset by peer", 251012, '08006')
+        return fetchmany(cursor, size)
+
+    monkeypatch.setattr(fake_snowflake.fake_cursor, 'fetchmany', failing_fetchmany)
+
+    with pytest.raises(fake_snowflake.ProgrammingError):
+        sf_transcribe.user_role_grants()
+
+    report = sf_transcribe.metrics.report()
+    assert report['phases']['user_role_grants']['failed'] == 1
+    assert [fetch['error'] for fetch in report['fetches']] == ['Connection reset by peer']
+    # only the first chunk was applied, and the truncated result isn't cached
+    assert len(target.executed) == 9
+    assert sf_transcribe.cache.iter_chunks(report['fetches'][0]['sql'], 9) is None
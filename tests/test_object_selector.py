@@ -0,0 +1,118 @@
+import pandas as pd
+
+import fake_snowflake
+from ddl_parser import ddl_policy
+from object_selector import object_selector
+from transcribe import _signature
+
+
+
+def test_patterns_select_databases_schemas_and_objects():
+    selector = object_selector(['DB_0000', 'db_0001.schema_0?.TABLE_00*'], exclude = ['DB_0001.SCHEMA_01'])
+
+    assert selector.includes_all('DB_0000')
+    assert selector.includes('DB_0001') and not selector.includes_all('DB_0001')
+    assert selector.includes('DB_0001', 'SCHEMA_00', 'TABLE_001')
+    assert not selector.includes('DB_0001', 'SCHEMA_01', 'TABLE_001')
+    assert not selector.includes('DB_0001', 'SCHEMA_00', 'TABLE_010')
+    assert not selector.includes('DB_0002')
+
+
+def test_like_pushes_single_patterns_down():
+    selector = object_selector(['SALES_*.RAW'])
+
+    assert selector.like() == 'SALES_%'
+    assert selector.like('SALES_EU') == 'RAW'
+    assert object_selector(['A', 'B']).like() is None
+
+
+def test_selected_grants():
+    df = pd.DataFrame([('DATABASE', 'DB_0000', None, None), ('TABLE', 'T', 'S', 'DB_0001'), ('WAREHOUSE', 'WH', None, None)],
+                      columns = ['GRANTED_ON', 'NAME', 'TABLE_SCHEMA', 'TABLE_CATALOG'])
+
+    assert object_selector(['DB_0000']).selected_grants(df)['NAME'].tolist() == ['DB_0000', 'WH']
+
+
+
+def replayed(target):
+    """ The names of the schemas and objects created on the target, without quotes """
+
+    return [(sql.split()[-1] if sql.lower().startswith('create schema') else sql.split()[4]).replace('"', '')
+            for sql in target.executed if sql.lower().startswith('create') and ' database ' not in sql.lower()]
+
+
+def test_only_the_selected_objects_are_read(make_transcribe):
+    sf_transcribe, source, target = make_transcribe(
+        selector = object_selector(['DB_0001.SCHEMA_02.TABLE_00[12]', 'DB_0002.SCHEMA_03']))
+
+    sf_transcribe.database_objects()
+
+    assert sorted(replayed(target)) == ['DB_0001.SCHEMA_02', 'DB_0001.SCHEMA_02.TABLE_001',
+                                        'DB_0001.SCHEMA_02.TABLE_002', 'DB_0002.SCHEMA_03'] + \
+                                       [f"DB_0002.SCHEMA_03.TABLE_{t:03d}" for t in range(10)]
+
+
+def recorded_queries(account, monkeypatch):
+    """ The queries the account answers, in order """
+
+    queries = []
+    query = account.query
+
+    def recording_query(sql):
+        queries.append(" ".join(sql.split()))
+        return query(sql)
+
+    monkeypatch.setattr(account, 'query', recording_query)
+    return queries
+
+
+def test_excluded_objects_of_a_partly_selected_schema_are_never_read(make_transcribe, monkeypatch):
+    sf_transcribe, source, target = make_transcribe(source_options = dict(sequences_per_schema = 3),
+                                                    selector = object_selector(['DB_0001.SCHEMA_02.*_001']))
+    queries = recorded_queries(source, monkeypatch)
+
+    sf_transcribe.database_objects()
+
+    assert sorted(replayed(target)) == ['DB_0001.SCHEMA_02', 'DB_0001.SCHEMA_02.SEQ_001',
+                                        'DB_0001.SCHEMA_02.TABLE_001']
+    # one get_ddl per selected object, the schema isn't read recursively
+    assert sorted(sql for sql in queries if 'get_ddl' in sql) == \
+           ["""select get_ddl('sequence', '"DB_0001"."SCHEMA_02"."SEQ_001"', true)""",
+            """select get_ddl('table', '"DB_0001"."SCHEMA_02"."TABLE_001"', true)"""]
+
+
+def test_only_the_object_types_that_are_replayed_are_listed(make_transcribe, monkeypatch):
+    sf_transcribe, source, target = make_transcribe(selector = object_selector(['DB_0001.SCHEMA_02.TABLE_001']),
+                                                    object_policy = ddl_policy(include_types = ['TABLE', 'SCHEMA']))
+    queries = recorded_queries(source, monkeypatch)
+
+    sf_transcribe.database_objects()
+
+    assert [sql for sql in queries if sql.startswith('show') and ' in schema ' in sql] == \
+           ["show objects like 'TABLE_001' in schema \"DB_0001\".\"SCHEMA_02\""]
+    assert sorted(replayed(target)) == ['DB_0001.SCHEMA_02', 'DB_0001.SCHEMA_02.TABLE_001']
+
+
+def test_signature_of_functions_and_procedures():
+    assert _signature('ADD(NUMBER, NUMBER) RETURN NUMBER') == '(NUMBER, NUMBER)'
+    assert _signature('NOW() RETURN TIMESTAMP_LTZ') == '()'
+    assert _signature('PAD(VARCHAR, [NUMBER]) RETURN VARCHAR') == '(VARCHAR, NUMBER)'
+
+
+
+def test_an_object_that_cant_be_read_is_skipped(make_transcribe, monkeypatch):
+    sf_transcribe, source, target = make_transcribe(selector = object_selector(['DB_0001.SCHEMA_02.TABLE_00?']))
+
+    object_ddl = source.object_ddl
+
+    def failing_ddl(database, schema, name, qualified = True):
+        if name == 'TABLE_003':
+            raise fake_snowflake.ProgrammingError(f"Table '{name}' does not exist or not authorized.")
+        return object_ddl(database, schema, name, qualified)
+
+    monkeypatch.setattr(source, 'object_ddl', failing_ddl)
+
+    sf_transcribe.database_objects()
+
+    tables = [name for name in replayed(target) if 'TABLE_' in name]
+    assert sorted(tables) == [f"DB_0001.SCHEMA_02.TABLE_{t:03d}" for t in range(10) if t != 3]
@@ -0,0 +1,53 @@
+import threading
+import time
+
+from phase_scheduler import phase_scheduler
+
+
+
+def test_phases_start_once_their_prerequisites_finish():
+    finished = []
+    both_running = threading.Barrier(2, timeout = 5)
+
+    def phase(name, wait = False):
+        def run():
+            if wait:
+                both_running.wait()
+            finished.append(name)
+        return run
+
+    scheduler = phase_scheduler(max_workers = 4)
+    scheduler.add('users', phase('users', wait = True))
+    scheduler.add('roles', phase('roles', wait = True))
+    scheduler.add('user_role_grants', phase('user_role_grants'), depends_on = ['users', 'roles'])
+    scheduler.run()
+
+    # users and roles ran at the same time, the grants waited for both
+    assert sorted(finished[:2]) == ['roles', 'users'] and finished[2] == 'user_role_grants'
+    assert scheduler.critical_path()[-1] == 'user_role_grants'
+
+
+def test_phases_after_a_failed_phase_are_skipped():
+    ran = []
+
+    def fail():
+        raise RuntimeError("source unreachable")
+
+    scheduler = phase_scheduler()
+    scheduler.add('roles', fail)
+    scheduler.add('warehouses', lambda: ran.append('warehouses'))
+    scheduler.add('role_role_grants', lambda: ran.append('role_role_grants'), depends_on = ['roles'])
+    timings = scheduler.run()
+
+    assert ran == ['warehouses'] and list(timings) == ['warehouses']
+    assert isinstance(scheduler.errors['roles'], RuntimeError)
+
+
+def test_critical_path_follows_the_prerequisite_that_finished_last():
+    scheduler = phase_scheduler()
+    scheduler.add('fast', lambda: None)
+    scheduler.add('slow', lambda: time.sleep(0.05))
+    scheduler.add('grants', lambda: None, depends_on = ['fast', 'slow'])
+    scheduler.run()
+
+    assert scheduler.critical_path() == ['slow', 'grants']
@@ -0,0 +1,52 @@
+from plan_replay import plan_replayer
+from replication_plan import read_plan
+from transcribe import PHASE_DEPENDENCIES, transcribe_snowflake_account
+
+
+
+def compile_plan(config_file, path):
+    sf_transcribe = transcribe_snowflake_account(config_file, conn_type_source = 'password',
+                                                 conn_type_target = 'password', return_sql = False)
+    try:
+        sf_transcribe.compile_plan(path)
+    finally:
+        sf_transcribe.close_connections()
+
+    return read_plan(path)
+
+
+def statements(phases, *names):
+    return [sql.strip().rstrip(';').strip() for name in names for group in phases.get(name, {}).values()
+            for sql in group]
+
+
+
+def test_plan_holds_every_phase_and_nothing_is_executed(fake_accounts, tmp_path):
+    source, target, config_file = fake_accounts()
+
+    header, phases = compile_plan(config_file, str(tmp_path / "plan.jsonl"))
+
+    assert header['source_account'] == source.name and header['depends_on'] == PHASE_DEPENDENCIES
+    assert set(phases) == set(PHASE_DEPENDENCIES) | {'drop'}
+    assert sorted(phases['database_objects']) == source.databases
+    assert target.executed == []
+
+
+def test_replay_and_drop_execute_the_plan(fake_accounts, tmp_path):
+    source, target, config_file = fake_accounts()
+    path = str(tmp_path / "plan.jsonl")
+    _, phases = compile_plan(config_file, path)
+
+    plan_replayer(config_file, conn_type_target = 'password', max_workers = 4).replay(path)
+
+    assert sorted(target.executed) == sorted(statements(phases, *PHASE_DEPENDENCIES))
+
+    # grants run after the roles they refer to
+    first_grant = min(target.executed.index(sql) for sql in statements(phases, 'role_role_grants'))
+    last_role = max(target.executed.index(sql) for sql in statements(phases, 'roles'))
+    assert last_role < first_grant
+
+    del target.executed[:]
+    plan_replayer(config_file, conn_type_target = 'password').drop(path)
+
+    assert sorted(target.executed) == sorted(statements(phases, 'drop'))
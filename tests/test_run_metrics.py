@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from run_metrics import run_metrics, statement_class
+
+
+
+def test_statement_classes():
+    assert statement_class("create or replace transient TABLE DB.S.T (ID NUMBER)") == 'CREATE TABLE'
+    assert statement_class('GRANT SELECT ON TABLE DB.S.T TO ROLE R') == 'GRANT'
+    assert statement_class('ALTER USER "U" SET email = \'x\'') == 'ALTER USER'
+    assert statement_class('select 1') == 'OTHER'
+
+
+def test_statements_are_aggregated_and_the_slowest_kept():
+    metrics = run_metrics(top_n = 2)
+
+    for i in range(5):
+        metrics.record_statement(f'GRANT ROLE "R{i}" TO ROLE "P"', seconds = i, phase = 'role_role_grants')
+    metrics.record_statement('CREATE OR REPLACE ROLE R', 0.5, error = Exception("exists"), phase = 'roles')
+
+    report = metrics.report()
+    assert report['statements']['GRANT'] == {'count': 5, 'errors': 0, 'seconds': 10, 'max_seconds': 4}
+    assert report['phases']['roles']['errors'] == 1
+    assert [s['sql'] for s in report['slowest_statements']] == ['GRANT ROLE "R4" TO ROLE "P"',
+                                                                 'GRANT ROLE "R3" TO ROLE "P"']
+
+
+def test_failed_phase_is_counted_and_raised():
+    metrics = run_metrics()
+
+    with pytest.raises(RuntimeError):
+        with metrics.phase('users'):
+            raise RuntimeError("source unreachable")
+
+    assert metrics.phases['users']['failed'] == 1
+
+
+
+def test_run_writes_a_report_and_prometheus_metrics(make_transcribe, tmp_path):
+    report_path, metrics_path = str(tmp_path / "report.json"), str(tmp_path / "metrics.prom")
+    sf_transcribe, source, target = make_transcribe(report_path = report_path, metrics_path = metrics_path)
+
+    sf_transcribe.copy_account()
+
+    with open(report_path) as f:
+        report = json.load(f)
+    assert report['phases']['roles']['statements'] == len(source.roles)
+    assert report['statements']['CREATE DATABASE']['count'] == len(source.databases)
+
+    with open(metrics_path) as f:
+        prometheus = f.read()
+    assert f'snow_transcribe_phase_statements{{phase="roles"}} {len(source.roles)}' in prometheus
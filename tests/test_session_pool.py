@@ -0,0 +1,58 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from session_pool import session_pool
+
+
+
+def pool(fake_accounts, **options):
+    source, target, config_file = fake_accounts()
+    return session_pool(config_file, 'snowflake_target_account', 'password', **options), target
+
+
+
+def test_connections_are_reused(fake_accounts):
+    target_pool, target = pool(fake_accounts, size = 2)
+
+    with target_pool.connection() as first:
+        pass
+    with target_pool.connection() as second:
+        pass
+
+    assert first is second and second.account is target
+    target_pool.close()
+    assert first.is_closed()
+
+
+def test_acquire_waits_when_every_connection_is_in_use(fake_accounts):
+    target_pool, _ = pool(fake_accounts, size = 2)
+    running, most_running = [0], [0]
+    lock = threading.Lock()
+
+    def work(_):
+        with target_pool.connection():
+            with lock:
+                running[0] += 1
+                most_running[0] = max(most_running[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+    with ThreadPoolExecutor(max_workers = 6) as executor:
+        list(executor.map(work, range(12)))
+
+    assert most_running[0] == 2 and target_pool._open == 2
+
+
+def test_idle_connections_are_checked_before_they_are_reused(fake_accounts):
+    target_pool, _ = pool(fake_accounts, size = 1, health_check_interval = 0)
+
+    with target_pool.connection() as first:
+        pass
+    first.close()
+    with target_pool.connection() as second:
+        pass
+
+    assert second is not first and not second.is_closed()
@@ -0,0 +1,97 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+from replication_plan import read_plan
+
+sys.path.insert(0, ROOT)
+import snow_transcribe
+
+PASSWORD = ['--conn-type-source', 'password', '--conn-type-target', 'password', '--quiet']
+
+# runs snow_transcribe in a fresh interpreter against fake accounts with the same names and shape,
+# prints the modules it imported and the statements the target executed
+SUBPROCESS = """
+import json, sys
+sys.path[:0] = [{benchmarks!r}, {root!r}]
+import fake_snowflake
+accounts = json.loads(sys.argv[1])
+registry = fake_snowflake.install(*[fake_snowflake.fake_account(name, scale, latency = 0.0, statement_latency = 0.0,
+                                                                keep_statements = True)
+                                    for name, scale in accounts])
+import snow_transcribe
+try:
+    snow_transcribe.main(sys.argv[2:])
+except SystemExit:
+    pass
+executed = registry[accounts[-1][0]].executed if accounts else []
+print(json.dumps({{'modules': sorted(sys.modules), 'executed': executed}}))
+"""
+
+
+
+def run_subprocess(accounts, *argv):
+    script = SUBPROCESS.format(benchmarks = os.path.join(ROOT, 'benchmarks'), root = ROOT)
+    result = subprocess.run([sys.executable, '-c', script, json.dumps(accounts)] + list(argv),
+                            capture_output = True, text = True, check = True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+
+def test_help_only_imports_the_standard_library():
+    result = run_subprocess([], 'replicate', '--help')
+
+    assert not {'pandas', 'transcribe', 'cryptography'} & set(result['modules'])
+
+
+
+def test_replicate_then_drop_from_the_journal_without_pandas(fake_accounts, tmp_path):
+    source, target, config_file = fake_accounts()
+    journal = str(tmp_path / "run.journal")
+
+    snow_transcribe.main(['replicate', config_file, '--journal', journal, '--max-workers', '2'] + PASSWORD)
+
+    assert len([sql for sql in target.executed if sql.startswith('create or replace TABLE')]) == len(source.tables())
+
+    result = run_subprocess([[source.name, 1], [target.name, 0]],
+                            'drop', config_file, '--journal', journal, *PASSWORD)
+
+    assert 'pandas' not in result['modules']
+    assert sorted(sql.split()[4] for sql in result['executed'] if sql.startswith('DROP DATABASE')) == \
+           [f'"{database}"' for database in source.databases]
+
+
+
+@pytest.mark.parametrize('phases', [None, ['users', 'roles']])
+def test_replicate_runs_the_chosen_phases(fake_accounts, phases):
+    source, target, config_file = fake_accounts()
+
+    snow_transcribe.main(['replicate', config_file] + (['--phases'] + phases if phases else []) + PASSWORD)
+
+    created = {sql.split()[3].upper() for sql in target.executed if sql.upper().startswith('CREATE OR REPLACE')}
+    assert {'USER', 'ROLE'} <= created
+    assert ('DATABASE' in created) == (phases is None)
+
+
+
+def test_plan_compile_replay_and_drop(fake_accounts, tmp_path):
+    source, target, config_file = fake_accounts()
+    plan = str(tmp_path / "plan.jsonl")
+
+    snow_transcribe.main(['plan', 'compile', config_file, plan, '--include', 'DB_0001'] + PASSWORD[:2] + ['--quiet'])
+
+    header, phases = read_plan(plan)
+    assert header['source_account'] == source.name
+    assert sorted(phases['database_objects']) == ['DB_0001']
+    assert target.executed == []
+
+    snow_transcribe.main(['plan', 'replay', config_file, plan, '--conn-type-target', 'password', '--quiet'])
+    replayed = len(target.executed)
+    assert replayed > 0
+
+    snow_transcribe.main(['plan', 'drop', config_file, plan, '--conn-type-target', 'password', '--quiet'])
+    assert [sql for sql in target.executed[replayed:] if 'DATABASE' in sql] == ['DROP DATABASE IF EXISTS "DB_0001"']
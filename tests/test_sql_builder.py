@@ -0,0 +1,54 @@
+import pandas as pd
+
+from sql_builder import quote_identifier, quote_literal
+from transcribe import role_object_grant_sql, role_role_grant_sql, user_role_grant_sql
+
+
+
+def test_quotes_and_escapes_are_doubled():
+    assert quote_identifier('My "Role"') == '"My ""Role"""'
+    assert quote_literal("O'Brien \\ Co") == "'O''Brien \\\\ Co'"
+
+
+
+def test_grants_quote_every_name():
+    grants = pd.DataFrame({'PRIVILEGE': ['USAGE', 'SELECT', 'USAGE'], 'GRANTED_ON': ['DATABASE', 'VIEW', 'SCHEMA'],
+                           'NAME': ['Sales', 'my view', 'S'], 'TABLE_SCHEMA': [None, 'S', 'S'],
+                           'TABLE_CATALOG': [None, 'Sales', 'Sales'], 'GRANTEE_NAME': ['analyst', 'R"1', 'R'],
+                           'GRANT_OPTION': [False, False, False]})
+
+    assert role_object_grant_sql(grants) == ['GRANT USAGE ON DATABASE "Sales" TO ROLE  "analyst"; ',
+                                             'GRANT SELECT ON VIEW "Sales"."S"."my view" TO ROLE  "R""1"; ',
+                                             'GRANT USAGE ON SCHEMA "Sales"."S" TO ROLE  "R"; ']
+    assert user_role_grant_sql(pd.DataFrame({'ROLE': ['R"1'], 'GRANTEE_NAME': ["o'brien"]})) == \
+           ['GRANT ROLE "R""1" TO USER "o\'brien";']
+    assert role_role_grant_sql(pd.DataFrame({'NAME': ['analyst'], 'GRANTEE_NAME': ['SYSADMIN']})) == \
+           ['GRANT ROLE "analyst" TO ROLE "SYSADMIN";']
+
+
+
+def test_users_roles_and_warehouses_are_quoted(make_transcribe, monkeypatch):
+    sf_transcribe, source, target = make_transcribe()
+    account_usage = source._account_usage
+
+    def odd_names(lowered):
+        columns, rows = account_usage(lowered)
+        if 'account_usage.users' in lowered:
+            rows = [('OBRIEN', "o'brien", "Pat O'Brien", 'analyst', "o'brien@example.com")]
+        elif 'account_usage.roles' in lowered:
+            rows = [('analyst', None)]
+        return columns, rows
+
+    monkeypatch.setattr(source, '_account_usage', odd_names)
+    monkeypatch.setattr(source, 'warehouses', ['Load WH'])
+
+    sf_transcribe.users()
+    sf_transcribe.roles()
+    sf_transcribe.warehouses()
+
+    assert [" ".join(sql.split()) for sql in target.executed] == \
+           ["""CREATE OR REPLACE USER "OBRIEN" password='abc123' login_name='o''brien' display_name='Pat O''Brien' """
+            """default_role="analyst" email='o''brien@example.com'""",
+            'CREATE OR REPLACE ROLE "analyst"',
+            """CREATE OR REPLACE warehouse "Load WH" warehouse_size='X-Small' initially_suspended=true"""]
+    assert sf_transcribe.drop_roles_sql_list == ['DROP ROLE IF EXISTS "analyst";']
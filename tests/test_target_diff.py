@@ -0,0 +1,101 @@
+from target_diff import diff_statements, drop_missing_objects, normalize_values
+
+
+
+SOURCE = ["create or replace database DB",
+          "create or replace schema DB.S1",
+          "create or replace TABLE DB.S1.T1 (ID NUMBER)",
+          "create or replace schema DB.S2",
+          "create or replace TABLE DB.S2.T1 (ID NUMBER)",
+          "create or replace TABLE DB.S2.T2 (ID NUMBER)"]
+
+
+
+def test_unchanged_statements_are_skipped():
+    target = [" ".join(sql.upper().split()) for sql in SOURCE]
+
+    assert diff_statements(SOURCE, target) == []
+
+
+def test_changed_table_is_replayed_alone():
+    target = SOURCE[:5] + ["create or replace TABLE DB.S2.T2 (ID VARCHAR)"]
+
+    assert diff_statements(SOURCE, target) == [SOURCE[5]]
+
+
+def test_changed_schema_is_replayed_with_its_objects():
+    target = [SOURCE[0], "create or replace transient schema DB.S1"] + SOURCE[2:]
+
+    assert diff_statements(SOURCE, target) == SOURCE[1:3]
+
+
+def test_changed_database_is_replayed_with_everything_in_it():
+    target = ["create or replace database DB comment = 'x'"] + SOURCE[1:]
+
+    assert diff_statements(SOURCE, target) == SOURCE
+
+
+def test_created_if_not_exists_schema_keeps_its_objects():
+    source = ["create schema if not exists DB.S1", "create or replace TABLE DB.S1.T1 (ID NUMBER)"]
+
+    assert diff_statements(source, source[1:]) == source[:1]
+
+
+def test_missing_objects_are_dropped_tables_first():
+    target = SOURCE + ["create or replace schema DB.S3", "create or replace TABLE DB.S3.T1 (ID NUMBER)"]
+
+    assert drop_missing_objects(SOURCE, target) == ["DROP TABLE IF EXISTS DB.S3.T1;", "DROP SCHEMA IF EXISTS DB.S3;"]
+
+
+def test_missing_values_compare_equal():
+    assert normalize_values([None, float('nan'), "", " A "]) == ("", "", "", "a")
+
+
+
+def test_diff_mode_replays_a_changed_schema_with_its_tables(make_transcribe, monkeypatch):
+    sf_transcribe, source, target = make_transcribe(target_scale = 1, diff_mode = True)
+
+    schema_ddl = target.schema_ddl
+    monkeypatch.setattr(target, 'schema_ddl', lambda database, schema: schema_ddl(database, schema).replace(
+        "create or replace schema DB_0001.SCHEMA_02", "create or replace transient schema DB_0001.SCHEMA_02"))
+
+    sf_transcribe.database_objects()
+
+    names = [sql.split()[4] for sql in target.executed]
+    assert names[0] == 'DB_0001.SCHEMA_02'
+    assert sorted(names[1:]) == [f"DB_0001.SCHEMA_02.TABLE_{t:03d}" for t in range(10)]
+
+
+def test_diff_mode_leaves_unchanged_users_alone(make_transcribe):
+    sf_transcribe, source, target = make_transcribe(target_scale = 1, diff_mode = True)
+
+    sf_transcribe.users()
+
+    assert target.executed == []
+
+
+def test_diff_mode_alters_only_users_with_properties_that_differ(make_transcribe, monkeypatch):
+    sf_transcribe, source, target = make_transcribe(target_scale = 1, diff_mode = True)
+
+    account_usage, target_query = source._account_usage, target.query
+
+    def source_users(lowered):
+        columns, rows = account_usage(lowered)
+        if 'account_usage.users' in lowered:
+            # USER_000001 has no properties, USER_000002 has no email
+            rows = [(rows[0][0], None, None, None, None), rows[1][:4] + (None,)] + rows[2:]
+        return columns, rows
+
+    def target_users(sql):
+        result = target_query(sql)
+        if sql.lower().startswith('show users'):
+            columns, rows = result
+            result = columns, [row[:6] + ('' if row[0] == 'USER_000002' else row[6],) + row[7:] for row in rows]
+        return result
+
+    monkeypatch.setattr(source, '_account_usage', source_users)
+    monkeypatch.setattr(target, 'query', target_users)
+
+    sf_transcribe.users()
+
+    assert not [sql for sql in target.executed if sql.upper().startswith('ALTER USER')]
@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+import fake_snowflake
+from terraform_transcribe import terraform_transcribe
+
+
+
+def role_grants(config_file, grants_source, pool_size = 4):
+    tf_transcribe = terraform_transcribe(config_file, grants_source = grants_source, pool_size = pool_size)
+    try:
+        return {name: attrs for _, name, attrs in tf_transcribe.role_grant_resources()}
+    finally:
+        tf_transcribe.close_conn()
+
+
+
+def test_role_grants_are_read_in_one_query(fake_accounts):
+    source, _, config_file = fake_accounts(1)
+
+    tf_transcribe = terraform_transcribe(config_file)
+    tf_transcribe.conn
+    requests = source.requests
+
+    grants = list(tf_transcribe.role_grant_resources())
+    tf_transcribe.close_conn()
+
+    assert source.requests - requests == 1
+    assert len(grants) == len(source.roles)
+
+
+
+def test_account_usage_and_show_give_the_same_role_grants(fake_accounts):
+    _, _, config_file = fake_accounts(1)
+
+    account_usage = role_grants(config_file, 'account_usage')
+
+    assert account_usage == role_grants(config_file, 'show')
+    assert account_usage == role_grants(config_file, 'show', pool_size = 1)
+    assert any(attrs['roles'] for attrs in account_usage.values())
+
+
+
+def test_role_grants_fall_back_to_show_without_account_usage(fake_accounts, monkeypatch):
+    source, _, config_file = fake_accounts(1)
+    expected = role_grants(config_file, 'account_usage')
+
+    query = source.query
+
+    def no_account_usage(sql):
+        if 'account_usage' in sql.lower():
+            raise fake_snowflake.ProgrammingError("Object does not exist or not authorized.", 2003)
+        return query(sql)
+
+    monkeypatch.setattr(source, 'query', no_account_usage)
+    requests = source.requests
+
+    assert role_grants(config_file, 'account_usage') == expected
+    # one show grants of role per role
+    assert source.requests - requests > len(source.roles)
+
+
+
+def generate(config_file, directory, pool_size = 4, **options):
+    tf_transcribe = terraform_transcribe(config_file, pool_size = pool_size)
+    try:
+        paths = tf_transcribe.generate_files(str(directory), **options)
+        return tf_transcribe, paths
+    finally:
+        tf_transcribe.close_conn()
+
+
+def contents(directory):
+    return {name: (directory / name).read_text() for name in sorted(os.listdir(directory))}
+
+
+
+@pytest.mark.parametrize('max_workers, pool_size', [(None, 4), (2, 4), (None, 2)])
+def test_concurrent_extractors_write_the_same_files(fake_accounts, tmp_path, max_workers, pool_size):
+    _, _, config_file = fake_accounts(1)
+    (tmp_path / "serial").mkdir()
+    (tmp_path / "concurrent").mkdir()
+
+    generate(config_file, tmp_path / "serial", max_workers = 1)
+    tf_transcribe, paths = generate(config_file, tmp_path / "concurrent", pool_size = pool_size,
+                                    max_workers = max_workers)
+
+    assert contents(tmp_path / "concurrent") == contents(tmp_path / "serial")
+    assert len(paths) == 3
+    assert set(tf_transcribe.extract_seconds) == set(terraform_transcribe.RESOURCE_EXTRACTORS)
+    # every pooled connection was given back
+    assert tf_transcribe.pool._idle == [] and tf_transcribe.pool._open == 0
+
+
+
+def test_incremental_rerun_rewrites_nothing(fake_accounts, tmp_path, capsys):
+    _, _, config_file = fake_accounts(1)
+
+    generate(config_file, tmp_path, incremental = True, shard_by = 'hash', shard_count = 4)
+    before = contents(tmp_path)
+    capsys.readouterr()
+
+    _, paths = generate(config_file, tmp_path, incremental = True, shard_by = 'hash', shard_count = 4)
+
+    assert contents(tmp_path) == before
+    assert f"rewrote 0 of {len(paths)} files" in capsys.readouterr().out
@@ -0,0 +1,117 @@
+import json
+import os
+
+import pytest
+
+from tf_writer import resource_writer
+
+
+
+def roles(count, comment = ""):
+    return [('snowflake_role', f"role_{i}", {'name': f"ROLE_{i}", 'comment': comment}) for i in range(count)]
+
+
+def users(count):
+    return [('snowflake_user', f"user_{i}", {'name': f"USER_{i}"}) for i in range(count)]
+
+
+def write(directory, resources, fail = False, **options):
+    with resource_writer(str(directory), **options) as writer:
+        writer.write_all(resources)
+        if fail:
+            raise RuntimeError("extractor failed")
+    return writer
+
+
+def files(directory):
+    return {name: (directory / name).read_text() for name in sorted(os.listdir(directory))}
+
+
+
+def test_incremental_run_only_rewrites_changed_files(tmp_path):
+    manifest = str(tmp_path / "manifest.json")
+
+    write(tmp_path, roles(3) + users(3), manifest_path = manifest)
+    writer = write(tmp_path, roles(3, comment = "changed") + users(3), manifest_path = manifest)
+
+    assert writer.rewritten == [str(tmp_path / "tf_roles.tf")]
+    assert writer.changes == {'added': 0, 'changed': 3, 'removed': 0}
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_failed_run_keeps_the_existing_files(tmp_path, incremental):
+    options = dict(manifest_path = str(tmp_path / "manifest.json")) if incremental else {}
+
+    write(tmp_path, roles(3) + users(3), **options)
+    before = files(tmp_path)
+
+    with pytest.raises(RuntimeError):
+        write(tmp_path, roles(3, comment = "changed") + users(2), fail = True, buffer_size = 2, **options)
+
+    assert files(tmp_path) == before
+
+
+def test_failed_run_records_the_finished_files(tmp_path):
+    manifest = str(tmp_path / "manifest.json")
+
+    write(tmp_path, roles(3) + users(3), manifest_path = manifest)
+
+    with pytest.raises(RuntimeError):
+        with resource_writer(str(tmp_path), manifest_path = manifest) as writer:
+            writer.write_all(roles(3, comment = "changed"))
+            writer.finish('snowflake_role')
+            writer.write_all(users(2))
+            raise RuntimeError("extractor failed")
+
+    assert "changed" in (tmp_path / "tf_roles.tf").read_text()
+    assert (tmp_path / "tf_users.tf").read_text().count("resource") == 3
+
+    # the manifest matches the files on disk, a rerun with the old roles rewrites them
+    with open(manifest) as f:
+        assert set(json.load(f)['files']) == {'tf_roles.tf', 'tf_users.tf'}
+
+    writer = write(tmp_path, roles(3) + users(3), manifest_path = manifest)
+    assert writer.rewritten == [str(tmp_path / "tf_roles.tf")]
+
+
+
+def test_prefix_shards_split_by_the_first_characters(tmp_path):
+    resources = [('snowflake_user', name, {'name': name}) for name in ['alice', 'Adam', 'bob', '9lives', '-x']]
+
+    writer = write(tmp_path, resources, shard_by = 'prefix', buffer_size = 2)
+
+    assert sorted(os.listdir(tmp_path)) == ['tf_users_9.tf', 'tf_users__.tf', 'tf_users_a.tf', 'tf_users_b.tf']
+    assert (tmp_path / "tf_users_a.tf").read_text().count("resource") == 2
+    assert writer.counts == {'snowflake_user': 5}
+
+
+def test_hash_shards_keep_every_resource_once(tmp_path):
+    writer = write(tmp_path, users(200), shard_by = 'hash', shard_count = 12, buffer_size = 7)
+
+    shards = files(tmp_path)
+    assert set(shards) <= {f"tf_users_{i:02d}.tf" for i in range(12)}
+    assert len(shards) > 1
+    assert sum(text.count('resource "snowflake_user"') for text in shards.values()) == 200
+
+    # a resource lands in the same shard on every run
+    shard = resource_writer(str(tmp_path), shard_by = 'hash', shard_count = 12).shard_key("user_7")
+    assert shard == writer.shard_key("user_7")
+    assert '"user_7"' in shards[f"tf_users_{shard}.tf"]
+
+
+def test_json_output_is_valid_terraform_json(tmp_path):
+    write(tmp_path, roles(3) + users(2), output_format = 'json', buffer_size = 2)
+
+    with open(tmp_path / "tf_roles.tf.json") as f:
+        document = json.load(f)
+
+    assert document == {'resource': {'snowflake_role': {f"role_{i}": {'name': f"ROLE_{i}", 'comment': ""}
+                                                        for i in range(3)}}}
+    assert set(os.listdir(tmp_path)) == {'tf_roles.tf.json', 'tf_users.tf.json'}
+
+
+def test_unknown_options_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        resource_writer(str(tmp_path), shard_by = 'size')
+    with pytest.raises(ValueError):
+        resource_writer(str(tmp_path), output_format = 'yaml')
@@ -0,0 +1,38 @@
+import fake_snowflake
+
+
+
+def created(target, kind):
+    """ Names of the objects of one kind created on the target, in order """
+
+    prefix = f"create or replace {kind} ".lower()
+    return [sql.split()[4].split('(')[0] for sql in target.executed if sql.lower().startswith(prefix)]
+
+
+
+def test_database_objects_replays_every_database(make_transcribe):
+    sf_transcribe, source, target = make_transcribe(max_workers = 4)
+
+    sf_transcribe.database_objects()
+
+    assert sorted(created(target, 'database')) == source.databases
+    assert len(created(target, 'table')) == len(source.tables())
+    assert len(sf_transcribe.db_drop_sql_list) == len(source.databases)
+
+
+
+def test_failing_database_only_affects_itself(make_transcribe, monkeypatch):
+    sf_transcribe, source, target = make_transcribe(max_workers = 2)
+
+    database_ddl = source.database_ddl
+
+    def failing_ddl(database):
+        if database == 'DB_0001':
+            raise fake_snowflake.ProgrammingError("Database 'DB_0001' does not exist or not authorized.")
+        return database_ddl(database)
+
+    monkeypatch.setattr(source, 'database_ddl', failing_ddl)
+
+    sf_transcribe.database_objects()
+
+    assert sorted(created(target, 'database')) == ['DB_0000', 'DB_0002', 'DB_0003']